@@ -0,0 +1,262 @@
+"""
+Local stand-in for the TikTok endpoints the recorder polls, for offline
+benchmarks:
+
+    GET /live                          country check (200 = not blacklisted)
+    GET /foryou                        page with the logged-in secUid
+    GET /@<user>/live                  live page HTML with the room id
+    GET /api/user/list/                follow list pages (count, maxCursor)
+    GET /webcast/room/check_alive/     {"data": [{"room_id", "alive"}]}
+    GET /webcast/room/info/            room info with an FLV pull URL
+    GET /tiktok/room/api/sign          tikrec signer ({"signed_path"})
+    GET /api-live/user/room/           signed room lookup
+
+The users are bench_0 ... bench_<N-1>; bench_<i> owns room 7000000000000000000 + i
+and a fixed, evenly spread ``live_fraction`` of them are live. Every
+response is delayed by ``latency`` (+/- ``jitter``); ``error_rate`` of
+them fail with HTTP 500 and ``block_rate`` with HTTP 429.
+
+It is a minimal HTTP/1.1 server on asyncio so that it has no dependencies
+and keeps connections alive like TikTok does. Run it on its own with
+
+    python benchmarks/fake_tiktok.py --users 1000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import orjson
+
+ROOM_BASE = 7000000000000000000
+
+
+@dataclass
+class FakeTikTokOptions:
+    users: int = 1000
+    live_fraction: float = 0.01
+    latency: float = 0.05
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    block_rate: float = 0.0
+    stream_url: str = "http://127.0.0.1:1/stream.flv"
+
+
+def user_name(index: int) -> str:
+    return f"bench_{index}"
+
+
+def user_index(name: str) -> Optional[int]:
+    prefix, _, number = name.partition("_")
+    if prefix != "bench" or not number.isdigit():
+        return None
+    return int(number)
+
+
+class FakeTikTok:
+    def __init__(self, options: FakeTikTokOptions):
+        self.options = options
+        self.requests = 0
+        self.by_path: Dict[str, int] = {}
+        # Every k-th user is live, so any prefix of the list has the same share
+        self._live_every = (
+            max(1, round(1 / options.live_fraction)) if options.live_fraction else 0
+        )
+
+    def _is_live(self, index: int) -> bool:
+        return bool(self._live_every) and index % self._live_every == 0
+
+    def _room_owner(self, room_id: str) -> Optional[int]:
+        if not room_id.isdigit():
+            return None
+        index = int(room_id) - ROOM_BASE
+        return index if 0 <= index < self.options.users else None
+
+    def handle(self, target: str) -> Tuple[int, str, bytes]:
+        parts = urlsplit(target)
+        path = parts.path
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+        if path == "/live":
+            return 200, "text/html", b"<html>live</html>"
+
+        if path == "/foryou":
+            return (
+                200,
+                "text/html",
+                b'<script>{"secUid":"bench-sec-uid","x":1}</script>',
+            )
+
+        if path.startswith("/@") and path.endswith("/live"):
+            index = user_index(path[2:-5])
+            if index is None or index >= self.options.users:
+                return 200, "text/html", b"<html>no live</html>"
+            body = (
+                "<html><head><title>live</title></head><body>"
+                + "<div>padding</div>" * 200
+                + f'<script>{{"roomId":"{ROOM_BASE + index}"}}</script>'
+                + "</body></html>"
+            )
+            return 200, "text/html", body.encode()
+
+        if path == "/api/user/list/":
+            count = int(query.get("count", 30))
+            cursor = int(query.get("maxCursor", 0))
+            end = min(self.options.users, cursor + count)
+            page = {
+                "userList": [
+                    {"user": {"uniqueId": user_name(i)}} for i in range(cursor, end)
+                ],
+                "hasMore": end < self.options.users,
+                "minCursor": end,
+                "maxCursor": end,
+            }
+            return 200, "application/json", orjson.dumps(page)
+
+        if path == "/webcast/room/check_alive/":
+            data = []
+            for room_id in query.get("room_ids", "").split(","):
+                index = self._room_owner(room_id)
+                if index is not None:
+                    data.append(
+                        {"room_id": int(room_id), "alive": self._is_live(index)}
+                    )
+            return 200, "application/json", orjson.dumps({"data": data})
+
+        if path == "/webcast/room/info/":
+            index = self._room_owner(query.get("room_id", ""))
+            if index is None:
+                return 200, "application/json", b'{"data":{},"status_code":4003110}'
+            info = {
+                "data": {
+                    "owner": {"display_id": user_name(index)},
+                    "status": 2 if self._is_live(index) else 4,
+                    "stream_url": {
+                        "flv_pull_url": {"FULL_HD1": self.options.stream_url}
+                    },
+                },
+                "status_code": 0,
+            }
+            return 200, "application/json", orjson.dumps(info)
+
+        if path == "/tiktok/room/api/sign":
+            unique_id = query.get("unique_id", "")
+            signed = {"signed_path": f"/api-live/user/room/?uniqueId={unique_id}"}
+            return 200, "application/json", orjson.dumps(signed)
+
+        if path == "/api-live/user/room/":
+            index = user_index(query.get("uniqueId", ""))
+            if index is None or index >= self.options.users:
+                return 200, "application/json", b'{"data":null}'
+            room = {"data": {"user": {"roomId": str(ROOM_BASE + index)}}}
+            return 200, "application/json", orjson.dumps(room)
+
+        return 404, "text/plain", b"not found"
+
+    async def _respond(self, target: str) -> Tuple[int, str, bytes]:
+        options = self.options
+        delay = options.latency
+        if options.jitter:
+            delay = max(0.0, delay + random.uniform(-options.jitter, options.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+
+        roll = random.random()
+        if roll < options.block_rate:
+            return 429, "text/plain", b"Please wait"
+        if roll < options.block_rate + options.error_rate:
+            return 500, "text/plain", b"error"
+        return self.handle(target)
+
+    async def serve_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = True
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.lower() == "connection" and "close" in value.lower():
+                        keep_alive = False
+
+                parts = request_line.decode("latin-1").split()
+                target = parts[1] if len(parts) >= 2 else "/"
+                self.requests += 1
+                key = urlsplit(target).path
+                if key.startswith("/@"):
+                    key = "/@<user>/live"
+                self.by_path[key] = self.by_path.get(key, 0) + 1
+
+                status, content_type, body = await self._respond(target)
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start_fake_tiktok(
+    options: FakeTikTokOptions, hosts=("127.0.0.1",), port: int = 0
+) -> Tuple[FakeTikTok, List[asyncio.AbstractServer], int]:
+    """Start the server on every host, all on the same port."""
+    fake = FakeTikTok(options)
+    servers = []
+    for host in hosts:
+        server = await asyncio.start_server(
+            fake.serve_connection, host, port, backlog=1024
+        )
+        port = server.sockets[0].getsockname()[1]
+        servers.append(server)
+    return fake, servers, port
+
+
+def add_options(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--block-rate", type=float, default=0.0)
+    parser.add_argument("--live-fraction", type=float, default=0.01)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake TikTok server")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_options(parser)
+    args = parser.parse_args()
+
+    options = FakeTikTokOptions(
+        users=args.users,
+        live_fraction=args.live_fraction,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        block_rate=args.block_rate,
+    )
+
+    async def serve():
+        _, servers, port = await start_fake_tiktok(options, [args.host], args.port)
+        print(f"Fake TikTok listening on http://{args.host}:{port}")
+        await servers[0].serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
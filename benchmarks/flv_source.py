@@ -0,0 +1,130 @@
+"""
+Serves an FLV file as an endless live stream, paced by its timestamps,
+like a TikTok CDN pull URL:
+
+    python benchmarks/flv_source.py sample.flv --port 8090
+    ffplay http://127.0.0.1:8090/live.flv
+
+Each connection gets the FLV header, metadata and sequence headers, then
+the media tags in real time (or ``--speed`` times faster). The file is
+looped with continuous timestamps, so it can run for any length of time.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.media.flv import FlvParser, FlvTag, TAG_HEADER_SIZE  # noqa: E402
+
+# How often each connection is topped up with the tags that became due
+SEND_INTERVAL = 0.05
+
+
+class FlvSource:
+    def __init__(self, path: str, speed: float = 1.0):
+        self.speed = speed
+        parser = FlvParser()
+        with open(path, "rb") as file:
+            tags = parser.feed(file.read())
+
+        prefix = [parser.header, b"\0\0\0\0"]
+        # (timestamp, tag, bytes after the tag header) of every media tag
+        self.media: List[Tuple[int, FlvTag, bytes]] = []
+        for tag in tags:
+            if tag.is_script or tag.is_sequence_header:
+                prefix.append(bytes(tag.raw))
+            else:
+                self.media.append(
+                    (tag.timestamp, tag, bytes(tag.raw[TAG_HEADER_SIZE:]))
+                )
+        if not self.media:
+            raise ValueError(f"{path} has no audio or video tags")
+
+        self.prefix = b"".join(prefix)
+        first = self.media[0][0]
+        # One average frame gap after the last tag before the loop restarts
+        span = self.media[-1][0] - first
+        self.loop_length = span + max(1, span // len(self.media))
+        self.connections = 0
+
+    async def stream(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        writer.write(self.prefix)
+        started = loop.time()
+        first = self.media[0][0]
+        index = 0
+        offset = 0
+        while not writer.is_closing():
+            now_ms = (loop.time() - started) * 1000 * self.speed
+            while True:
+                timestamp, tag, rest = self.media[index]
+                position = timestamp - first + offset
+                if position > now_ms:
+                    break
+                writer.write(tag.with_timestamp(position))
+                writer.write(rest)
+                index += 1
+                if index == len(self.media):
+                    index = 0
+                    offset += self.loop_length
+            await writer.drain()
+            await asyncio.sleep(SEND_INTERVAL)
+            if reader.at_eof():
+                return
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.connections += 1
+        try:
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: video/x-flv\r\n"
+                b"Connection: close\r\n\r\n"
+            )
+            await self.stream(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+
+async def start_flv_source(
+    path: str, host: str = "127.0.0.1", port: int = 0, speed: float = 1.0
+) -> Tuple[FlvSource, asyncio.AbstractServer, int]:
+    source = FlvSource(path, speed)
+    server = await asyncio.start_server(source.handle, host, port, backlog=1024)
+    return source, server, server.sockets[0].getsockname()[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve an FLV file as a live stream")
+    parser.add_argument("sample")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+
+    async def serve():
+        _, server, port = await start_flv_source(
+            args.sample, args.host, args.port, args.speed
+        )
+        print(f"Streaming {args.sample} at http://{args.host}:{port}/live.flv")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
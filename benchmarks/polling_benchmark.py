@@ -0,0 +1,287 @@
+"""
+Polling throughput of TikTokRecorder against a local fake TikTok server.
+
+Every scenario (mode x number of users) runs the real automatic or
+followers mode for a fixed time in a fresh process, so peak RSS is per
+scenario, while the fake server (benchmarks/fake_tiktok.py) runs in a
+process of its own:
+
+    python benchmarks/polling_benchmark.py
+    python benchmarks/polling_benchmark.py --users 10000 --modes followers \\
+        --latency 0.1 --error-rate 0.01 --duration 120 --json results.json
+
+Live users are "recorded" by fetching their room info and idling until the
+end, so no media is downloaded.
+
+The fake hosts are 127.0.0.1 (www.tiktok.com), 127.0.0.2 (webcast) and
+127.0.0.3 (tikrec). That gives each host its configured connection limit.
+Rate limits are off unless --rate-limits is given. Without it the numbers
+show what the event loop and the pool can do, not TikTok's allowance. Use
+--single-host where 127.0.0.2/3 are not routable (macOS).
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import orjson
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+sys.path.insert(0, BENCH_DIR)
+
+from fake_tiktok import FakeTikTokOptions, add_options, start_fake_tiktok  # noqa: E402
+
+# Fake address of each TikTok host
+HOSTS = {
+    "www.tiktok.com": "127.0.0.1",
+    "webcast.tiktok.com": "127.0.0.2",
+    "tikrec.com": "127.0.0.3",
+}
+LAG_PROBE_INTERVAL = 0.05
+
+
+def _server_process(options: FakeTikTokOptions, hosts: List[str], conn) -> None:
+    async def serve():
+        fake, servers, port = await start_fake_tiktok(options, hosts)
+        conn.send(port)
+        # Block in a thread until the client is done
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        for server in servers:
+            server.close()
+        conn.send({"requests": fake.requests, "by_path": fake.by_path})
+
+    asyncio.run(serve())
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def _drive(mode_name: str, users: int, urls: Dict[str, str], args) -> dict:
+    from config import config
+    from core.live_history import configure_live_history
+    from core.room_cache import configure_room_cache
+    from core.tiktok_recorder import TikTokRecorder
+    from http_utils.async_http_client import (
+        close_shared_clients,
+        configure_pool,
+        shared_pool_stats,
+    )
+    from utils.enums import Mode
+    from utils.metrics import POLL_CYCLE
+    from utils.signals import stop_event
+
+    # With --single-host every role shares one address and the largest limit
+    host_limits: Dict[str, int] = {}
+    rate_limits: Dict[str, float] = {}
+    for role, url in urls.items():
+        host = url.split("//")[1].split(":")[0]
+        host_limits[host] = max(
+            host_limits.get(host, 0), config.http_host_limits.get(role, 8)
+        )
+        if args.rate_limits and role in config.http_rate_limits:
+            rate_limits[host] = max(
+                rate_limits.get(host, 0), config.http_rate_limits[role]
+            )
+
+    config.adaptive_polling = False
+    configure_pool(
+        max_connections=config.http_max_connections,
+        host_limits=host_limits,
+        rate_limits=rate_limits,
+    )
+    configure_room_cache(
+        max_entries=max(config.room_cache_size, users),
+        ttl=config.room_cache_ttl,
+        negative_ttl=config.room_cache_negative_ttl or 1.5 * args.interval,
+    )
+    configure_live_history()
+
+    mode = Mode.AUTOMATIC if mode_name == "automatic" else Mode.FOLLOWERS
+    recorder = TikTokRecorder(
+        url=None,
+        user=[f"bench_{i}" for i in range(users)] if mode == Mode.AUTOMATIC else None,
+        room_id=None,
+        mode=mode,
+        automatic_interval=args.interval / 60,
+        cookies=None,
+        proxy=None,
+        output=tempfile.gettempdir(),
+        duration=None,
+    )
+    api = recorder.tiktok
+    api.BASE_URL = urls["www.tiktok.com"]
+    api.WEBCAST_URL = urls["webcast.tiktok.com"]
+    api.TIKREC_API = urls["tikrec.com"]
+
+    async def fake_recording(user, room_id):
+        await api.get_live_url(room_id)
+        while not stop_event.is_set():
+            await asyncio.sleep(0.25)
+
+    recorder.start_recording = fake_recording
+
+    loop = asyncio.get_running_loop()
+    lags: List[float] = []
+
+    async def probe_lag():
+        while True:
+            expected = loop.time() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            lags.append(loop.time() - expected)
+
+    probe = asyncio.create_task(probe_lag())
+    loop.call_later(args.duration, stop_event.set)
+    started = time.perf_counter()
+    cpu_before = _cpu_time()
+    try:
+        await recorder.run()
+    finally:
+        probe.cancel()
+    elapsed = time.perf_counter() - started
+    cpu = _cpu_time() - cpu_before
+
+    pool = shared_pool_stats()
+    await close_shared_clients()
+
+    cycles = POLL_CYCLE.count(mode=mode_name)
+    lags.sort()
+    return {
+        "mode": mode_name,
+        "users": users,
+        "seconds": elapsed,
+        "client_requests": sum(stats["requests"] for stats in pool.values()),
+        "client_errors": sum(stats["errors"] for stats in pool.values()),
+        "cycles": cycles,
+        "cycle_mean_s": POLL_CYCLE.total(mode=mode_name) / cycles if cycles else None,
+        "lag_p50_ms": statistics.median(lags) * 1000 if lags else None,
+        "lag_p99_ms": lags[int(len(lags) * 0.99)] * 1000 if lags else None,
+        "lag_max_ms": lags[-1] * 1000 if lags else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "cpu_percent": cpu / elapsed * 100,
+    }
+
+
+def _client_process(mode: str, users: int, urls: Dict[str, str], args, conn) -> None:
+    sys.path.insert(0, SRC_DIR)
+    logging.getLogger("tiktok_recorder").setLevel(
+        logging.INFO if args.verbose else logging.CRITICAL
+    )
+    conn.send(asyncio.run(_drive(mode, users, urls, args)))
+
+
+def run_scenario(mode: str, users: int, args) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    hosts = ["127.0.0.1"] if args.single_host else sorted(set(HOSTS.values()))
+    options = FakeTikTokOptions(
+        users=users,
+        live_fraction=args.live_fraction,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        block_rate=args.block_rate,
+    )
+
+    server_conn, server_end = ctx.Pipe()
+    server = ctx.Process(target=_server_process, args=(options, hosts, server_end))
+    server.start()
+    try:
+        port = server_conn.recv()
+        urls = {
+            role: f"http://{'127.0.0.1' if args.single_host else host}:{port}"
+            for role, host in HOSTS.items()
+        }
+
+        client_conn, client_end = ctx.Pipe()
+        client = ctx.Process(
+            target=_client_process, args=(mode, users, urls, args, client_end)
+        )
+        client.start()
+        result = client_conn.recv()
+        client.join()
+
+        server_conn.send("stop")
+        served = server_conn.recv()
+    finally:
+        server.join(timeout=5)
+        if server.is_alive():
+            server.terminate()
+
+    result["server_requests"] = served["requests"]
+    result["requests_per_s"] = served["requests"] / result["seconds"]
+    result["by_path"] = served["by_path"]
+    return result
+
+
+def _fmt(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def print_table(results: List[dict]) -> None:
+    header = (
+        f"{'mode':<10} {'users':>6} {'req/s':>8} {'errors':>7} {'cycles':>6} "
+        f"{'cycle s':>8} {'lag p50':>8} {'lag p99':>8} {'lag max':>8} "
+        f"{'RSS MB':>7} {'CPU %':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['mode']:<10} {r['users']:>6} {r['requests_per_s']:>8.1f} "
+            f"{r['client_errors']:>7} {r['cycles']:>6} "
+            f"{_fmt(r['cycle_mean_s'], '>8.2f')} {_fmt(r['lag_p50_ms'], '>8.1f')} "
+            f"{_fmt(r['lag_p99_ms'], '>8.1f')} {_fmt(r['lag_max_ms'], '>8.1f')} "
+            f"{r['peak_rss_mb']:>7.1f} {r['cpu_percent']:>6.1f}"
+        )
+    print("\nlag in ms; cycle s is the mean poll cycle duration")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--users", default="100,1000,10000", help="comma separated")
+    parser.add_argument("--modes", default="automatic,followers")
+    parser.add_argument("--duration", type=float, default=60, help="seconds each")
+    parser.add_argument(
+        "--interval", type=float, default=20, help="check interval in seconds"
+    )
+    parser.add_argument("--rate-limits", action="store_true")
+    parser.add_argument("--single-host", action="store_true")
+    parser.add_argument("--json", metavar="PATH", help="also write results here")
+    parser.add_argument("--verbose", action="store_true", help="show recorder logs")
+    add_options(parser)
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes.split(","):
+        for users in (int(n) for n in args.users.split(",")):
+            print(f"running {mode} with {users} users for {args.duration:g}s...")
+            results.append(run_scenario(mode, users, args))
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, "wb") as file:
+            file.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
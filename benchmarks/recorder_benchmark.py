@@ -0,0 +1,266 @@
+"""
+Resource usage of the recorder backends with N concurrent live streams.
+
+A synthetic FLV is served as an endless real-time stream by
+benchmarks/flv_source.py in its own process. Each scenario (backend x
+number of streams) then records that many streams at once in a fresh
+process for a fixed time:
+
+    python benchmarks/recorder_benchmark.py
+    python benchmarks/recorder_benchmark.py --streams 1,20,50 --bitrate 4000k \\
+        --backends ffmpeg,native --duration 60 --json results.json
+
+Reported per scenario:
+
+    cpu %/stream   CPU of the process and its ffmpeg children, per stream
+    RSS MB         peak resident memory of the process plus its children
+    write MB/s     bytes written to disk per second of recording
+    start ms       from start_recording() to the first bytes on disk
+    stop s         from stop_recording() until the file is finalized
+
+RSS is sampled from /proc on Linux; elsewhere only the peak of the
+recording process itself is available.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+import orjson
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+sys.path.insert(0, BENCH_DIR)
+
+from flv_source import start_flv_source  # noqa: E402
+from remux_benchmark import generate_sample  # noqa: E402
+
+SAMPLE_INTERVAL = 0.05
+RSS_INTERVAL = 1.0
+
+
+def _source_process(sample: str, conn) -> None:
+    async def serve():
+        _, server, port = await start_flv_source(sample)
+        conn.send(port)
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        server.close()
+
+    asyncio.run(serve())
+
+
+def _rss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _tree_rss_mb() -> Optional[float]:
+    """Resident memory of this process and its direct children (Linux)."""
+    if not os.path.isdir("/proc"):
+        return None
+    me = os.getpid()
+    total = _rss_bytes(me)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                # The command name may contain spaces; fields follow the ')'
+                ppid = int(file.read().rsplit(")", 1)[1].split()[1])
+            if ppid == me:
+                total += _rss_bytes(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    return total / 1e6
+
+
+def _cpu_time() -> float:
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+async def _drive(backend_name: str, streams: int, url: str, args) -> dict:
+    from core.recorders import create_recorder
+    from http_utils.async_http_client import close_shared_clients
+    from utils.enums import RecorderBackend
+
+    workdir = tempfile.mkdtemp(prefix="recorder-bench-")
+    backend = RecorderBackend(backend_name)
+    recorders = [create_recorder(backend) for _ in range(streams)]
+    first_data: List[Optional[float]] = [None] * streams
+    rss_peak = 0.0
+
+    loop = asyncio.get_running_loop()
+    cpu_before = _cpu_time()
+    started = loop.time()
+    tasks = [
+        asyncio.create_task(
+            recorder.start_recording(url, os.path.join(workdir, f"stream_{i}.flv"))
+        )
+        for i, recorder in enumerate(recorders)
+    ]
+
+    async def watch():
+        nonlocal rss_peak
+        next_rss = 0.0
+        while True:
+            now = loop.time()
+            for i, recorder in enumerate(recorders):
+                if first_data[i] is None and recorder.bytes_written:
+                    first_data[i] = now - started
+            if now >= next_rss:
+                rss_peak = max(rss_peak, _tree_rss_mb() or 0.0)
+                next_rss = now + RSS_INTERVAL
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    watcher = asyncio.create_task(watch())
+    done, _ = await asyncio.wait(tasks, timeout=args.duration)
+    recording_time = loop.time() - started
+    written = sum(recorder.bytes_written for recorder in recorders)
+
+    stop_started = loop.time()
+    stop_times: List[float] = []
+
+    async def stop(recorder, task):
+        await recorder.stop_recording()
+        await asyncio.gather(task, return_exceptions=True)
+        stop_times.append(loop.time() - stop_started)
+
+    await asyncio.gather(*(stop(r, t) for r, t in zip(recorders, tasks)))
+    watcher.cancel()
+    cpu = _cpu_time() - cpu_before
+    await close_shared_clients()
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    peak_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = sorted(value for value in first_data if value is not None)
+    return {
+        "backend": backend_name,
+        "streams": streams,
+        # Recordings that ended on their own before they were stopped
+        "failed": len(done),
+        "cpu_percent_per_stream": cpu / recording_time / streams * 100,
+        "rss_peak_mb": rss_peak
+        or peak_self / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        "write_mb_s": written / recording_time / 1e6,
+        "start_p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "start_max_ms": latencies[-1] * 1000 if latencies else None,
+        "stop_mean_s": statistics.mean(stop_times),
+        "stop_max_s": max(stop_times),
+    }
+
+
+def _client_process(backend: str, streams: int, url: str, args, conn) -> None:
+    sys.path.insert(0, SRC_DIR)
+    logging.getLogger("tiktok_recorder").setLevel(
+        logging.INFO if args.verbose else logging.CRITICAL
+    )
+    conn.send(asyncio.run(_drive(backend, streams, url, args)))
+
+
+def run_scenario(backend: str, streams: int, url: str, args) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    conn, child_end = ctx.Pipe()
+    client = ctx.Process(
+        target=_client_process, args=(backend, streams, url, args, child_end)
+    )
+    client.start()
+    result = conn.recv()
+    client.join()
+    return result
+
+
+def _fmt(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def print_table(results: List[dict]) -> None:
+    header = (
+        f"{'backend':<11} {'streams':>7} {'failed':>6} {'cpu %/stream':>12} "
+        f"{'RSS MB':>8} {'MB/stream':>9} {'write MB/s':>10} {'start p50':>9} "
+        f"{'start max':>9} {'stop mean':>9} {'stop max':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['backend']:<11} {r['streams']:>7} {r['failed']:>6} "
+            f"{r['cpu_percent_per_stream']:>12.2f} {r['rss_peak_mb']:>8.1f} "
+            f"{r['rss_peak_mb'] / r['streams']:>9.1f} {r['write_mb_s']:>10.2f} "
+            f"{_fmt(r['start_p50_ms'], '>9.0f')} {_fmt(r['start_max_ms'], '>9.0f')} "
+            f"{r['stop_mean_s']:>9.2f} {r['stop_max_s']:>8.2f}"
+        )
+    print("\nstart in ms, stop in s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--sample", help="FLV file to stream (H.264/AAC)")
+    parser.add_argument(
+        "--bitrate", default="2500k", help="video bitrate of the generated sample"
+    )
+    parser.add_argument("--streams", default="1,10,50", help="comma separated")
+    parser.add_argument("--backends", default="ffmpeg,native,native_mp4")
+    parser.add_argument("--duration", type=float, default=30, help="seconds each")
+    parser.add_argument("--json", metavar="PATH", help="also write results here")
+    parser.add_argument("--verbose", action="store_true", help="show recorder logs")
+    args = parser.parse_args()
+
+    backends = args.backends.split(",")
+    if "ffmpeg" in backends and shutil.which("ffmpeg") is None:
+        print("ffmpeg not found, skipping the ffmpeg backend")
+        backends.remove("ffmpeg")
+
+    workdir = tempfile.mkdtemp(prefix="recorder-bench-sample-")
+    ctx = multiprocessing.get_context("spawn")
+    source_conn, source_end = ctx.Pipe()
+    source = None
+    try:
+        sample = args.sample
+        if sample is None:
+            sample = os.path.join(workdir, "sample.flv")
+            generate_sample(sample, 20, args.bitrate)
+
+        source = ctx.Process(target=_source_process, args=(sample, source_end))
+        source.start()
+        url = f"http://127.0.0.1:{source_conn.recv()}/live.flv"
+
+        results: List[Dict] = []
+        for backend in backends:
+            for streams in (int(n) for n in args.streams.split(",")):
+                print(
+                    f"recording {streams} streams with {backend} for {args.duration:g}s..."
+                )
+                results.append(run_scenario(backend, streams, url, args))
+    finally:
+        if source is not None:
+            source_conn.send("stop")
+            source.join(timeout=5)
+            if source.is_alive():
+                source.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, "wb") as file:
+            file.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
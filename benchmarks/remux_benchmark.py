@@ -0,0 +1,174 @@
+"""
+Throughput of the in-process FLV -> fragmented MP4 remuxer against ffmpeg.
+
+Both sides remux the same FLV file from disk to disk, which is the work a
+recorder does per stream minus the network:
+
+    python benchmarks/remux_benchmark.py sample.flv
+    python benchmarks/remux_benchmark.py --generate 60   # synthetic 60 s sample
+
+ffmpeg runs the command used by FFmpegRecorder (-c copy -bsf:a aac_adtstoasc).
+Its time includes process start-up, which every recording pays as well.
+"""
+
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.media.flv import FlvParser  # noqa: E402
+from core.media.fmp4 import FragmentedMp4Muxer  # noqa: E402
+
+# Similar to the body chunks curl hands to the native recorder
+CHUNK_SIZE = 64 * 1024
+
+
+def generate_sample(path: str, seconds: int, bitrate: str = "2500k") -> None:
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            "testsrc2=size=1280x720:rate=30",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=frequency=440:sample_rate=44100",
+            "-t",
+            str(seconds),
+            "-c:v",
+            "libx264",
+            "-preset",
+            "ultrafast",
+            "-pix_fmt",
+            "yuv420p",
+            "-b:v",
+            bitrate,
+            "-g",
+            "60",
+            "-c:a",
+            "aac",
+            "-ac",
+            "2",
+            "-f",
+            "flv",
+            path,
+        ],
+        check=True,
+    )
+
+
+def remux_native(source: str, target: str) -> float:
+    started = time.perf_counter()
+    parser = FlvParser()
+    muxer = None
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        while chunk := src.read(CHUNK_SIZE):
+            for tag in parser.feed(chunk):
+                if muxer is None:
+                    flags = parser.header[4]
+                    muxer = FragmentedMp4Muxer(bool(flags & 0x01), bool(flags & 0x04))
+                dst.writelines(muxer.feed(tag))
+        if muxer is not None:
+            dst.writelines(muxer.flush())
+    return time.perf_counter() - started
+
+
+def remux_ffmpeg(source: str, target: str) -> float:
+    started = time.perf_counter()
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            source,
+            "-c",
+            "copy",
+            "-f",
+            "mp4",
+            "-bsf:a",
+            "aac_adtstoasc",
+            target,
+        ],
+        check=True,
+    )
+    return time.perf_counter() - started
+
+
+def ffmpeg_cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def own_cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("sample", nargs="?", help="FLV file (H.264/AAC)")
+    parser.add_argument(
+        "--generate",
+        type=int,
+        metavar="SECONDS",
+        help="generate a synthetic sample of this length with ffmpeg",
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="remux-bench-")
+    try:
+        sample = args.sample
+        if sample is None:
+            sample = os.path.join(workdir, "sample.flv")
+            generate_sample(sample, args.generate or 60)
+        size_mb = os.path.getsize(sample) / 1e6
+
+        has_ffmpeg = shutil.which("ffmpeg") is not None
+        results = {"native": [], "ffmpeg": []}
+        cpu = {"native": 0.0, "ffmpeg": 0.0}
+        for _ in range(args.runs):
+            before = own_cpu_time()
+            results["native"].append(
+                remux_native(sample, os.path.join(workdir, "native.mp4"))
+            )
+            cpu["native"] += own_cpu_time() - before
+
+            if has_ffmpeg:
+                before = ffmpeg_cpu_time()
+                results["ffmpeg"].append(
+                    remux_ffmpeg(sample, os.path.join(workdir, "ffmpeg.mp4"))
+                )
+                cpu["ffmpeg"] += ffmpeg_cpu_time() - before
+
+        print(f"sample: {sample} ({size_mb:.1f} MB), {args.runs} runs")
+        print(f"{'remuxer':<8} {'best s':>8} {'MB/s':>8} {'cpu s/run':>10}")
+        for name, times in results.items():
+            if not times:
+                print(f"{name:<8} {'skipped (ffmpeg not found)':>28}")
+                continue
+            best = min(times)
+            print(
+                f"{name:<8} {best:>8.3f} {size_mb / best:>8.1f} "
+                f"{cpu[name] / len(times):>10.3f}"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
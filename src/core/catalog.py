@@ -0,0 +1,413 @@
+"""
+SQLite catalog of recordings.
+
+Every recording is a row with its user, room, start and end time,
+duration, size, quality, parts, segments and checksum. Rows follow the
+lifecycle events on the event bus:
+
+    recording_started   insert a row with status "recording"
+    recording_finished  status "finished" (or "failed" without a file)
+    recording_error     status "error"
+    post_processed      new path, size and checksum of the processed file
+    recording_deleted   status "deleted" once retention removed the files
+
+An interrupted recording that is resumed after a restart keeps its row.
+Lookups by user and time range use indexes, so tools never have to list
+the output directory. rebuild() brings the catalog back in line with the
+files on disk.
+
+The database runs in WAL mode so the -catalog command line can read it
+while recorders (and worker processes) write to it.
+"""
+
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.events import Event, Events, event_bus
+from core.recorders.segments import SegmentManifest
+from core.storage import MANIFEST_SUFFIX, RetentionIndex, recording_base
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    room_id TEXT,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    duration REAL,
+    size INTEGER,
+    quality TEXT,
+    parts INTEGER,
+    segments INTEGER,
+    checksum TEXT,
+    path TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS recordings_user ON recordings (user, started_at);
+CREATE INDEX IF NOT EXISTS recordings_started ON recordings (started_at);
+CREATE INDEX IF NOT EXISTS recordings_status ON recordings (status);
+"""
+
+COLUMNS = (
+    "id", "user", "room_id", "status", "started_at", "finished_at", "duration",
+    "size", "quality", "parts", "segments", "checksum", "path",
+)  # fmt: skip
+
+# TK_<user>_<YYYY.MM.DD_HH-MM-SS>, see TikTokRecorder.start_recording
+FILENAME_DATE = re.compile(r"_(\d{4}\.\d{2}\.\d{2}_\d{2}-\d{2}-\d{2})")
+
+
+def read_checksum(path: str) -> Optional[str]:
+    """The SHA-256 written by the hash post-processing step, if any."""
+    try:
+        with open(f"{path}.sha256", encoding="utf-8") as file:
+            return file.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def started_from_name(path: str) -> Optional[float]:
+    match = FILENAME_DATE.search(os.path.basename(path))
+    if match is None:
+        return None
+    return time.mktime(time.strptime(match.group(1), "%Y.%m.%d_%H-%M-%S"))
+
+
+def segment_count(path: str) -> int:
+    if not path.endswith(MANIFEST_SUFFIX):
+        return 0
+    try:
+        return len(SegmentManifest.load(path).segments)
+    except (OSError, ValueError, TypeError):
+        return 0
+
+
+def parse_date(value: str) -> float:
+    """YYYY-MM-DD or YYYY-MM-DD HH:MM in local time."""
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"'{value}' is not a YYYY-MM-DD [HH:MM] date")
+
+
+def format_row(row: Dict[str, Any]) -> str:
+    """One line of `-catalog list` output."""
+    started = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["started_at"]))
+    duration = row["duration"] or 0
+    size = (row["size"] or 0) / (1024 * 1024)
+    return (
+        f"{started}  {row['user']:<24} {int(duration // 3600):>3}:"
+        f"{int(duration % 3600 // 60):02d}  {size:>9.1f} MB  "
+        f"{row['quality'] or '-':<7} {row['status']:<11} {row['path'] or ''}"
+    )
+
+
+class RecordingCatalog:
+    """
+    The recordings table in a local SQLite file.
+
+    Methods block; the event handler runs them in a thread. One connection
+    is shared behind a lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._subscription = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None, check_same_thread=False
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            db.row_factory = sqlite3.Row
+            self._db = db
+        return self._db
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connect().execute(sql, params)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def _active_row(
+        self, db: sqlite3.Connection, user: str, room_id: Optional[str]
+    ) -> Optional[sqlite3.Row]:
+        return db.execute(
+            "SELECT id, room_id, started_at FROM recordings "
+            "WHERE user = ? AND status = 'recording' "
+            "ORDER BY room_id IS ? DESC, started_at DESC LIMIT 1",
+            (user, room_id),
+        ).fetchone()
+
+    def started(
+        self,
+        user: str,
+        room_id: Optional[str],
+        started_at: float,
+        quality: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._active_row(db, user, room_id)
+                if row is not None and row["room_id"] == room_id:
+                    # Resumed after a restart: the session keeps its row
+                    keep = row["id"]
+                else:
+                    keep = db.execute(
+                        "INSERT INTO recordings "
+                        "(user, room_id, status, started_at, quality) "
+                        "VALUES (?, ?, 'recording', ?, ?)",
+                        (user, room_id, started_at, quality),
+                    ).lastrowid
+                # Rows of lives that were never finished
+                db.execute(
+                    "UPDATE recordings SET status = 'interrupted' "
+                    "WHERE user = ? AND status = 'recording' AND id != ?",
+                    (user, keep),
+                )
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def finished(
+        self,
+        user: str,
+        room_id: Optional[str],
+        finished_at: float,
+        path: Optional[str] = None,
+        size: Optional[int] = None,
+        parts: Optional[int] = None,
+        status: Optional[str] = None,
+    ) -> None:
+        status = status or ("finished" if path else "failed")
+        path = os.path.abspath(path) if path else None
+        segments = segment_count(path) if path else None
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._active_row(db, user, room_id)
+                if path:
+                    # A rebuild may have cataloged the file before it finished
+                    db.execute(
+                        "DELETE FROM recordings WHERE path = ? AND id IS NOT ?",
+                        (path, row["id"] if row else None),
+                    )
+                if row is None:
+                    started_at = (path and started_from_name(path)) or finished_at
+                    db.execute(
+                        "INSERT INTO recordings (user, room_id, status, started_at) "
+                        "VALUES (?, ?, 'recording', ?)",
+                        (user, room_id, started_at),
+                    )
+                    row = self._active_row(db, user, room_id)
+                db.execute(
+                    "UPDATE recordings SET status = ?, finished_at = ?, "
+                    "duration = ? - started_at, size = ?, parts = ?, segments = ?, "
+                    "path = ? WHERE id = ?",
+                    (
+                        status,
+                        finished_at,
+                        finished_at,
+                        size,
+                        parts,
+                        segments,
+                        path,
+                        row["id"],
+                    ),
+                )
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def processed(self, source: str, path: str) -> None:
+        source, path = os.path.abspath(source), os.path.abspath(path)
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        self._execute(
+            "UPDATE recordings SET path = ?, size = COALESCE(?, size), "
+            "checksum = COALESCE(?, checksum) WHERE path = ?",
+            (path, size, read_checksum(path), source),
+        )
+
+    def deleted(self, path: str) -> None:
+        self._execute(
+            "UPDATE recordings SET status = 'deleted' WHERE path = ?",
+            (os.path.abspath(path),),
+        )
+
+    def apply(self, event: Event) -> None:
+        data = event.data
+        if event.type == Events.RECORDING_STARTED:
+            self.started(
+                event.user, data.get("room_id"), event.timestamp, data.get("quality")
+            )
+        elif event.type == Events.RECORDING_FINISHED:
+            self.finished(
+                event.user,
+                data.get("room_id"),
+                event.timestamp,
+                path=data.get("path"),
+                size=data.get("size"),
+                parts=data.get("parts"),
+            )
+        elif event.type == Events.RECORDING_ERROR:
+            self.finished(
+                event.user, data.get("room_id"), event.timestamp, status="error"
+            )
+        elif event.type == Events.POST_PROCESSED:
+            self.processed(data["source"], data["path"])
+        elif event.type == Events.RECORDING_DELETED:
+            self.deleted(data["path"])
+
+    async def _handle(self, event: Event) -> None:
+        await asyncio.to_thread(self.apply, event)
+
+    def subscribe(self) -> None:
+        """Keep the catalog up to date from the event bus (call on the loop)."""
+        self._subscription = event_bus.subscribe(
+            [
+                Events.RECORDING_STARTED,
+                Events.RECORDING_FINISHED,
+                Events.RECORDING_ERROR,
+                Events.POST_PROCESSED,
+                Events.RECORDING_DELETED,
+            ],
+            self._handle,
+            maxsize=10000,
+            name="catalog",
+        )
+
+    # -- queries -----------------------------------------------------------
+
+    def query(
+        self,
+        users: Optional[List[str]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        status: Optional[str] = None,
+        limit: Optional[int] = 100,
+    ) -> List[Dict[str, Any]]:
+        """Recordings started in [since, until), newest first."""
+        where, params = [], []
+        if users:
+            where.append(f"user IN ({', '.join('?' * len(users))})")
+            params += users
+        if since is not None:
+            where.append("started_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("started_at < ?")
+            params.append(until)
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM recordings"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY started_at DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self._execute(sql, params).fetchall()]
+
+    # -- rebuild -----------------------------------------------------------
+
+    def rebuild(self, root: str) -> Dict[str, int]:
+        """
+        Catalog the recordings under root and drop rows whose files are gone.
+        Known rows keep their room, quality and times.
+        """
+        root = os.path.abspath(root)
+        entries = RetentionIndex.scan(Path(root))
+        rows = []
+        for path, entry in entries.items():
+            started_at = started_from_name(path) or entry.finished_at
+            media = path if not path.endswith(MANIFEST_SUFFIX) else None
+            rows.append(
+                (
+                    entry.user,
+                    started_at,
+                    entry.finished_at,
+                    entry.finished_at - started_at,
+                    entry.size,
+                    segment_count(path),
+                    read_checksum(media) if media else None,
+                    path,
+                )
+            )
+
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                before = db.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+                db.executemany(
+                    "INSERT INTO recordings (user, status, started_at, finished_at, "
+                    "duration, size, segments, checksum, path) "
+                    "VALUES (?, 'finished', ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET status = 'finished', "
+                    "size = excluded.size, segments = excluded.segments, "
+                    "checksum = COALESCE(excluded.checksum, checksum)",
+                    rows,
+                )
+                # Files under root that are no longer there
+                gone = [
+                    (row["id"],)
+                    for row in db.execute(
+                        "SELECT id, path FROM recordings "
+                        "WHERE substr(path, 1, ?) = ? AND status != 'deleted'",
+                        (len(root) + 1, root + os.sep),
+                    )
+                    if row["path"] not in entries
+                    and not any(
+                        os.path.exists(recording_base(row["path"]) + suffix)
+                        for suffix in (".mp4", ".flv", MANIFEST_SUFFIX)
+                    )
+                ]
+                db.executemany(
+                    "UPDATE recordings SET status = 'deleted' WHERE id = ?", gone
+                )
+                after = db.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        return {"found": len(rows), "added": after - before, "missing": len(gone)}
+
+
+_catalog: Optional[RecordingCatalog] = None
+
+
+def configure_catalog(**kwargs) -> RecordingCatalog:
+    """Open the catalog; main subscribes it to the event bus."""
+    global _catalog
+    _catalog = RecordingCatalog(**kwargs)
+    return _catalog
+
+
+def get_catalog() -> Optional[RecordingCatalog]:
+    return _catalog
@@ -0,0 +1,282 @@
+import asyncio
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import orjson
+
+from core.events import Events, event_bus
+from core.live_history import get_live_history
+from core.postprocess import get_post_processor
+from core.recorders.segments import SegmentManifest
+from core.recorders.stitch import Capture, stitch_session
+from core.room_cache import get_room_cache
+from utils.logger_manager import logger
+
+CHECKPOINT_VERSION = 1
+
+# ผลการตรวจสอบ country blacklist (ที่ไม่ถูกบล็อก) ใช้ซ้ำได้นานเท่านี้
+BLACKLIST_TTL = 6 * 3600
+
+
+@dataclass
+class OrphanRecording:
+    """
+    การบันทึกที่ยังทำงานอยู่ตอนบันทึก checkpoint ครั้งล่าสุดของการทำงานครั้งก่อน
+    """
+
+    user: str
+    room_id: Optional[str]
+    started_at: float
+    files: List[str] = field(default_factory=list)  # ไฟล์หรือ manifest ของแต่ละ part
+
+
+class RecoveredPart:
+    """
+    part ที่บันทึกไว้ก่อนรีสตาร์ท ใช้แทน recorder เพื่อส่งเข้า stitch_session
+    """
+
+    def __init__(self, path: str):
+        self.manifest: Optional[SegmentManifest] = None
+        self.output_path: Optional[str] = path
+        if path.endswith(".manifest.json"):
+            self.manifest = SegmentManifest.load(path)
+            self.output_path = None
+            self._close_segments()
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(os.path.dirname(self.manifest.path), name)
+
+    def _close_segments(self) -> None:
+        """ปิด segment ที่ค้างอยู่ด้วยขนาดไฟล์จริงบนดิสก์"""
+        for segment in self.manifest.segments:
+            if not segment.closed:
+                path = self._segment_path(segment.path)
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                self.manifest.close_segment(segment, size=size)
+        if self.manifest.status == "recording":
+            self.manifest.finish("interrupted")
+
+    @property
+    def bytes_written(self) -> int:
+        if self.manifest is not None:
+            paths = [self._segment_path(s.path) for s in self.manifest.segments]
+            return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+        if self.output_path and os.path.exists(self.output_path):
+            return os.path.getsize(self.output_path)
+        return 0
+
+
+def recover_captures(orphan: OrphanRecording, finished_at: float) -> List[Capture]:
+    """สร้าง Capture ของ part ที่ยังอยู่บนดิสก์ (ข้ามไฟล์ที่หายไปหรืออ่านไม่ได้)"""
+    captures = []
+    for path in orphan.files:
+        if not os.path.exists(path):
+            continue
+        try:
+            part = RecoveredPart(path)
+        except (OSError, ValueError, TypeError) as ex:
+            logger.warning(f"อ่าน {path} ไม่สำเร็จ ข้ามไฟล์นี้: {ex}")
+            continue
+        captures.append(Capture(part, orphan.started_at, finished_at))
+    return captures
+
+
+class StateCheckpoint:
+    """
+    บันทึกสถานะที่อยู่ในหน่วยความจำลงไฟล์ JSON เป็นระยะ เพื่อเริ่มใหม่แบบ warm restart
+
+    ไฟล์เก็บเวลาตรวจสอบล่าสุดของแต่ละผู้ใช้ใน scheduler รายชื่อที่ติดตาม (โหมด
+    followers) ผลการตรวจสอบ country blacklist และการบันทึกที่กำลังทำงาน ส่วน Room ID
+    และประวัติไลฟ์มีไฟล์ของตัวเองซึ่งถูกบันทึกพร้อมกันทุกครั้ง
+
+    การบันทึกที่ค้างจากครั้งก่อน (เช่นโปรแกรมถูก kill) จะถูกต่อเข้ากับการบันทึกใหม่
+    หากผู้ใช้ยังไลฟ์ห้องเดิมอยู่ มิฉะนั้นจะถูกรวมไฟล์และปิดให้เรียบร้อยหลัง orphan_grace
+    วินาที
+    """
+
+    def __init__(self, path: str, interval: float = 60.0, orphan_grace: float = 120.0):
+        self.path = Path(path)
+        self.interval = interval
+        self.orphan_grace = orphan_grace
+
+        self.saved_at: Optional[float] = None
+        self.blacklist_checked_at: Optional[float] = None
+        self.last_checks: Dict[str, float] = {}
+        self.follows: List[str] = []
+        self.orphans: Dict[str, OrphanRecording] = {}
+        self._finalizing: Set[str] = set()
+
+        self._recorders: List = []
+        self._scheduler = None
+        self._followers = None
+
+    # -- restore -----------------------------------------------------------
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            data = orjson.loads(self.path.read_bytes())
+            if data.get("version") != CHECKPOINT_VERSION:
+                raise ValueError(f"version {data.get('version')} ไม่รองรับ")
+            self.saved_at = data["saved_at"]
+            self.blacklist_checked_at = data.get("blacklist_checked_at")
+            self.last_checks = data.get("last_checks", {})
+            self.follows = data.get("follows", [])
+            self.orphans = {
+                item["user"]: OrphanRecording(**item)
+                for item in data.get("recordings", [])
+            }
+        except Exception as e:
+            logger.warning(f"ไม่สามารถโหลด checkpoint จาก {self.path}: {e}")
+            return
+
+        age = time.time() - self.saved_at
+        logger.info(
+            f"โหลด checkpoint ({age / 60:.0f} นาทีก่อน): "
+            f"{len(self.last_checks)} ผู้ใช้, {len(self.follows)} รายชื่อที่ติดตาม, "
+            f"{len(self.orphans)} การบันทึกที่ค้างอยู่"
+        )
+
+    def blacklist_cached(self) -> bool:
+        """True หากเพิ่งตรวจสอบแล้วว่าไม่ถูกบล็อก จึงข้ามการตรวจสอบซ้ำได้"""
+        return (
+            self.blacklist_checked_at is not None
+            and time.time() - self.blacklist_checked_at < BLACKLIST_TTL
+        )
+
+    def remember_blacklist(self, blacklisted: bool) -> None:
+        self.blacklist_checked_at = None if blacklisted else time.time()
+
+    def take_orphan(self, user: str, room_id) -> Optional[OrphanRecording]:
+        """
+        คืนการบันทึกที่ค้างของผู้ใช้ หากเป็นไลฟ์ห้องเดียวกันเพื่อบันทึกต่อเป็น session เดิม
+        """
+        orphan = self.orphans.get(user)
+        if orphan is None or user in self._finalizing:
+            return None
+        if str(orphan.room_id) != str(room_id):
+            return None
+        del self.orphans[user]
+        logger.info(
+            f"บันทึกต่อจากการบันทึกที่ค้างอยู่ของ {user} ({len(orphan.files)} part)"
+        )
+        return orphan
+
+    async def finalize_orphans(self) -> None:
+        """รวมไฟล์และปิดการบันทึกที่ค้างอยู่ซึ่งไม่ได้ถูกบันทึกต่อ"""
+        # ลบออกจาก orphans หลังรวมไฟล์สำเร็จเท่านั้น หากถูกหยุดกลางทาง checkpoint
+        # ยังมีรายการนี้อยู่และจะปิดการบันทึกอีกครั้งหลังรีสตาร์ท
+        for user, orphan in list(self.orphans.items()):
+            self._finalizing.add(user)
+            try:
+                captures = recover_captures(orphan, self.saved_at or time.time())
+                size = sum(capture.recorder.bytes_written for capture in captures)
+                result = await stitch_session(captures) if captures else ""
+                event_bus.publish(
+                    Events.RECORDING_FINISHED,
+                    orphan.user,
+                    room_id=orphan.room_id,
+                    path=result,
+                    parts=len(captures),
+                    size=size,
+                    recovered=True,
+                )
+                del self.orphans[user]
+            except Exception as e:
+                logger.error(f"ไม่สามารถปิดการบันทึกที่ค้างอยู่ของ {user}: {e}")
+                continue
+            finally:
+                self._finalizing.discard(user)
+            if not result:
+                continue
+            logger.info(f"ปิดการบันทึกที่ค้างอยู่ของ {orphan.user}: {result}")
+            post_processor = get_post_processor()
+            if post_processor is not None:
+                post_processor.submit(orphan.user, result)
+        self.save()
+
+    # -- checkpoint --------------------------------------------------------
+
+    def attach_recorder(self, recorder) -> None:
+        self._recorders.append(recorder)
+
+    def detach_recorder(self, recorder) -> None:
+        if recorder in self._recorders:
+            self._recorders.remove(recorder)
+
+    def attach_scheduler(self, scheduler) -> None:
+        self._scheduler = scheduler
+
+    def attach_followers(self, followers) -> None:
+        self._followers = followers
+
+    def capture(self) -> dict:
+        last_checks = dict(self.last_checks)
+        if self._scheduler is not None:
+            last_checks.update(self._scheduler.last_checks())
+        follows = self.follows
+        if self._followers is not None and self._followers.follows:
+            follows = list(self._followers.follows)
+
+        recordings = [asdict(orphan) for orphan in self.orphans.values()]
+        for recorder in self._recorders:
+            for session in recorder.recordings:
+                recordings.append(
+                    asdict(
+                        OrphanRecording(
+                            session.user,
+                            session.room_id,
+                            session.started_at,
+                            list(session.files),
+                        )
+                    )
+                )
+
+        return {
+            "version": CHECKPOINT_VERSION,
+            "saved_at": time.time(),
+            "blacklist_checked_at": self.blacklist_checked_at,
+            "last_checks": last_checks,
+            "follows": follows,
+            "recordings": recordings,
+        }
+
+    def save(self) -> None:
+        """เขียน checkpoint แบบ atomic พร้อมบันทึกแคช Room ID และประวัติไลฟ์"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(orjson.dumps(self.capture()))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"ไม่สามารถบันทึก checkpoint ลง {self.path}: {e}")
+        get_room_cache().save()
+        get_live_history().save()
+
+    async def run(self) -> None:
+        """บันทึก checkpoint เป็นระยะ และปิดการบันทึกที่ค้างเมื่อครบ orphan_grace"""
+        if self.orphans:
+            await asyncio.sleep(self.orphan_grace)
+            await self.finalize_orphans()
+        while True:
+            await asyncio.sleep(self.interval)
+            self.save()
+
+
+_checkpoint: Optional[StateCheckpoint] = None
+
+
+def configure_checkpoint(**kwargs) -> StateCheckpoint:
+    """เปิดการบันทึก checkpoint และโหลดสถานะจากการทำงานครั้งก่อน"""
+    global _checkpoint
+    _checkpoint = StateCheckpoint(**kwargs)
+    _checkpoint.load()
+    return _checkpoint
+
+
+def get_checkpoint() -> Optional[StateCheckpoint]:
+    return _checkpoint
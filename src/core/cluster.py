@@ -0,0 +1,308 @@
+import asyncio
+import math
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+
+LEASES_HELD = REGISTRY.gauge("cluster_leases_held", "Users leased by this node")
+CLUSTER_NODES = REGISTRY.gauge("cluster_nodes", "Live nodes seen in the lease store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    user TEXT PRIMARY KEY,
+    node TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    node TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+);
+"""
+
+
+def default_node_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass
+class SyncResult:
+    held: Set[str]  # ผู้ใช้ที่ node นี้ถือ lease อยู่หลังการซิงก์
+    nodes: int  # จำนวน node ที่ยังมี heartbeat
+
+
+class LeaseStore:
+    """
+    ที่เก็บ lease ของผู้ใช้แบบแชร์ระหว่างหลายเครื่อง (ไฟล์ SQLite บน shared storage)
+
+    ผู้ใช้แต่ละคนมี lease ได้เพียงหนึ่ง node และ lease หมดอายุเองหาก node
+    นั้นไม่ต่ออายุภายใน ttl ทุกการเปลี่ยนแปลงอยู่ใน transaction แบบ
+    BEGIN IMMEDIATE จึงไม่มีสอง node ที่ claim ผู้ใช้คนเดียวกันได้พร้อมกัน
+
+    เวลาหมดอายุเป็น wall-clock เพราะใช้ร่วมกันหลายเครื่อง นาฬิกาของทุก node
+    จึงต้องตรงกัน (NTP) โดยคลาดเคลื่อนได้น้อยกว่า ttl / 3
+    """
+
+    def __init__(self, path: str, node: Optional[str] = None, ttl: float = 30.0):
+        self.path = Path(path)
+        self.node = node or default_node_id()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # ไม่ใช้ WAL เพราะ WAL ต้องใช้ shared memory ซึ่งไม่ทำงานบน network filesystem
+            db = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None, check_same_thread=False
+            )
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    def _transaction(self, work: Callable[[sqlite3.Connection, float], object]):
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(db, time.time())
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    def sync(self, users: List[str], keep: Set[str]) -> SyncResult:
+        """
+        ต่ออายุ heartbeat และ lease ของ node นี้ แล้วปรับจำนวน lease ให้ใกล้ส่วนแบ่ง
+        ที่ยุติธรรม (ผู้ใช้ทั้งหมด / จำนวน node): claim ผู้ใช้ที่ว่างหรือ lease หมดอายุ
+        เมื่อถือน้อยกว่า และปล่อยผู้ใช้ส่วนเกินเมื่อถือมากกว่า (ยกเว้นผู้ใช้ใน keep
+        ซึ่งกำลังถูกบันทึกอยู่)
+        """
+
+        def work(db: sqlite3.Connection, now: float) -> SyncResult:
+            expires = now + self.ttl
+            db.execute(
+                "INSERT INTO nodes (node, expires) VALUES (?, ?) "
+                "ON CONFLICT(node) DO UPDATE SET expires = excluded.expires",
+                (self.node, expires),
+            )
+            db.execute("DELETE FROM nodes WHERE expires < ?", (now - self.ttl,))
+            (nodes,) = db.execute(
+                "SELECT COUNT(*) FROM nodes WHERE expires >= ?", (now,)
+            ).fetchone()
+
+            wanted = set(users)
+            leases: Dict[str, tuple] = {
+                user: (node, lease_expires)
+                for user, node, lease_expires in db.execute(
+                    "SELECT user, node, expires FROM leases"
+                )
+            }
+
+            # lease ที่หมดอายุแล้วอาจถูก node อื่น claim ไปแล้ว จึงต่ออายุเฉพาะที่ยังใช้ได้
+            held = {
+                user
+                for user, (node, lease_expires) in leases.items()
+                if node == self.node and lease_expires >= now
+            }
+            # ผู้ใช้ที่ถูกนำออกจากรายชื่อของ node นี้
+            dropped = held - wanted
+            held -= dropped
+            db.executemany(
+                "DELETE FROM leases WHERE user = ? AND node = ?",
+                [(user, self.node) for user in dropped],
+            )
+
+            target = math.ceil(len(wanted) / max(nodes, 1))
+            if len(held) > target:
+                spare = [user for user in held if user not in keep]
+                random.shuffle(spare)
+                release = spare[: len(held) - target]
+                db.executemany(
+                    "DELETE FROM leases WHERE user = ? AND node = ?",
+                    [(user, self.node) for user in release],
+                )
+                held -= set(release)
+
+            db.execute(
+                "UPDATE leases SET expires = ? WHERE node = ? AND expires >= ?",
+                (expires, self.node, now),
+            )
+
+            if len(held) < target:
+                free = [
+                    user
+                    for user in wanted
+                    if user not in leases or leases[user][1] < now
+                ]
+                # สุ่มลำดับเพื่อไม่ให้ทุก node แย่งผู้ใช้กลุ่มเดียวกัน
+                random.shuffle(free)
+                for user in free[: target - len(held)]:
+                    claimed = db.execute(
+                        "INSERT INTO leases (user, node, expires) VALUES (?, ?, ?) "
+                        "ON CONFLICT(user) DO UPDATE SET "
+                        "node = excluded.node, expires = excluded.expires "
+                        "WHERE leases.expires < ?",
+                        (user, self.node, expires, now),
+                    ).rowcount
+                    if claimed:
+                        held.add(user)
+
+            return SyncResult(held=held, nodes=nodes)
+
+        return self._transaction(work)
+
+    def leave(self) -> None:
+        """ปล่อย lease ทั้งหมดทันที เพื่อให้ node อื่นรับผู้ใช้ไปได้โดยไม่ต้องรอหมดอายุ"""
+
+        def work(db: sqlite3.Connection, now: float) -> None:
+            db.execute("DELETE FROM leases WHERE node = ?", (self.node,))
+            db.execute("DELETE FROM nodes WHERE node = ?", (self.node,))
+
+        self._transaction(work)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class ClusterCoordinator:
+    """
+    ให้ PollScheduler ตรวจสอบเฉพาะผู้ใช้ที่ node นี้ถือ lease อยู่
+
+    ซิงก์กับ LeaseStore ทุก ttl / 3 วินาที ผู้ใช้ที่ได้ lease มาใหม่จะถูกเพิ่มเข้า
+    scheduler และผู้ใช้ที่เสีย lease จะถูกนำออกพร้อมหยุดการบันทึก
+    หากซิงก์ไม่สำเร็จนานจน lease ใกล้หมดอายุ จะหยุดทุกการบันทึกก่อนที่ node อื่น
+    จะ claim ผู้ใช้ไป เพื่อไม่ให้ผู้ใช้คนเดียวถูกบันทึกซ้ำสองเครื่อง
+    """
+
+    def __init__(
+        self,
+        store: LeaseStore,
+        scheduler,
+        users: List[str],
+        stop_recording: Callable[[str], None],
+    ):
+        self.store = store
+        self.scheduler = scheduler
+        self.users = list(users)
+        self.stop_recording = stop_recording
+        self.interval = store.ttl / 3
+        # ช่วงเวลาตรวจสอบรายคน (วินาที) ใช้เมื่อได้ lease ของผู้ใช้นั้นมา
+        self.intervals: Dict[str, float] = {}
+        self.held: Set[str] = set()
+        # เวลา (monotonic) ที่ lease ซึ่งต่ออายุล่าสุดยังปลอดภัยที่จะใช้
+        self._valid_until = 0.0
+
+    def add_user(self, user: str, interval: Optional[float] = None) -> None:
+        """เพิ่มผู้ใช้เข้ากลุ่ม ผู้ใช้จะถูกตรวจสอบเมื่อ node ใด node หนึ่งได้ lease"""
+        if interval is not None:
+            self.intervals[user] = interval
+        else:
+            self.intervals.pop(user, None)
+        if user not in self.users:
+            self.users.append(user)
+
+    def remove_user(self, user: str) -> bool:
+        """
+        นำผู้ใช้ออกจากกลุ่มทันที หาก node นี้ถือ lease อยู่จะหยุดการบันทึกด้วย
+        เพราะ lease จะถูกปล่อยในการซิงก์ครั้งถัดไป
+        """
+        if user not in self.users:
+            return False
+        self.users.remove(user)
+        self.intervals.pop(user, None)
+        if user in self.held:
+            self._apply(self.held - {user})
+        return True
+
+    async def sync(self) -> None:
+        started = time.monotonic()
+        keep = set(self.scheduler.active_recordings)
+        try:
+            result = await asyncio.to_thread(self.store.sync, self.users, keep)
+        except sqlite3.Error as ex:
+            logger.error(f"ซิงก์ lease กับ {self.store.path} ไม่สำเร็จ: {ex}")
+            self._drop_expired()
+            return
+
+        # เผื่อเวลาหนึ่งรอบซิงก์ไว้ให้การบันทึกหยุดก่อน lease หมดอายุจริง
+        self._valid_until = started + self.store.ttl - self.interval
+        CLUSTER_NODES.set(result.nodes)
+        self._apply(result.held)
+
+    def _drop_expired(self) -> None:
+        """หยุดทุกอย่างเมื่อ lease ที่ต่ออายุล่าสุดไม่ปลอดภัยที่จะใช้แล้ว"""
+        if self.held and time.monotonic() >= self._valid_until:
+            logger.warning("lease ใกล้หมดอายุ หยุดการตรวจสอบและการบันทึกทั้งหมด")
+            self._apply(set())
+
+    def _apply(self, held: Set[str]) -> None:
+        added = held - self.held
+        removed = self.held - held
+        for user in added:
+            self.scheduler.add_user(user, interval=self.intervals.get(user))
+        active = self.scheduler.active_recordings
+        for user in removed:
+            self.scheduler.remove_user(user)
+            if user in active:
+                logger.warning(f"เสีย lease ของ @{user} หยุดการบันทึก")
+                self.stop_recording(user)
+        if added or removed:
+            logger.info(
+                f"cluster: ถือ {len(held)}/{len(self.users)} ผู้ใช้ "
+                f"(+{len(added)} -{len(removed)})"
+            )
+        self.held = held
+        LEASES_HELD.set(len(held))
+
+    async def run(self) -> None:
+        """ซิงก์เป็นระยะจนกว่าจะถูก cancel (หลัง scheduler หยุดและการบันทึกจบแล้ว)"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception as ex:
+                # ลูปต้องทำงานต่อ มิฉะนั้น lease จะไม่ถูกต่ออายุขณะที่การบันทึกยังดำเนินอยู่
+                # และ node อื่นจะรับผู้ใช้ไปบันทึกซ้ำหลัง lease หมดอายุ
+                logger.error(f"เกิดข้อผิดพลาดในการซิงก์ lease: {ex}")
+                try:
+                    self._drop_expired()
+                except Exception as ex:
+                    logger.error(f"หยุดผู้ใช้ที่ lease หมดอายุไม่สำเร็จ: {ex}")
+
+    async def leave(self) -> None:
+        try:
+            await asyncio.to_thread(self.store.leave)
+        except sqlite3.Error as ex:
+            logger.error(f"ปล่อย lease ไม่สำเร็จ: {ex}")
+        finally:
+            self.store.close()
+
+
+_lease_store: Optional[LeaseStore] = None
+
+
+def configure_lease_store(**kwargs) -> LeaseStore:
+    """
+    เปิดโหมด cluster: โหมดอัตโนมัติจะตรวจสอบเฉพาะผู้ใช้ที่ node นี้ได้ lease
+    """
+    global _lease_store
+    _lease_store = LeaseStore(**kwargs)
+    return _lease_store
+
+
+def get_lease_store() -> Optional[LeaseStore]:
+    return _lease_store
@@ -2,6 +2,8 @@ import re
 import orjson
 from typing import Optional
 
+from utils.profiling import profiled
+
 
 class TikTokUrlParser:
     """
@@ -15,8 +17,16 @@ class TikTokUrlParser:
         r'<script id="SIGI_STATE" type="application/json">(.*?)</script>'
     )
     _USER_URL_PATTERN = re.compile(r"https?://(?:www\.)?tiktok\.com/@([^/]+)/live")
+    # หน้าปกติจะมีข้อมูลหน้าเว็บฝังอยู่เสมอ ส่วนหน้า WAF/captcha จะไม่มี
+    _PAGE_DATA_PATTERN = re.compile(
+        r'id="(?:SIGI_STATE|__UNIVERSAL_DATA_FOR_REHYDRATION__)"'
+    )
+    _CHALLENGE_PATTERN = re.compile(
+        r"_wafchallengeid|captcha|verify|Please wait", re.IGNORECASE
+    )
 
     @classmethod
+    @profiled("TikTokUrlParser.parse_room_id_from_html")
     def parse_room_id_from_html(cls, html: str) -> Optional[str]:
         """
         ดึง room_id จากเนื้อหา HTML ของหน้าไลฟ์ TikTok
@@ -50,6 +60,16 @@ class TikTokUrlParser:
 
         return None
 
+    @classmethod
+    def is_challenge_page(cls, html: str) -> bool:
+        """
+        ตรวจว่า HTML เป็นหน้า WAF/captcha ที่ TikTok ส่งกลับมาพร้อมสถานะ 200
+        แทนหน้าไลฟ์จริง
+        """
+        if cls._PAGE_DATA_PATTERN.search(html):
+            return False
+        return not html.strip() or bool(cls._CHALLENGE_PATTERN.search(html))
+
     @classmethod
     def parse_user_from_url(cls, url: str) -> Optional[str]:
         """
@@ -0,0 +1,360 @@
+"""
+Local HTTP control API for a running recorder.
+
+Lets you change the watched users of automatic mode while it runs, so
+active recordings never have to be interrupted by a restart:
+
+    GET    /status                  mode, watched users, active recordings
+    GET    /users                   watched users and their schedule
+    POST   /users                   {"user": ..., "interval": min, "quality": ...}
+    PATCH  /users/<user>            {"interval": min, "quality": ...}
+    DELETE /users/<user>[?stop=1]   stop watching, optionally stop recording
+    GET    /recordings              active recordings with their stats
+    DELETE /recordings/<user>       stop one recording
+    GET    /catalog                 past recordings from the catalog, newest
+                                    first (?user=a,b&since=&until=&status=&limit=)
+
+Requests and responses are JSON. The server binds to 127.0.0.1 by default.
+When a token is set, every request needs "Authorization: Bearer <token>".
+"""
+
+import asyncio
+import hmac
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import orjson
+
+from core.catalog import get_catalog, parse_date
+from core.quality import get_quality_policy, quality_rank, rank_name
+from utils.custom_exceptions import ControlAPIError
+from utils.logger_manager import logger
+from utils.signals import stop_event
+
+MAX_BODY = 64 * 1024
+
+
+_REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class ControlServer:
+    """
+    Serves the control API for the TikTokRecorder that is attached to it.
+
+    The recorder attaches itself when it starts; in automatic mode the
+    scheduler (and cluster coordinator) are attached as well, and only then
+    can users be added, changed or removed. Every change is applied to the
+    running scheduler in place.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, token: Optional[str] = None
+    ):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.recorder = None
+        self.scheduler = None
+        self.coordinator = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def attach(self, recorder, scheduler=None, coordinator=None) -> None:
+        self.recorder = recorder
+        self.scheduler = scheduler
+        self.coordinator = coordinator
+
+    def detach(self) -> None:
+        self.recorder = self.scheduler = self.coordinator = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Control API available at http://{self.host}:{self.port}/")
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    # -- HTTP --------------------------------------------------------------
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            try:
+                request = await asyncio.wait_for(self._read_request(reader), timeout=5)
+                status, payload = await self._route(*request)
+            except ControlAPIError as e:
+                status, payload = e.status, {"error": str(e)}
+            except Exception as e:
+                logger.error(f"Control API request failed: {e}")
+                status, payload = 500, {"error": str(e)}
+
+            body = orjson.dumps(payload) + b"\n"
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode(
+                    "latin-1"
+                )
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> Tuple[str, str, Dict[str, str], Any]:
+        parts = (await reader.readline()).decode("latin-1").split()
+        if len(parts) < 2:
+            raise ControlAPIError(400, "malformed request line")
+        method, target = parts[0].upper(), parts[1]
+
+        headers: Dict[str, str] = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if self.token and not hmac.compare_digest(
+            headers.get("authorization", ""), f"Bearer {self.token}"
+        ):
+            raise ControlAPIError(401, "missing or wrong token")
+
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise ControlAPIError(413, "request body too large")
+        body = None
+        if length:
+            try:
+                body = orjson.loads(await reader.readexactly(length))
+            except orjson.JSONDecodeError:
+                raise ControlAPIError(400, "body is not valid JSON")
+            if not isinstance(body, dict):
+                raise ControlAPIError(400, "body must be a JSON object")
+        return method, target, headers, body
+
+    async def _route(
+        self, method: str, target: str, headers: Dict[str, str], body: Any
+    ) -> Tuple[int, Any]:
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        path = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        body = body or {}
+
+        if path == ["status"] and method == "GET":
+            return 200, self.status()
+        if path == ["users"]:
+            if method == "GET":
+                return 200, self.list_users()
+            if method == "POST":
+                return 201, self.add_user(body.get("user"), **_settings(body))
+        if len(path) == 2 and path[0] == "users":
+            if method == "PATCH":
+                return 200, self.update_user(path[1], **_settings(body))
+            if method == "DELETE":
+                stop = query.get("stop", ["0"])[0] in ("1", "true", "yes")
+                return 200, self.remove_user(path[1], stop=stop)
+        if path == ["recordings"] and method == "GET":
+            return 200, self.list_recordings()
+        if len(path) == 2 and path[0] == "recordings" and method == "DELETE":
+            return 200, self.stop_recording(path[1])
+        if path == ["catalog"] and method == "GET":
+            return 200, await self.query_catalog(query)
+
+        if path and path[0] in ("status", "users", "recordings", "catalog"):
+            raise ControlAPIError(405, f"{method} is not supported on {url.path}")
+        raise ControlAPIError(404, f"unknown endpoint {url.path}")
+
+    # -- operations --------------------------------------------------------
+
+    def _require_recorder(self):
+        if self.recorder is None:
+            raise ControlAPIError(409, "the recorder is not running")
+        return self.recorder
+
+    def _require_scheduler(self):
+        self._require_recorder()
+        if self.scheduler is None:
+            raise ControlAPIError(
+                409, "watched users can only be changed in automatic mode"
+            )
+        return self.scheduler
+
+    def status(self) -> Dict[str, Any]:
+        recorder = self._require_recorder()
+        return {
+            "mode": recorder.mode.name.lower(),
+            "stopping": stop_event.is_set(),
+            "users": len(self.scheduler.users) if self.scheduler else None,
+            "recordings": len(recorder.recordings),
+        }
+
+    def list_users(self):
+        scheduler = self._require_scheduler()
+        quality = get_quality_policy()
+        now = time.monotonic()
+        active = scheduler.active_recordings
+        return [
+            {
+                "user": entry.user,
+                "interval": entry.interval / 60,
+                "next_check_in": max(0.0, entry.next_check - now),
+                "room_id": entry.room_id,
+                "quality": (
+                    rank_name(quality.per_user[entry.user])
+                    if entry.user in quality.per_user
+                    else None
+                ),
+                "recording": entry.user in active,
+            }
+            for entry in sorted(scheduler.entries, key=lambda entry: entry.user)
+        ]
+
+    def add_user(
+        self,
+        user: Optional[str],
+        interval: Optional[float] = None,
+        quality: Any = ...,
+    ) -> Dict[str, Any]:
+        scheduler = self._require_scheduler()
+        user = _clean_user(user)
+        if quality is not ...:
+            get_quality_policy().set_user_quality(user, quality)
+        if self.coordinator is not None:
+            # The user is scheduled once this node wins its lease
+            self.coordinator.add_user(user)
+            if interval is not None and user in scheduler.users:
+                scheduler.add_user(user, interval=interval)
+        else:
+            scheduler.add_user(user, interval=interval)
+        logger.info(f"Control API: watching @{user}")
+        return {"user": user}
+
+    def update_user(
+        self, user: str, interval: Optional[float] = None, quality: Any = ...
+    ) -> Dict[str, Any]:
+        scheduler = self._require_scheduler()
+        user = _clean_user(user)
+        if user not in scheduler.users:
+            raise ControlAPIError(404, f"@{user} is not watched")
+        if interval is not None:
+            scheduler.add_user(user, interval=interval)
+        if quality is not ...:
+            # Applies from the next recording; a running one keeps its quality
+            get_quality_policy().set_user_quality(user, quality)
+        logger.info(f"Control API: updated @{user}")
+        return {"user": user}
+
+    def remove_user(self, user: str, stop: bool = False) -> Dict[str, Any]:
+        scheduler = self._require_scheduler()
+        user = _clean_user(user)
+        watched = user in scheduler.users
+        if self.coordinator is not None:
+            # Releasing the lease always stops the recording, see ClusterCoordinator
+            watched = self.coordinator.remove_user(user) or watched
+        if not watched:
+            raise ControlAPIError(404, f"@{user} is not watched")
+        scheduler.remove_user(user)
+        stopped = stop and self._stop(user)
+        logger.info(f"Control API: stopped watching @{user}")
+        return {"user": user, "stopped": stopped}
+
+    def list_recordings(self):
+        recorder = self._require_recorder()
+        return [session.to_dict() for session in recorder.recordings]
+
+    def stop_recording(self, user: str) -> Dict[str, Any]:
+        self._require_recorder()
+        user = _clean_user(user)
+        if not self._stop(user):
+            raise ControlAPIError(404, f"@{user} is not being recorded")
+        if self.scheduler is not None:
+            # Keep watching, but do not record the same live again
+            self.scheduler.skip_current_live(user)
+        logger.info(f"Control API: stopping the recording of @{user}")
+        return {"user": user, "stopped": True}
+
+    async def query_catalog(self, query: Dict[str, List[str]]):
+        catalog = get_catalog()
+        if catalog is None:
+            raise ControlAPIError(409, "the recording catalog is disabled")
+        first = {name: values[0] for name, values in query.items()}
+        try:
+            since = parse_date(first["since"]) if "since" in first else None
+            until = parse_date(first["until"]) if "until" in first else None
+            limit = int(first.get("limit", 100))
+        except ValueError as e:
+            raise ControlAPIError(400, str(e))
+        users = [u.strip().lstrip("@") for u in first.get("user", "").split(",")]
+        # SQLite may wait for a writer, so keep it off the event loop
+        return await asyncio.to_thread(
+            catalog.query,
+            users=[u for u in users if u],
+            since=since,
+            until=until,
+            status=first.get("status"),
+            limit=max(1, min(limit, 10000)),
+        )
+
+    def _stop(self, user: str) -> bool:
+        if all(session.user != user for session in self.recorder.recordings):
+            return False
+        self.recorder.stop_user(user)
+        return True
+
+
+def _clean_user(user: Any) -> str:
+    if not isinstance(user, str) or not user.strip().lstrip("@"):
+        raise ControlAPIError(400, "a user name is required")
+    return user.strip().lstrip("@")
+
+
+def _settings(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate the optional interval (minutes) and quality of a request."""
+    settings: Dict[str, Any] = {}
+    if body.get("interval") is not None:
+        interval = body["interval"]
+        if isinstance(interval, bool) or not isinstance(interval, (int, float)):
+            raise ControlAPIError(400, "interval must be a number of minutes")
+        if interval <= 0:
+            raise ControlAPIError(400, "interval must be a positive number of minutes")
+        settings["interval"] = interval * 60
+    if "quality" in body:
+        quality = body["quality"]
+        if quality is not None:
+            try:
+                quality_rank(str(quality))
+            except ValueError as e:
+                raise ControlAPIError(400, str(e))
+            quality = str(quality).lower()
+        settings["quality"] = quality
+    return settings
+
+
+_control_server: Optional[ControlServer] = None
+
+
+def configure_control_server(**kwargs) -> ControlServer:
+    """Create the control server; main starts it together with the recorder."""
+    global _control_server
+    _control_server = ControlServer(**kwargs)
+    return _control_server
+
+
+def get_control_server() -> Optional[ControlServer]:
+    return _control_server
@@ -1,41 +1,222 @@
 import asyncio
-from typing import Callable, Dict, List, Any
-from src.utils.logger_manager import logger
+import inspect
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Union,
+)
+
+from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+
+EVENTS_PUBLISHED = REGISTRY.counter(
+    "events_published_total", "Events published on the event bus", ["type"]
+)
+EVENTS_DROPPED = REGISTRY.counter(
+    "events_dropped_total",
+    "Events dropped because a subscriber fell behind",
+    ["subscriber"],
+)
+
+
+# Event Types
+class Events:
+    POLL_RESULT = "poll_result"
+    LIVE_DETECTED = "live_detected"
+    RECORDING_STARTED = "recording_started"
+    SEGMENT_CLOSED = "segment_closed"
+    RECORDING_FINISHED = "recording_finished"
+    RECORDING_ERROR = "recording_error"
+    POST_PROCESSED = "post_processed"
+    RECORDING_DELETED = "recording_deleted"
+
+    ALL = "*"
+
+
+@dataclass(frozen=True)
+class Event:
+    type: str
+    user: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+
+class OverflowPolicy(Enum):
+    """What a full subscriber queue does with a new event."""
+
+    DROP_OLDEST = "drop_oldest"  # keep the latest events
+    DROP_NEWEST = "drop_newest"  # keep the earliest events
+
+
+Handler = Callable[[Event], Union[None, Awaitable[None]]]
+
+
+class Subscription:
+    """
+    One subscriber: a bounded queue and the task that feeds its handler.
+
+    A slow or failing handler only delays or loses its own events, never
+    the publisher or other subscribers.
+    """
+
+    def __init__(
+        self,
+        bus: "EventBus",
+        name: str,
+        event_types: Iterable[str],
+        handler: Handler,
+        maxsize: int,
+        policy: OverflowPolicy,
+    ):
+        self.bus = bus
+        self.name = name
+        self.event_types = frozenset(event_types)
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+
+        self._queue: Deque[Event] = deque()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._busy = False
+
+    def wants(self, event: Event) -> bool:
+        return Events.ALL in self.event_types or event.type in self.event_types
+
+    def offer(self, event: Event) -> None:
+        if len(self._queue) >= self.maxsize:
+            self.dropped += 1
+            EVENTS_DROPPED.inc(subscriber=self.name)
+            if self.policy is OverflowPolicy.DROP_NEWEST:
+                return
+            self._queue.popleft()
+        self._queue.append(event)
+        self._ready.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(
+                self._consume(), name=f"events:{self.name}"
+            )
+
+    async def _consume(self) -> None:
+        while True:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            event = self._queue.popleft()
+            self._busy = True
+            try:
+                result = self.handler(event)
+                if inspect.isawaitable(result):
+                    await result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event handler {self.name} failed on {event.type}: {e}")
+            finally:
+                self._busy = False
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """Stop the handler after it has had up to timeout seconds to drain."""
+        if self._task is None:
+            return
+        if timeout:
+            deadline = asyncio.get_running_loop().time() + timeout
+            while (
+                self._queue or self._busy
+            ) and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(0.05)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
 
 
 class EventBus:
+    """
+    In-process publish/subscribe for recorder lifecycle events.
+
+    publish() never blocks and never awaits a handler: the event is put on
+    the bounded queue of every matching subscriber, and a full queue drops
+    an event according to the subscriber's OverflowPolicy. Handlers may be
+    plain functions or coroutines. They run in the subscriber's own task,
+    one event at a time and in publish order.
+
+    Subscribe from the event loop. publish() may be called from any
+    thread; calls from other threads are handed over to the loop.
+    """
+
     def __init__(self):
-        self._subscribers: Dict[str, List[Callable]] = {}
-
-    def subscribe(self, event_type: str, handler: Callable):
-        """Subscribe a handler to an event type."""
-        if event_type not in self._subscribers:
-            self._subscribers[event_type] = []
-        self._subscribers[event_type].append(handler)
-        logger.debug(f"Subscribed to {event_type}")
-
-    async def publish(self, event_type: str, data: Any = None):
-        """Publish an event to all subscribers."""
-        if event_type not in self._subscribers:
-            return
+        self._subscriptions: List[Subscription] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
 
-        logger.info(f"Event published: {event_type}")
+    def subscribe(
+        self,
+        event_type: Union[str, Iterable[str]],
+        handler: Handler,
+        maxsize: int = 1000,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        name: Optional[str] = None,
+    ) -> Subscription:
+        """Subscribe a handler to one event type, several, or Events.ALL."""
+        event_types = [event_type] if isinstance(event_type, str) else event_type
+        subscription = Subscription(
+            self,
+            name or getattr(handler, "__qualname__", repr(handler)),
+            event_types,
+            handler,
+            maxsize,
+            policy,
+        )
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._subscriptions.append(subscription)
+        subscription.start()
+        logger.debug(f"{subscription.name} subscribed to {', '.join(event_types)}")
+        return subscription
 
-        # Run all handlers concurrently
-        tasks = []
-        for handler in self._subscribers[event_type]:
-            tasks.append(asyncio.create_task(handler(data)))
+    async def unsubscribe(
+        self, subscription: Subscription, timeout: Optional[float] = None
+    ) -> None:
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+        await subscription.close(timeout)
 
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+    def publish(self, event_type: str, user: Optional[str] = None, **data) -> None:
+        """Publish an event to all subscribers without waiting for them."""
+        if not self._subscriptions:
+            return
+        event = Event(event_type, user, data)
+        if self._loop_thread == threading.get_ident():
+            self._deliver(event)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, event)
 
+    def _deliver(self, event: Event) -> None:
+        EVENTS_PUBLISHED.inc(type=event.type)
+        for subscription in self._subscriptions:
+            if subscription.wants(event):
+                subscription.offer(event)
 
-# Global Event Bus instance
-event_bus = EventBus()
+    async def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Let every subscriber drain for up to timeout seconds, then stop."""
+        subscriptions, self._subscriptions = self._subscriptions, []
+        await asyncio.gather(*(s.close(timeout) for s in subscriptions))
 
 
-# Event Types
-class Events:
-    RECORDING_STARTED = "recording_started"
-    RECORDING_FINISHED = "recording_finished"
-    RECORDING_ERROR = "recording_error"
+# Global Event Bus instance
+event_bus = EventBus()
@@ -0,0 +1,239 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from core.events import Events, event_bus
+from core.tiktok_api import TikTokAPI
+from utils.custom_exceptions import StorageFullError
+from utils.logger_manager import logger
+from utils.metrics import POLL_CYCLE
+from utils.signals import stop_event
+
+
+class FollowersEngine:
+    """
+    ตรวจสอบไลฟ์ของผู้ที่บัญชีนี้ติดตามอยู่ ออกแบบให้รองรับหลายหมื่นรายชื่อ
+
+    - ซิงก์รายชื่อแบบ incremental: ดึงทีละหน้า (เรียงจากติดตามล่าสุด) และหยุดทันที
+      เมื่อเจอหน้าที่ไม่มีรายชื่อใหม่ ส่วนการซิงก์เต็มรูปแบบ (เพื่อลบผู้ที่เลิกติดตาม)
+      ทำทุก full_sync_every รอบ
+    - เก็บ reverse index room_id -> user เพื่อจับคู่ผลลัพธ์ check_alive ได้ใน O(1)
+    - ค้นหา room_id และตรวจสอบแต่ละ chunk พร้อมกันภายใต้ขีดจำกัดที่กำหนด
+    """
+
+    BATCH_SIZE = 50
+
+    def __init__(
+        self,
+        tiktok: TikTokAPI,
+        sec_uid: str,
+        interval: float,
+        on_live: Callable[[str, str], Awaitable[None]],
+        page_size: int = 30,
+        full_sync_every: int = 12,
+        resolve_concurrency: int = 10,
+        check_concurrency: int = 4,
+    ):
+        self.tiktok = tiktok
+        self.sec_uid = sec_uid
+        self.interval = interval
+        self.on_live = on_live
+        self.page_size = page_size
+        self.full_sync_every = full_sync_every
+
+        # dict ใช้เป็น ordered set ของรายชื่อที่ติดตาม
+        self.follows: Dict[str, None] = {}
+        self._room_to_user: Dict[str, str] = {}
+        self._user_to_room: Dict[str, str] = {}
+        self._active: Dict[str, asyncio.Task] = {}
+        self._cycles = 0
+
+        self._resolve_semaphore = asyncio.Semaphore(resolve_concurrency)
+        self._check_semaphore = asyncio.Semaphore(check_concurrency)
+
+    @property
+    def active_recordings(self) -> Dict[str, asyncio.Task]:
+        return dict(self._active)
+
+    def restore(self, follows: List[str]) -> None:
+        """
+        ใช้รายชื่อที่ติดตามจาก checkpoint รอบแรกจึงซิงก์แบบ incremental
+        แทนการดึงรายชื่อทั้งหมดใหม่
+        """
+        if follows:
+            self.follows = dict.fromkeys(follows)
+            self._cycles = 1
+
+    async def sync_follow_list(self, full: bool = False) -> int:
+        """
+        อัปเดตรายชื่อที่ติดตาม คืนค่าจำนวนรายชื่อใหม่ที่พบ
+        """
+        fetched: Dict[str, None] = {}
+        added = 0
+
+        async for page in self.tiktok.iter_followers_pages(
+            self.sec_uid, self.page_size
+        ):
+            new_in_page = 0
+            for user in page:
+                fetched[user] = None
+                if user not in self.follows:
+                    new_in_page += 1
+            added += new_in_page
+
+            # หน้าที่ไม่มีรายชื่อใหม่ = ถึงส่วนที่ซิงก์ไว้แล้ว (ยกเว้นตอนซิงก์เต็ม)
+            if not full and self.follows and new_in_page == 0:
+                break
+
+        if full:
+            for user in self.follows.keys() - fetched.keys():
+                self._forget_room(user)
+            self.follows = fetched
+        else:
+            for user in fetched:
+                self.follows.setdefault(user, None)
+
+        return added
+
+    def _forget_room(self, user: str) -> None:
+        room_id = self._user_to_room.pop(user, None)
+        if room_id is not None and self._room_to_user.get(room_id) == user:
+            del self._room_to_user[room_id]
+
+    def _index_room(self, user: str, room_id: Optional[str]) -> None:
+        old = self._user_to_room.get(user)
+        if old == room_id:
+            return
+        self._forget_room(user)
+        if room_id:
+            self._user_to_room[user] = room_id
+            self._room_to_user[room_id] = user
+
+    async def run(self) -> None:
+        logger.info("เริ่มตรวจสอบไลฟ์ของผู้ที่ติดตาม\n")
+        try:
+            while not stop_event.is_set():
+                try:
+                    await self._cycle()
+                except Exception as ex:
+                    logger.error(f"เกิดข้อผิดพลาดในลูป followers: {ex}")
+
+                await self._sleep(self.interval)
+        finally:
+            if self._active:
+                logger.info(
+                    f"กำลังรอการบันทึก {len(self._active)} รายการให้เสร็จสิ้น..."
+                )
+                await asyncio.gather(*self._active.values(), return_exceptions=True)
+
+    async def _sleep(self, seconds: float) -> None:
+        # stop_event เป็น threading.Event จึงต้องตื่นมาตรวจสอบเป็นระยะ
+        deadline = time.monotonic() + seconds
+        while not stop_event.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(min(1.0, deadline - time.monotonic()))
+
+    async def _cycle(self) -> None:
+        started = time.monotonic()
+
+        full = not self.follows or self._cycles % self.full_sync_every == 0
+        self._cycles += 1
+        try:
+            added = await self.sync_follow_list(full=full)
+        except Exception as ex:
+            logger.error(f"เกิดข้อผิดพลาดในการดึงรายชื่อผู้ติดตาม: {ex}")
+            added = 0
+
+        if not self.follows:
+            logger.info("ไม่พบผู้ติดตาม หรือดึงข้อมูลล้มเหลว รอสักครู่...")
+            return
+
+        users_to_check = [u for u in self.follows if u not in self._active]
+        await self._resolve_room_ids(users_to_check)
+
+        room_ids = [
+            self._user_to_room[u] for u in users_to_check if u in self._user_to_room
+        ]
+        chunks = [
+            room_ids[i : i + self.BATCH_SIZE]
+            for i in range(0, len(room_ids), self.BATCH_SIZE)
+        ]
+        results = await asyncio.gather(
+            *(self._check_chunk(chunk) for chunk in chunks), return_exceptions=True
+        )
+
+        live = 0
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"เกิดข้อผิดพลาดในการตรวจสอบสถานะห้อง: {result}")
+                continue
+            for room_id, alive in result.items():
+                user = self._room_to_user.get(room_id)
+                if user:
+                    event_bus.publish(
+                        Events.POLL_RESULT, user, room_id=room_id, live=bool(alive)
+                    )
+                if not user:
+                    continue
+                if not alive:
+                    # ไลฟ์ครั้งถัดไปจะได้ room_id ใหม่: นับว่าไม่มีห้องไลฟ์จนกว่า
+                    # รายการในแคชจะหมดอายุ แล้วจึงค้นหาห้องใหม่
+                    self.tiktok.room_cache.mark_ended(user, room_id)
+                    self._forget_room(user)
+                elif user not in self._active:
+                    live += 1
+                    self._dispatch(user, room_id)
+
+        elapsed = time.monotonic() - started
+        POLL_CYCLE.observe(elapsed, mode="followers")
+        logger.info(
+            f"ตรวจสอบผู้ติดตาม {len(users_to_check)} คน "
+            f"(ใหม่ {added} คน, {len(chunks)} คำขอ check_alive, พบไลฟ์ {live} คน) "
+            f"ใน {elapsed:.2f} วินาที "
+            f"รอ {self.interval / 60:g} นาทีก่อนตรวจสอบรอบถัดไป..."
+        )
+
+    async def _resolve_room_ids(self, users: List[str]) -> None:
+        """
+        ค้นหา room_id ของผู้ใช้ (ผ่านแคชของ TikTokAPI) โดยจำกัดจำนวนคำขอพร้อมกัน
+        """
+        cache = self.tiktok.room_cache
+        misses = []
+        for user in users:
+            # ตอบจากแคชโดยตรงโดยไม่ต้องสร้าง coroutine สำหรับผู้ใช้ส่วนใหญ่
+            entry = cache.get(user)
+            if entry is None:
+                misses.append(user)
+            else:
+                self._index_room(user, entry.live_room_id)
+
+        async def resolve(user: str):
+            async with self._resolve_semaphore:
+                room_id = await self.tiktok.get_room_id_from_user(user)
+            self._index_room(user, str(room_id) if room_id else None)
+
+        if misses:
+            logger.info(f"กำลังค้นหา Room ID สำหรับ {len(misses)} ผู้ใช้...")
+            await asyncio.gather(*(resolve(u) for u in misses), return_exceptions=True)
+
+    async def _check_chunk(self, chunk: List[str]) -> Dict[str, bool]:
+        async with self._check_semaphore:
+            return await self.tiktok.is_room_alive(chunk)
+
+    def _dispatch(self, user: str, room_id: str) -> None:
+        logger.info(f"@{user} กำลังไลฟ์! เริ่มต้นการบันทึก...")
+        task = asyncio.create_task(self.on_live(user, room_id))
+        self._active[user] = task
+        task.add_done_callback(lambda t, u=user: self._on_recording_done(u, t))
+
+    def _on_recording_done(self, user: str, task: asyncio.Task) -> None:
+        self._active.pop(user, None)
+        # ไลฟ์ครั้งถัดไปจะได้ room_id ใหม่
+        self._forget_room(user)
+        self.tiktok.room_cache.invalidate(user)
+        if not task.cancelled() and isinstance(task.exception(), StorageFullError):
+            # พื้นที่ดิสก์ไม่พอ จะลองใหม่ในรอบตรวจสอบถัดไป
+            logger.warning(str(task.exception()))
+        elif not task.cancelled() and task.exception():
+            logger.error(f"การบันทึกของ @{user} ล้มเหลว: {task.exception()}")
+        else:
+            logger.info(f"การบันทึกของ @{user} เสร็จสิ้น")
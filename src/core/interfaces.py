@@ -1,11 +1,45 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class RecordingStats:
+    """Live statistics of a recording in progress."""
+
+    bytes_written: int = 0
+    bitrate: Optional[float] = None  # kbit/s
+    speed: Optional[float] = None  # media seconds per wall-clock second
+    frames: int = 0
+    dropped_frames: int = 0
+    duplicated_frames: int = 0
+    media_time: float = 0.0  # seconds of media written
+    last_packet_at: Optional[float] = None  # wall-clock time of the last data
 
 
 class IRecorder(ABC):
     """Interface for recording implementations."""
 
+    # Extension of the files the recorder produces
+    file_extension = ".mp4"
+
+    # Path of the file being written; segments are named after it
+    output_path = None
+
+    # SegmentManifest of the current recording when writing segments
+    manifest = None
+
+    @property
+    def bytes_written(self) -> int:
+        """Bytes of media written so far; used to detect stalled streams."""
+        return 0
+
+    def stats(self) -> RecordingStats:
+        """Snapshot of the recording's progress for monitoring."""
+        return RecordingStats(bytes_written=self.bytes_written)
+
     @abstractmethod
-    async def start_recording(self, user: str, room_id: str, output_path: str) -> None:
+    async def start_recording(self, stream_url: str, output_path: str) -> None:
         """Start recording a live stream."""
         pass
 
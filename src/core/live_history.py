@@ -0,0 +1,205 @@
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+
+import orjson
+
+from utils.logger_manager import logger
+
+DAY = 86400
+WEEK = 7 * DAY
+
+
+class LiveHistory:
+    """
+    เก็บเวลาที่ผู้ใช้แต่ละคนเริ่มไลฟ์ (wall-clock) ย้อนหลังไม่เกิน max_starts ครั้ง
+    และเวลาที่เริ่มติดตามผู้ใช้แต่ละคน พร้อม snapshot บนดิสก์เพื่อให้เรียนรู้ต่อได้หลังรีสตาร์ท
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_starts: int = 50,
+        snapshot_interval: float = 300,
+        min_gap: float = 3600,
+    ):
+        self.path = Path(path) if path else None
+        self.max_starts = max_starts
+        self.min_gap = min_gap
+        self.snapshot_interval = snapshot_interval
+
+        self._starts: Dict[str, Deque[float]] = {}
+        self._first_seen: Dict[str, float] = {}
+        self._dirty = False
+        self._last_snapshot = time.monotonic()
+
+    def record_live(self, user: str, ts: Optional[float] = None) -> None:
+        ts = ts if ts is not None else time.time()
+        starts = self._starts.get(user)
+        if starts is None:
+            starts = self._starts[user] = deque(maxlen=self.max_starts)
+        elif starts and ts - starts[-1] < self.min_gap:
+            # การเชื่อมต่อใหม่ระหว่างไลฟ์เดิมไม่นับเป็นการเริ่มไลฟ์ครั้งใหม่
+            return
+        starts.append(ts)
+
+        self._dirty = True
+        if (
+            self.path
+            and time.monotonic() - self._last_snapshot >= self.snapshot_interval
+        ):
+            self.save()
+
+    def starts(self, user: str) -> List[float]:
+        return list(self._starts.get(user, ()))
+
+    def last_live(self, user: str) -> Optional[float]:
+        starts = self._starts.get(user)
+        return starts[-1] if starts else None
+
+    def first_seen(self, user: str, ts: Optional[float] = None) -> float:
+        """เวลาที่เริ่มติดตามผู้ใช้ครั้งแรก (บันทึกเป็น ts หรือเวลาปัจจุบันหากยังไม่มี)"""
+        seen = self._first_seen.get(user)
+        if seen is None:
+            seen = self._first_seen[user] = ts if ts is not None else time.time()
+            self._dirty = True
+        return seen
+
+    def load(self) -> None:
+        if not self.path or not self.path.exists():
+            return
+
+        try:
+            raw = orjson.loads(self.path.read_bytes())
+        except Exception as e:
+            logger.warning(f"ไม่สามารถโหลดประวัติการไลฟ์จาก {self.path}: {e}")
+            return
+
+        # รูปแบบเดิมเป็น {user: [starts]} โดยตรง
+        if isinstance(raw.get("starts"), dict):
+            self._first_seen.update(raw.get("first_seen") or {})
+            raw = raw["starts"]
+        for user, starts in raw.items():
+            self._starts[user] = deque(starts, maxlen=self.max_starts)
+
+        logger.info(f"โหลดประวัติการไลฟ์ของ {len(self._starts)} ผู้ใช้จาก {self.path}")
+
+    def save(self) -> None:
+        self._last_snapshot = time.monotonic()
+        if not self.path or not self._dirty:
+            return
+
+        data = {
+            "starts": {user: list(starts) for user, starts in self._starts.items()},
+            "first_seen": self._first_seen,
+        }
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(orjson.dumps(data))
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except Exception as e:
+            logger.warning(f"ไม่สามารถบันทึกประวัติการไลฟ์ไปยัง {self.path}: {e}")
+
+
+class AdaptiveIntervalPolicy:
+    """
+    คำนวณช่วงเวลาตรวจสอบของผู้ใช้แต่ละคนจากประวัติการไลฟ์
+
+    - ช่วงเวลาที่ผู้ใช้มักเริ่มไลฟ์ (เทียบเวลาของวันจากไลฟ์ในอดีต) จะถูกตรวจถี่ขึ้นเป็น min_interval
+    - หากช่วงเวลาดังกล่าวใกล้จะมาถึง จะนัดตรวจครั้งถัดไปให้ตรงกับต้นช่วงพอดี
+    - ผู้ใช้ที่ไม่ได้ไลฟ์มานานกว่า idle_after (นับจากไลฟ์ล่าสุด หรือจากเวลาที่เริ่มติดตาม
+      หากไม่เคยเห็นไลฟ์เลย) จะถูกยืดช่วงเวลาเป็นสองเท่าทุกสัปดาห์จนถึง max_interval
+    """
+
+    def __init__(
+        self,
+        history: LiveHistory,
+        min_interval: float = 60,
+        max_interval: float = 3600,
+        hot_window: float = 1800,
+        idle_after: float = 2 * WEEK,
+        min_starts: int = 2,
+    ):
+        self.history = history
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hot_window = hot_window
+        self.idle_after = idle_after
+        self.min_starts = min_starts
+
+    @staticmethod
+    def _time_of_day(ts: float) -> float:
+        t = time.localtime(ts)
+        return t.tm_hour * 3600 + t.tm_min * 60 + t.tm_sec
+
+    def _seconds_until_window(self, user: str, now: float) -> Optional[float]:
+        """
+        คืนค่าวินาทีจนถึงช่วงเวลาเริ่มไลฟ์ที่ใกล้ที่สุด (0 = อยู่ในช่วงแล้ว)
+        หรือ None หากยังมีประวัติไม่พอ
+        """
+        starts = self.history.starts(user)
+        if len(starts) < self.min_starts:
+            return None
+
+        now_tod = self._time_of_day(now)
+        best = None
+        for ts in starts:
+            # ระยะจาก "ตอนนี้" ไปข้างหน้าจนถึงต้นช่วง (start - hot_window) แบบวนรอบวัน
+            delta = (self._time_of_day(ts) - now_tod) % DAY
+            if delta > DAY - self.hot_window or delta <= self.hot_window:
+                return 0.0
+            until = delta - self.hot_window
+            if best is None or until < best:
+                best = until
+        return best
+
+    def is_hot(self, user: str, now: Optional[float] = None) -> bool:
+        return self._seconds_until_window(user, now or time.time()) == 0.0
+
+    def interval_for(
+        self, user: str, base: float, now: Optional[float] = None
+    ) -> float:
+        now = now or time.time()
+
+        until_window = self._seconds_until_window(user, now)
+        if until_window == 0.0:
+            return self.min_interval
+
+        interval = base
+        since = self.history.last_live(user)
+        if since is None:
+            since = self.history.first_seen(user, now)
+        idle = now - since
+        if idle > self.idle_after:
+            # เพิ่มเป็นสองเท่าทุกสัปดาห์ที่ไม่ได้ไลฟ์ต่อจาก idle_after
+            weeks = min((idle - self.idle_after) / WEEK, 32)
+            interval = base * 2**weeks
+
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        if until_window is not None:
+            interval = min(interval, max(until_window, self.min_interval))
+        return interval
+
+
+_live_history: Optional[LiveHistory] = None
+
+
+def configure_live_history(**kwargs) -> LiveHistory:
+    """
+    สร้างประวัติการไลฟ์ที่ใช้ร่วมกันทั้ง process และโหลด snapshot จากดิสก์
+    """
+    global _live_history
+    _live_history = LiveHistory(**kwargs)
+    _live_history.load()
+    return _live_history
+
+
+def get_live_history() -> LiveHistory:
+    global _live_history
+    if _live_history is None:
+        _live_history = LiveHistory()
+    return _live_history
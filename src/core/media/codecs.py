@@ -0,0 +1,178 @@
+from dataclasses import dataclass
+from typing import Tuple
+
+AAC_SAMPLE_RATES = (
+    96000,
+    88200,
+    64000,
+    48000,
+    44100,
+    32000,
+    24000,
+    22050,
+    16000,
+    12000,
+    11025,
+    8000,
+    7350,
+)
+
+# profile_idc values whose SPS carries chroma format and scaling lists
+_HIGH_PROFILES = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135}
+
+
+class UnsupportedCodecError(ValueError):
+    """The stream uses a codec the in-process remuxer cannot handle."""
+
+
+@dataclass
+class VideoConfig:
+    """AVCDecoderConfigurationRecord plus the values the MP4 header needs."""
+
+    record: bytes
+    width: int
+    height: int
+
+
+@dataclass
+class AudioConfig:
+    """AAC AudioSpecificConfig plus the values the MP4 header needs."""
+
+    record: bytes
+    sample_rate: int
+    channels: int
+
+
+class _BitReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def bits(self, count: int) -> int:
+        value = 0
+        for _ in range(count):
+            byte = self.data[self.pos >> 3]
+            value = (value << 1) | ((byte >> (7 - (self.pos & 7))) & 1)
+            self.pos += 1
+        return value
+
+    def ue(self) -> int:
+        """Unsigned Exp-Golomb code."""
+        zeros = 0
+        while self.bits(1) == 0:
+            zeros += 1
+        return (1 << zeros) - 1 + self.bits(zeros)
+
+    def se(self) -> int:
+        """Signed Exp-Golomb code."""
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def _unescape_rbsp(nal: bytes) -> bytes:
+    """Drop the emulation prevention bytes (00 00 03 -> 00 00)."""
+    out = bytearray()
+    zeros = 0
+    for byte in nal:
+        if zeros >= 2 and byte == 3:
+            zeros = 0
+            continue
+        out.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+    return bytes(out)
+
+
+def _skip_scaling_list(reader: _BitReader, size: int) -> None:
+    last = next_scale = 8
+    for _ in range(size):
+        if next_scale != 0:
+            next_scale = (last + reader.se() + 256) % 256
+        last = next_scale if next_scale != 0 else last
+
+
+def parse_sps_dimensions(sps: bytes) -> Tuple[int, int]:
+    """Display width and height coded in an H.264 sequence parameter set."""
+    reader = _BitReader(_unescape_rbsp(sps[1:]))  # skip the NAL header
+    profile_idc = reader.bits(8)
+    reader.bits(16)  # constraint flags, level_idc
+    reader.ue()  # seq_parameter_set_id
+
+    chroma_format_idc = 1
+    if profile_idc in _HIGH_PROFILES:
+        chroma_format_idc = reader.ue()
+        if chroma_format_idc == 3:
+            reader.bits(1)  # separate_colour_plane_flag
+        reader.ue()  # bit_depth_luma_minus8
+        reader.ue()  # bit_depth_chroma_minus8
+        reader.bits(1)  # qpprime_y_zero_transform_bypass_flag
+        if reader.bits(1):  # seq_scaling_matrix_present_flag
+            for i in range(8 if chroma_format_idc != 3 else 12):
+                if reader.bits(1):
+                    _skip_scaling_list(reader, 16 if i < 6 else 64)
+
+    reader.ue()  # log2_max_frame_num_minus4
+    pic_order_cnt_type = reader.ue()
+    if pic_order_cnt_type == 0:
+        reader.ue()
+    elif pic_order_cnt_type == 1:
+        reader.bits(1)
+        reader.se()
+        reader.se()
+        for _ in range(reader.ue()):
+            reader.se()
+
+    reader.ue()  # max_num_ref_frames
+    reader.bits(1)  # gaps_in_frame_num_value_allowed_flag
+    width_mbs = reader.ue() + 1
+    height_map_units = reader.ue() + 1
+    frame_mbs_only = reader.bits(1)
+    if not frame_mbs_only:
+        reader.bits(1)  # mb_adaptive_frame_field_flag
+    reader.bits(1)  # direct_8x8_inference_flag
+
+    width = width_mbs * 16
+    height = (2 - frame_mbs_only) * height_map_units * 16
+    if reader.bits(1):  # frame_cropping_flag
+        left, right, top, bottom = reader.ue(), reader.ue(), reader.ue(), reader.ue()
+        # SubWidthC / SubHeightC of the chroma format (4:0:0 crops in luma units)
+        crop_x = 2 if chroma_format_idc in (1, 2) else 1
+        crop_y = (2 if chroma_format_idc == 1 else 1) * (2 - frame_mbs_only)
+        width -= (left + right) * crop_x
+        height -= (top + bottom) * crop_y
+    return width, height
+
+
+def parse_avc_config(record: bytes) -> VideoConfig:
+    """Parse an AVCDecoderConfigurationRecord (the FLV AVC sequence header)."""
+    if len(record) < 8 or record[0] != 1:
+        raise UnsupportedCodecError("Invalid AVC decoder configuration record")
+
+    width = height = 0
+    if record[5] & 0x1F:
+        sps_length = int.from_bytes(record[6:8], "big")
+        try:
+            width, height = parse_sps_dimensions(record[8 : 8 + sps_length])
+        except IndexError:
+            pass  # truncated SPS; players read the size from avcC anyway
+    return VideoConfig(record=bytes(record), width=width, height=height)
+
+
+def parse_audio_specific_config(record: bytes) -> AudioConfig:
+    """Parse an AAC AudioSpecificConfig (the FLV AAC sequence header)."""
+    if len(record) < 2:
+        raise UnsupportedCodecError("Invalid AAC AudioSpecificConfig")
+
+    reader = _BitReader(bytes(record))
+    object_type = reader.bits(5)
+    if object_type == 31:
+        object_type = 32 + reader.bits(6)
+    frequency_index = reader.bits(4)
+    if frequency_index == 15:
+        sample_rate = reader.bits(24)
+    elif frequency_index < len(AAC_SAMPLE_RATES):
+        sample_rate = AAC_SAMPLE_RATES[frequency_index]
+    else:
+        raise UnsupportedCodecError(f"Invalid AAC frequency index {frequency_index}")
+    channels = reader.bits(4) or 2
+
+    return AudioConfig(record=bytes(record), sample_rate=sample_rate, channels=channels)
@@ -0,0 +1,161 @@
+from typing import List, Optional
+
+FLV_HEADER_SIZE = 9
+PREV_TAG_SIZE = 4
+TAG_HEADER_SIZE = 11
+
+TAG_AUDIO = 8
+TAG_VIDEO = 9
+TAG_SCRIPT = 18
+
+VIDEO_CODEC_AVC = 7
+VIDEO_FRAME_KEY = 1
+AUDIO_FORMAT_AAC = 10
+
+
+class FlvTag:
+    """
+    One FLV tag. ``raw`` spans the 11-byte header, the payload and the
+    trailing PreviousTagSize field; ``data`` is the payload only. Both are
+    memoryviews into the chunk the tag was parsed from, so they stay valid
+    for as long as the caller keeps them, without copying the payload.
+    """
+
+    __slots__ = ("tag_type", "timestamp", "raw", "data")
+
+    def __init__(self, tag_type: int, timestamp: int, raw: memoryview):
+        self.tag_type = tag_type
+        self.timestamp = timestamp
+        self.raw = raw
+        self.data = raw[TAG_HEADER_SIZE : len(raw) - PREV_TAG_SIZE]
+
+    @property
+    def is_video(self) -> bool:
+        return self.tag_type == TAG_VIDEO
+
+    @property
+    def is_audio(self) -> bool:
+        return self.tag_type == TAG_AUDIO
+
+    @property
+    def is_script(self) -> bool:
+        return self.tag_type == TAG_SCRIPT
+
+    @property
+    def is_keyframe(self) -> bool:
+        return (
+            self.is_video
+            and len(self.data) > 0
+            and self.data[0] >> 4 == VIDEO_FRAME_KEY
+        )
+
+    @property
+    def is_sequence_header(self) -> bool:
+        """AVC decoder configuration or AAC AudioSpecificConfig."""
+        if len(self.data) < 2:
+            return False
+        if self.is_video:
+            return self.data[0] & 0x0F == VIDEO_CODEC_AVC and self.data[1] == 0
+        if self.is_audio:
+            return self.data[0] >> 4 == AUDIO_FORMAT_AAC and self.data[1] == 0
+        return False
+
+    def with_timestamp(self, timestamp: int) -> bytes:
+        """The 11-byte tag header rewritten with a new timestamp."""
+        header = bytearray(self.raw[:TAG_HEADER_SIZE])
+        header[4:7] = (timestamp & 0xFFFFFF).to_bytes(3, "big")
+        header[7] = (timestamp >> 24) & 0xFF
+        return bytes(header)
+
+
+class FlvParser:
+    """
+    Incremental FLV demuxer.
+
+    Tags that lie entirely inside a fed chunk are returned as memoryview
+    slices of that chunk. Only a tag that straddles two chunks is
+    assembled in a small side buffer, so steady-state parsing copies just
+    the bytes at chunk boundaries.
+    """
+
+    def __init__(self):
+        self.header: Optional[bytes] = None
+        self._pending = bytearray()
+
+    def _pending_target(self) -> int:
+        """Total size of the item currently being assembled in _pending."""
+        if self.header is None:
+            return FLV_HEADER_SIZE + PREV_TAG_SIZE
+        if len(self._pending) < TAG_HEADER_SIZE:
+            return TAG_HEADER_SIZE
+        size = int.from_bytes(self._pending[1:4], "big")
+        return TAG_HEADER_SIZE + size + PREV_TAG_SIZE
+
+    def _take_header(self, view: memoryview) -> None:
+        if bytes(view[:3]) != b"FLV":
+            raise ValueError("Not an FLV stream")
+        data_offset = int.from_bytes(view[5:9], "big")
+        self.header = bytes(view[:FLV_HEADER_SIZE])
+        if data_offset != FLV_HEADER_SIZE:
+            raise ValueError(f"Unsupported FLV header size {data_offset}")
+
+    @staticmethod
+    def _make_tag(raw: memoryview) -> FlvTag:
+        timestamp = int.from_bytes(raw[4:7], "big") | (raw[7] << 24)
+        return FlvTag(raw[0] & 0x1F, timestamp, raw)
+
+    def feed(self, chunk) -> List[FlvTag]:
+        view = memoryview(chunk)
+        tags: List[FlvTag] = []
+
+        # Finish whatever straddled the previous chunk boundary
+        while self._pending and len(view):
+            target = self._pending_target()
+            take = target - len(self._pending)
+            self._pending += view[:take]
+            view = view[take:]
+
+            if len(self._pending) < target:
+                return tags
+            if self._pending_target() != target:
+                # Tag header just completed; now we know the full tag size
+                continue
+
+            item = memoryview(bytes(self._pending))
+            self._pending = bytearray()
+            if self.header is None:
+                self._take_header(item)
+            else:
+                tags.append(self._make_tag(item))
+
+        pos = 0
+        end = len(view)
+        if self.header is None:
+            if end < FLV_HEADER_SIZE + PREV_TAG_SIZE:
+                self._pending += view
+                return tags
+            self._take_header(view)
+            pos = FLV_HEADER_SIZE + PREV_TAG_SIZE
+
+        while end - pos >= TAG_HEADER_SIZE:
+            size = int.from_bytes(view[pos + 1 : pos + 4], "big")
+            tag_end = pos + TAG_HEADER_SIZE + size + PREV_TAG_SIZE
+            if tag_end > end:
+                break
+            tags.append(self._make_tag(view[pos:tag_end]))
+            pos = tag_end
+
+        if pos < end:
+            self._pending += view[pos:]
+        return tags
+
+
+def flv_file_header(has_audio: bool = True, has_video: bool = True) -> bytes:
+    """FLV signature plus PreviousTagSize0, as written at the start of a file."""
+    flags = (0x04 if has_audio else 0) | (0x01 if has_video else 0)
+    return (
+        b"FLV\x01"
+        + bytes([flags])
+        + FLV_HEADER_SIZE.to_bytes(4, "big")
+        + b"\x00\x00\x00\x00"
+    )
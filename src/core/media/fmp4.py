@@ -0,0 +1,433 @@
+import struct
+from typing import List, Optional, Tuple
+
+from core.media.codecs import (
+    AudioConfig,
+    UnsupportedCodecError,
+    VideoConfig,
+    parse_audio_specific_config,
+    parse_avc_config,
+)
+from core.media.flv import AUDIO_FORMAT_AAC, VIDEO_CODEC_AVC, FlvTag
+
+VIDEO_TRACK_ID = 1
+AUDIO_TRACK_ID = 2
+VIDEO_TIMESCALE = 90000
+AAC_FRAME_SAMPLES = 1024
+
+# trun flags
+_DATA_OFFSET = 0x000001
+_SAMPLE_DURATION = 0x000100
+_SAMPLE_SIZE = 0x000200
+_SAMPLE_FLAGS = 0x000400
+_SAMPLE_CTS = 0x000800
+# tfhd flags
+_DEFAULT_BASE_IS_MOOF = 0x020000
+
+_SYNC_SAMPLE = 0x02000000  # sample_depends_on = 2 (I-frame)
+_NON_SYNC_SAMPLE = 0x01010000  # depends on others, sample_is_non_sync_sample
+
+_MATRIX = struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+
+
+def _box(kind: bytes, *payload: bytes) -> bytes:
+    body = b"".join(payload)
+    return struct.pack(">I", 8 + len(body)) + kind + body
+
+
+def _full_box(kind: bytes, version: int, flags: int, *payload: bytes) -> bytes:
+    return _box(kind, struct.pack(">I", (version << 24) | flags), *payload)
+
+
+def _descriptor(tag: int, *payload: bytes) -> bytes:
+    body = b"".join(payload)
+    # Always use the 4-byte size form so large payloads need no special case
+    size = len(body)
+    return (
+        bytes(
+            [
+                tag,
+                0x80 | (size >> 21) & 0x7F,
+                0x80 | (size >> 14) & 0x7F,
+                0x80 | (size >> 7) & 0x7F,
+                size & 0x7F,
+            ]
+        )
+        + body
+    )
+
+
+def _track(
+    track_id: int, handler: bytes, timescale: int, header: bytes, entry: bytes
+) -> bytes:
+    is_audio = handler == b"soun"
+    width, height = (0, 0) if is_audio else struct.unpack(">HH", entry[32:36])
+
+    tkhd = _full_box(
+        b"tkhd",
+        0,
+        0x3,  # enabled, in movie
+        struct.pack(">IIIII", 0, 0, track_id, 0, 0),
+        bytes(8),
+        struct.pack(">hhhH", 0, 0, 0x0100 if is_audio else 0, 0),
+        _MATRIX,
+        struct.pack(">II", width << 16, height << 16),
+    )
+    mdhd = _full_box(
+        b"mdhd", 0, 0, struct.pack(">IIIIHH", 0, 0, timescale, 0, 0x55C4, 0)
+    )
+    name = b"SoundHandler\0" if is_audio else b"VideoHandler\0"
+    hdlr = _full_box(b"hdlr", 0, 0, struct.pack(">I4s", 0, handler), bytes(12), name)
+    dinf = _box(
+        b"dinf",
+        _full_box(b"dref", 0, 0, struct.pack(">I", 1), _full_box(b"url ", 0, 1)),
+    )
+    stbl = _box(
+        b"stbl",
+        _full_box(b"stsd", 0, 0, struct.pack(">I", 1), entry),
+        _full_box(b"stts", 0, 0, struct.pack(">I", 0)),
+        _full_box(b"stsc", 0, 0, struct.pack(">I", 0)),
+        _full_box(b"stsz", 0, 0, struct.pack(">II", 0, 0)),
+        _full_box(b"stco", 0, 0, struct.pack(">I", 0)),
+    )
+    minf = _box(b"minf", header, dinf, stbl)
+    return _box(b"trak", tkhd, _box(b"mdia", mdhd, hdlr, minf))
+
+
+def _avc1_entry(config: VideoConfig) -> bytes:
+    return _box(
+        b"avc1",
+        bytes(6),
+        struct.pack(">H", 1),  # data_reference_index
+        bytes(16),
+        struct.pack(">HH", config.width, config.height),
+        struct.pack(">II", 0x00480000, 0x00480000),  # 72 dpi
+        bytes(4),
+        struct.pack(">H", 1),  # frame_count
+        bytes(32),  # compressorname
+        struct.pack(">Hh", 0x0018, -1),
+        _box(b"avcC", config.record),
+    )
+
+
+def _mp4a_entry(config: AudioConfig) -> bytes:
+    esds = _full_box(
+        b"esds",
+        0,
+        0,
+        _descriptor(
+            0x03,  # ES_Descriptor
+            struct.pack(">HB", AUDIO_TRACK_ID, 0),
+            _descriptor(
+                0x04,  # DecoderConfigDescriptor
+                # MPEG-4 audio, audio stream, buffer size and bitrates unknown
+                struct.pack(">BB3sII", 0x40, 0x15, bytes(3), 0, 0),
+                _descriptor(0x05, config.record),
+            ),
+            _descriptor(0x06, b"\x02"),  # SLConfigDescriptor
+        ),
+    )
+    return _box(
+        b"mp4a",
+        bytes(6),
+        struct.pack(">H", 1),  # data_reference_index
+        bytes(8),
+        struct.pack(">HHHH", config.channels, 16, 0, 0),
+        struct.pack(">I", (config.sample_rate & 0xFFFF) << 16),
+        esds,
+    )
+
+
+def init_segment(video: Optional[VideoConfig], audio: Optional[AudioConfig]) -> bytes:
+    """ftyp + moov describing the tracks of a fragmented MP4 file."""
+    ftyp = _box(b"ftyp", b"isom", struct.pack(">I", 0x200), b"isomiso6iso2avc1mp41")
+    mvhd = _full_box(
+        b"mvhd",
+        0,
+        0,
+        struct.pack(">IIIIIH", 0, 0, 1000, 0, 0x00010000, 0x0100),
+        bytes(10),
+        _MATRIX,
+        bytes(24),
+        struct.pack(">I", AUDIO_TRACK_ID + 1),
+    )
+
+    traks = []
+    trexs = []
+    if video is not None:
+        vmhd = _full_box(b"vmhd", 0, 1, bytes(8))
+        traks.append(
+            _track(VIDEO_TRACK_ID, b"vide", VIDEO_TIMESCALE, vmhd, _avc1_entry(video))
+        )
+        trexs.append(VIDEO_TRACK_ID)
+    if audio is not None:
+        smhd = _full_box(b"smhd", 0, 0, bytes(4))
+        traks.append(
+            _track(AUDIO_TRACK_ID, b"soun", audio.sample_rate, smhd, _mp4a_entry(audio))
+        )
+        trexs.append(AUDIO_TRACK_ID)
+
+    mvex = _box(
+        b"mvex",
+        *(
+            _full_box(b"trex", 0, 0, struct.pack(">IIIII", track_id, 1, 0, 0, 0))
+            for track_id in trexs
+        ),
+    )
+    return ftyp + _box(b"moov", mvhd, *traks, mvex)
+
+
+class FragmentedMp4Muxer:
+    """
+    Streaming FLV (H.264/AAC) to fragmented MP4 remuxer.
+
+    Tags are fed one at a time; ``feed`` returns the buffers that are ready
+    to be written, in order: the init segment once the codec configuration
+    is known, then one moof/mdat fragment per GOP. Sample payloads are
+    returned as the memoryviews held by the FLV tags, so media data is
+    never copied here, and at most one fragment is held in memory.
+    """
+
+    # A fragment is cut early when a GOP grows past these limits
+    MAX_FRAGMENT_DURATION = 2000  # ms, also paces audio-only streams
+    MAX_FRAGMENT_BYTES = 8 << 20
+    # How long to wait for the sequence header of a track announced in the
+    # FLV header before writing the init segment without it
+    INIT_WAIT = 5000  # ms
+
+    def __init__(
+        self, has_video: bool = True, has_audio: bool = True, base_timestamp: int = 0
+    ):
+        self.has_video = has_video
+        self.has_audio = has_audio
+        self.video: Optional[VideoConfig] = None
+        self.audio: Optional[AudioConfig] = None
+
+        self.fragments = 0
+        self._base_timestamp = base_timestamp
+        self._initialized = False
+        self._sequence = 0
+        self._reset_timeline()
+
+    def _reset_timeline(self) -> None:
+        # (dts ms, cts ms, keyframe, payload)
+        self._video: List[Tuple[int, int, bool, memoryview]] = []
+        # (dts ms, payload)
+        self._audio: List[Tuple[int, memoryview]] = []
+        self._pending_bytes = 0
+        self._video_time: Optional[int] = None  # next decode time, ticks
+        self._audio_time: Optional[int] = None  # next decode time, samples
+        self._last_video_duration = VIDEO_TIMESCALE // 30
+        self._seen_keyframe = False
+
+    def restart(self, base_timestamp: int) -> None:
+        """
+        Start a new output file: the next buffers begin with an init segment
+        and timestamps are rebased to ``base_timestamp``. Call ``flush``
+        first so nothing pending is lost.
+        """
+        self._base_timestamp = base_timestamp
+        self._initialized = False
+        self._sequence = 0
+        self._reset_timeline()
+
+    def feed(self, tag: FlvTag) -> list:
+        out = []
+        data = tag.data
+        timestamp = max(0, tag.timestamp - self._base_timestamp)
+
+        if tag.is_video and len(data) >= 5:
+            codec = data[0] & 0x0F
+            if codec != VIDEO_CODEC_AVC:
+                raise UnsupportedCodecError(f"Unsupported FLV video codec id {codec}")
+            if data[1] == 0:
+                # Like ffmpeg -c copy, a changed configuration mid-stream
+                # keeps the one already written to the init segment
+                if not self._initialized:
+                    self.video = parse_avc_config(data[5:])
+            elif data[1] == 1 and self._accepts("video"):
+                keyframe = tag.is_keyframe
+                if not self._seen_keyframe and not keyframe:
+                    return out  # cannot decode before the first keyframe
+                self._seen_keyframe = True
+
+                if self._initialized and self._video and (keyframe or self._full()):
+                    out += self._fragment(next_video_dts=timestamp)
+                cts = int.from_bytes(data[2:5], "big", signed=True)
+                payload = data[5:]
+                self._video.append((timestamp, cts, keyframe, payload))
+                self._pending_bytes += len(payload)
+
+        elif tag.is_audio and len(data) >= 2:
+            audio_format = data[0] >> 4
+            if audio_format != AUDIO_FORMAT_AAC:
+                raise UnsupportedCodecError(
+                    f"Unsupported FLV audio format {audio_format}"
+                )
+            if data[1] == 0:
+                if not self._initialized:
+                    self.audio = parse_audio_specific_config(data[2:])
+            elif self._accepts("audio"):
+                payload = data[2:]
+                self._audio.append((timestamp, payload))
+                self._pending_bytes += len(payload)
+                if self._initialized and not self._video and self._full():
+                    out += self._fragment()
+
+        if not self._initialized:
+            out += self._try_initialize(timestamp)
+        return out
+
+    def flush(self, next_timestamp: Optional[int] = None) -> list:
+        """Emit everything still pending as a final fragment."""
+        if not self._initialized:
+            return []
+        if next_timestamp is not None:
+            next_timestamp = max(0, next_timestamp - self._base_timestamp)
+        return self._fragment(next_video_dts=next_timestamp)
+
+    def _accepts(self, track: str) -> bool:
+        if not self._initialized:
+            return True
+        return (self.video if track == "video" else self.audio) is not None
+
+    def _full(self) -> bool:
+        if self._pending_bytes >= self.MAX_FRAGMENT_BYTES:
+            return True
+        pending = self._video or self._audio
+        last = self._video[-1][0] if self._video else self._audio[-1][0]
+        return last - pending[0][0] >= self.MAX_FRAGMENT_DURATION
+
+    def _try_initialize(self, timestamp: int) -> list:
+        waiting = (self.has_video and self.video is None) or (
+            self.has_audio and self.audio is None
+        )
+        if waiting:
+            first = min(
+                self._video[0][0] if self._video else timestamp,
+                self._audio[0][0] if self._audio else timestamp,
+            )
+            if timestamp - first < self.INIT_WAIT:
+                return []
+            if self.video is None and self.audio is None:
+                # Nothing decodable yet; do not hold on to the samples
+                self._reset_timeline()
+                return []
+
+        self._initialized = True
+        if self.video is None:
+            self._video.clear()
+        if self.audio is None:
+            self._audio.clear()
+        self._pending_bytes = sum(len(s[-1]) for s in self._video) + sum(
+            len(s[-1]) for s in self._audio
+        )
+        return [init_segment(self.video, self.audio)]
+
+    def _video_run(self, next_dts: Optional[int]) -> Tuple[bytes, int, list]:
+        samples = self._video
+        durations = []
+        for i, sample in enumerate(samples):
+            following = samples[i + 1][0] if i + 1 < len(samples) else next_dts
+            if following is None or following <= sample[0]:
+                duration = self._last_video_duration
+            else:
+                duration = (following - sample[0]) * (VIDEO_TIMESCALE // 1000)
+            durations.append(duration)
+            self._last_video_duration = duration
+
+        if self._video_time is None:
+            self._video_time = samples[0][0] * (VIDEO_TIMESCALE // 1000)
+        decode_time = self._video_time
+        self._video_time += sum(durations)
+
+        entries = []
+        for (_, cts, keyframe, payload), duration in zip(samples, durations):
+            entries += (
+                duration,
+                len(payload),
+                _SYNC_SAMPLE if keyframe else _NON_SYNC_SAMPLE,
+                cts * (VIDEO_TIMESCALE // 1000),
+            )
+        body = struct.pack(">" + "IIIi" * len(samples), *entries)
+        return body, decode_time, [payload for *_, payload in samples]
+
+    def _audio_run(self) -> Tuple[bytes, int, list]:
+        samples = self._audio
+        rate = self.audio.sample_rate
+        actual = samples[0][0] * rate // 1000
+        # Keep a gapless timeline unless the stream itself jumped
+        if self._audio_time is None or abs(self._audio_time - actual) > rate // 10:
+            self._audio_time = actual
+        decode_time = self._audio_time
+        self._audio_time += AAC_FRAME_SAMPLES * len(samples)
+
+        entries = []
+        for _, payload in samples:
+            entries += (AAC_FRAME_SAMPLES, len(payload))
+        body = struct.pack(">" + "II" * len(samples), *entries)
+        return body, decode_time, [payload for _, payload in samples]
+
+    def _fragment(self, next_video_dts: Optional[int] = None) -> list:
+        runs = []
+        if self._video:
+            body, decode_time, payloads = self._video_run(next_video_dts)
+            flags = _DATA_OFFSET | _SAMPLE_DURATION | _SAMPLE_SIZE
+            flags |= _SAMPLE_FLAGS | _SAMPLE_CTS
+            runs.append((VIDEO_TRACK_ID, 1, flags, body, decode_time, payloads))
+        if self._audio:
+            body, decode_time, payloads = self._audio_run()
+            flags = _DATA_OFFSET | _SAMPLE_DURATION | _SAMPLE_SIZE
+            runs.append((AUDIO_TRACK_ID, 0, flags, body, decode_time, payloads))
+        self._video = []
+        self._audio = []
+        self._pending_bytes = 0
+        if not runs:
+            return []
+
+        self._sequence += 1
+        self.fragments += 1
+
+        def build_moof(offsets: List[int]) -> bytes:
+            trafs = []
+            for (track_id, version, flags, body, decode_time, payloads), offset in zip(
+                runs, offsets
+            ):
+                trafs.append(
+                    _box(
+                        b"traf",
+                        _full_box(
+                            b"tfhd",
+                            0,
+                            _DEFAULT_BASE_IS_MOOF,
+                            struct.pack(">I", track_id),
+                        ),
+                        _full_box(b"tfdt", 1, 0, struct.pack(">Q", decode_time)),
+                        _full_box(
+                            b"trun",
+                            version,
+                            flags,
+                            struct.pack(">Ii", len(payloads), offset),
+                            body,
+                        ),
+                    )
+                )
+            return _box(
+                b"moof",
+                _full_box(b"mfhd", 0, 0, struct.pack(">I", self._sequence)),
+                *trafs,
+            )
+
+        # Sizes do not depend on the offsets, so build once to measure
+        moof_size = len(build_moof([0] * len(runs)))
+        offsets = []
+        position = moof_size + 8  # samples start after the mdat header
+        buffers: list = []
+        for run in runs:
+            offsets.append(position)
+            for payload in run[-1]:
+                position += len(payload)
+                buffers.append(payload)
+
+        mdat_size = position - moof_size
+        return [build_moof(offsets), struct.pack(">I4s", mdat_size, b"mdat"), *buffers]
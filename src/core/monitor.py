@@ -44,18 +44,16 @@ class Monitor:
                     output_path = str(Path(config.output_dir) / filename)
 
                     # Notify Start
-                    await event_bus.publish(
-                        Events.RECORDING_STARTED,
-                        {"user": self.user, "filename": filename},
+                    event_bus.publish(
+                        Events.RECORDING_STARTED, self.user, filename=filename
                     )
 
                     # Start Recording (waits until finished)
                     await self.recorder.start_recording(self.user, room_id, output_path)
 
                     # Notify Finish
-                    await event_bus.publish(
-                        Events.RECORDING_FINISHED,
-                        {"user": self.user, "output_path": output_path},
+                    event_bus.publish(
+                        Events.RECORDING_FINISHED, self.user, output_path=output_path
                     )
 
                     # Wait a bit before checking again to avoid spam if stream just ended
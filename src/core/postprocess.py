@@ -0,0 +1,405 @@
+"""
+Post-processing of finished recordings.
+
+A finished recording becomes a job that runs a chain of steps (remux,
+faststart, thumbnail, hash, transcode or a custom command) in order. The
+output of one step is the input of the next. Jobs run in a small pool:
+
+- ffmpeg steps run as separate, niced processes in their own session, so
+  Ctrl+C does not cut them short.
+- Hashing runs in a thread.
+- A job only starts while the load average per CPU is below max_load.
+
+Heavy post-work therefore yields to the live captures.
+
+Pending jobs are kept in a JSON file that is rewritten after every step.
+After a restart, an interrupted job continues with the step it was on.
+Every step writes to a temporary file and renames it at the end, so
+running a step again is safe.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import os
+import shlex
+import shutil
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import orjson
+
+from core.events import Events, event_bus
+from utils.custom_exceptions import PostProcessError
+from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+from utils.signals import stop_event
+
+JOBS = REGISTRY.counter(
+    "post_process_steps_total", "Post-processing steps run", ["step", "result"]
+)
+QUEUE_LENGTH = REGISTRY.gauge(
+    "post_process_queue_length", "Post-processing jobs waiting or running"
+)
+
+# Built-in steps; anything else must be "exec:<command>"
+STEPS = ("remux", "faststart", "thumbnail", "hash", "transcode")
+
+DEFAULT_TRANSCODE_ARGS = "-c:v libx264 -preset veryfast -crf 26 -c:a copy"
+
+
+@dataclass
+class Job:
+    id: int
+    user: str
+    path: str  # input of the next step
+    steps: List[str]  # steps still to run, the first one is next
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+    source: str = ""  # the recording as it was submitted
+
+
+def is_valid_step(step: str) -> bool:
+    if step in STEPS:
+        return True
+    if not step.startswith("exec:"):
+        return False
+    try:
+        return bool(shlex.split(step[5:]))
+    except ValueError:  # unbalanced quotes
+        return False
+
+
+def _tmp_path(path: Path, suffix: Optional[str] = None) -> Path:
+    suffix = suffix or path.suffix
+    return path.with_name(f"{path.stem}.processing{suffix}")
+
+
+def _replace(tmp_path: Path, path: Path) -> None:
+    if not tmp_path.exists() or tmp_path.stat().st_size == 0:
+        raise PostProcessError(f"ffmpeg wrote no output for {path.name}")
+    os.replace(tmp_path, path)
+
+
+class PostProcessor:
+    """
+    Runs post-processing jobs for finished recordings.
+
+    At most `workers` jobs run at once. A job waits while the 1-minute
+    load average per CPU is above `max_load`. A failed step is retried up
+    to `max_attempts` times before the job is dropped. A failed step
+    leaves its input file untouched.
+    """
+
+    LOAD_CHECK_INTERVAL = 5.0
+    RETRY_DELAY = 30.0
+
+    def __init__(
+        self,
+        steps: List[str],
+        workers: Optional[int] = None,
+        max_load: Optional[float] = 0.75,
+        nice: int = 10,
+        queue_path: Optional[str] = None,
+        transcode_args: str = DEFAULT_TRANSCODE_ARGS,
+        max_attempts: int = 3,
+    ):
+        self.steps = list(steps)
+        cpus = os.cpu_count() or 1
+        self.workers = workers or max(1, cpus // 4)
+        self.max_load = max_load
+        self.nice = nice
+        self.queue_path = Path(queue_path) if queue_path else None
+        self.transcode_args = shlex.split(transcode_args)
+        self.max_attempts = max_attempts
+
+        self.handlers: Dict[str, Callable[[Path], Awaitable[Path]]] = {
+            "remux": self.remux,
+            "faststart": self.faststart,
+            "thumbnail": self.thumbnail,
+            "hash": self.hash,
+            "transcode": self.transcode,
+        }
+        for step in self.steps:
+            if not is_valid_step(step):
+                raise ValueError(
+                    f"Unknown post-processing step '{step}', choose from "
+                    + ", ".join(STEPS)
+                    + " or exec:<command>"
+                )
+
+        self._jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # -- queue -------------------------------------------------------------
+
+    def load(self) -> None:
+        """Load the jobs left over from the previous run."""
+        if not self.queue_path or not self.queue_path.exists():
+            return
+        try:
+            raw = orjson.loads(self.queue_path.read_bytes())
+            jobs = [Job(**item) for item in raw]
+        except Exception as e:
+            logger.warning(f"Could not load post-processing jobs: {e}")
+            return
+
+        for job in jobs:
+            self._jobs[job.id] = job
+        self._ids = itertools.count(max(self._jobs, default=0) + 1)
+        if jobs:
+            logger.info(f"Resuming {len(jobs)} post-processing jobs")
+
+    def save(self) -> None:
+        if not self.queue_path:
+            return
+        tmp_path = self.queue_path.with_name(self.queue_path.name + ".tmp")
+        data = [asdict(job) for job in self._jobs.values()]
+        try:
+            self.queue_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(orjson.dumps(data))
+            os.replace(tmp_path, self.queue_path)
+        except Exception as e:
+            logger.warning(f"Could not save post-processing jobs: {e}")
+
+    def submit(self, user: str, path: str) -> Optional[Job]:
+        """Queue the configured steps for a finished recording."""
+        if not self.steps or not path:
+            return None
+        if path.endswith(".manifest.json"):
+            logger.info(f"Segmented recordings are not post-processed: {path}")
+            return None
+
+        job = Job(
+            id=next(self._ids),
+            user=user,
+            path=path,
+            steps=list(self.steps),
+            source=path,
+        )
+        self._jobs[job.id] = job
+        self.save()
+        QUEUE_LENGTH.set(len(self._jobs))
+        if self._queue is not None:
+            self._queue.put_nowait(job)
+        return job
+
+    @property
+    def pending(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    # -- workers -----------------------------------------------------------
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        for job in sorted(self._jobs.values(), key=lambda job: job.id):
+            self._queue.put_nowait(job)
+        QUEUE_LENGTH.set(len(self._jobs))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Interrupt running steps; they are resumed on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.save()
+
+    def _overloaded(self) -> bool:
+        if not self.max_load or not hasattr(os, "getloadavg"):
+            return False
+        return os.getloadavg()[0] / (os.cpu_count() or 1) > self.max_load
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            while self._overloaded():
+                await asyncio.sleep(self.LOAD_CHECK_INTERVAL)
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A bad job must not take the worker down with it, nor come
+                # back after a restart
+                logger.error(f"Post-processing of {job.path} crashed: {e!r}")
+                self._jobs.pop(job.id, None)
+                self.save()
+                QUEUE_LENGTH.set(len(self._jobs))
+
+    async def _run(self, job: Job) -> None:
+        while job.steps:
+            step = job.steps[0]
+            if not os.path.exists(job.path):
+                logger.error(f"Dropping post-processing job, {job.path} is gone")
+                break
+            started = time.monotonic()
+            try:
+                output = await self._run_step(step, Path(job.path))
+            except (PostProcessError, OSError) as e:
+                JOBS.inc(step=step, result="error")
+                if stop_event.is_set():
+                    return
+                job.attempts += 1
+                if job.attempts >= self.max_attempts:
+                    logger.error(
+                        f"Post-processing of {job.path} failed at {step}, "
+                        f"giving up: {e}"
+                    )
+                    break
+                logger.warning(f"Post-processing step {step} failed, retrying: {e}")
+                self.save()
+                await asyncio.sleep(self.RETRY_DELAY * job.attempts)
+                continue
+
+            JOBS.inc(step=step, result="ok")
+            logger.info(
+                f"{step} of {os.path.basename(job.path)} done in "
+                f"{time.monotonic() - started:.1f}s"
+            )
+            job.path = str(output)
+            job.steps.pop(0)
+            job.attempts = 0
+            self.save()
+
+        if not job.steps:
+            event_bus.publish(
+                Events.POST_PROCESSED,
+                job.user,
+                source=job.source or job.path,
+                path=job.path,
+            )
+        self._jobs.pop(job.id, None)
+        self.save()
+        QUEUE_LENGTH.set(len(self._jobs))
+
+    async def _run_step(self, step: str, path: Path) -> Path:
+        if step.startswith("exec:"):
+            return await self.run_command(step[len("exec:") :], path)
+        return await self.handlers[step](path)
+
+    # -- steps -------------------------------------------------------------
+
+    def _preexec(self):
+        if self.nice and sys.platform != "win32":
+            return lambda: os.nice(self.nice)
+        return None
+
+    async def _exec(self, *args: str) -> None:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=self._preexec(),
+            # Keep Ctrl+C away from the job; stop() terminates it instead
+            start_new_session=True,
+        )
+        try:
+            _, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.terminate()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise PostProcessError(
+                f"{os.path.basename(args[0])} exited with {process.returncode}: "
+                f"{stderr.decode(errors='replace').strip()[-500:]}"
+            )
+
+    async def _ffmpeg(self, *args: str) -> None:
+        if shutil.which("ffmpeg") is None:
+            raise PostProcessError("ffmpeg is not installed")
+        await self._exec("ffmpeg", "-y", "-hide_banner", "-loglevel", "error", *args)
+
+    async def remux(self, path: Path) -> Path:
+        """FLV -> MP4 without re-encoding. The FLV is removed afterwards."""
+        if path.suffix.lower() != ".flv":
+            return path
+        output = path.with_suffix(".mp4")
+        tmp_path = _tmp_path(output)
+        await self._ffmpeg(
+            "-i", str(path), "-c", "copy", "-movflags", "+faststart", str(tmp_path)
+        )
+        _replace(tmp_path, output)
+        path.unlink()
+        return output
+
+    async def faststart(self, path: Path) -> Path:
+        """Move the MP4 index to the front so players can start right away."""
+        if path.suffix.lower() != ".mp4":
+            return path
+        tmp_path = _tmp_path(path)
+        await self._ffmpeg(
+            "-i", str(path), "-c", "copy", "-movflags", "+faststart", str(tmp_path)
+        )
+        _replace(tmp_path, path)
+        return path
+
+    async def thumbnail(self, path: Path) -> Path:
+        """Write <name>.jpg from a frame a few seconds in."""
+        output = path.with_suffix(".jpg")
+        tmp_path = _tmp_path(output)
+        await self._ffmpeg(
+            "-ss", "5", "-i", str(path), "-frames:v", "1", "-q:v", "3", str(tmp_path)
+        )
+        _replace(tmp_path, output)
+        return path
+
+    async def transcode(self, path: Path) -> Path:
+        """Re-encode to <name>.mp4 with transcode_args; the original is removed."""
+        output = path.with_suffix(".mp4")
+        tmp_path = _tmp_path(output)
+        await self._ffmpeg(
+            "-i", str(path), *self.transcode_args, "-movflags", "+faststart",
+            str(tmp_path),
+        )  # fmt: skip
+        _replace(tmp_path, output)
+        if output != path:
+            path.unlink()
+        return output
+
+    async def hash(self, path: Path) -> Path:
+        """Write the SHA-256 of the file to <name>.sha256."""
+
+        def digest() -> str:
+            sha = hashlib.sha256()
+            with open(path, "rb") as file:
+                while chunk := file.read(1024 * 1024):
+                    sha.update(chunk)
+            return sha.hexdigest()
+
+        value = await asyncio.to_thread(digest)
+        output = Path(f"{path}.sha256")
+        output.write_text(f"{value}  {path.name}\n", encoding="utf-8")
+        return path
+
+    async def run_command(self, template: str, path: Path) -> Path:
+        """Run a user command; {path} is replaced by the quoted file path."""
+        try:
+            args = shlex.split(template.replace("{path}", shlex.quote(str(path))))
+        except ValueError as e:
+            raise PostProcessError(f"invalid exec: command: {e}") from e
+        if not args:
+            raise PostProcessError("empty exec: command")
+        await self._exec(*args)
+        return path
+
+
+_post_processor: Optional[PostProcessor] = None
+
+
+def configure_post_processor(**kwargs) -> PostProcessor:
+    """Create the shared post-processor and load its pending jobs."""
+    global _post_processor
+    _post_processor = PostProcessor(**kwargs)
+    _post_processor.load()
+    return _post_processor
+
+
+def get_post_processor() -> Optional[PostProcessor]:
+    return _post_processor
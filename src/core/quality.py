@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from utils.logger_manager import logger
+
+# ระดับคุณภาพกลางที่ใช้เทียบกันได้ระหว่าง flv_pull_url และ live_core_sdk_data
+QUALITY_RANKS: Dict[str, int] = {"fullhd": 4, "hd": 3, "sd": 2, "ld": 1}
+
+# ชื่อคุณภาพใน flv_pull_url -> ระดับ
+FLV_PULL_RANKS: Dict[str, int] = {"FULL_HD1": 4, "HD1": 3, "SD2": 2, "SD1": 1}
+
+# sdk_key ใน live_core_sdk_data -> ระดับ (ao = เสียงอย่างเดียว จึงไม่ใช้)
+SDK_KEY_RANKS: Dict[str, int] = {"origin": 4, "uhd": 4, "hd": 3, "sd": 2, "ld": 1}
+
+# bitrate โดยประมาณ (kbit/s) เมื่อ TikTok ไม่ได้ระบุมาให้
+DEFAULT_BITRATES: Dict[str, int] = {"fullhd": 4000, "hd": 2000, "sd": 1000, "ld": 600}
+
+
+def quality_rank(quality: str) -> int:
+    """แปลงชื่อคุณภาพ (best, fullhd, hd, sd, ld) เป็นระดับสูงสุดที่ยอมรับ"""
+    quality = quality.lower()
+    if quality == "best":
+        return max(QUALITY_RANKS.values())
+    if quality not in QUALITY_RANKS:
+        raise ValueError(
+            f"Unknown quality '{quality}', choose from best, "
+            + ", ".join(QUALITY_RANKS)
+        )
+    return QUALITY_RANKS[quality]
+
+
+def rank_name(rank: int) -> str:
+    for name, value in QUALITY_RANKS.items():
+        if value == rank:
+            return name
+    return "unknown"
+
+
+@dataclass
+class StreamVariant:
+    """
+    สตรีมหนึ่งคุณภาพของห้องไลฟ์
+    """
+
+    name: str  # ชื่อตามที่ TikTok ใช้ เช่น FULL_HD1 หรือ sdk_key
+    url: str
+    rank: int
+    bitrate: Optional[int] = None  # kbit/s ตามที่ TikTok ระบุ (ถ้ามี)
+
+
+class QualityPolicy:
+    """
+    เลือกคุณภาพสตรีมของแต่ละการบันทึก
+
+    ผู้ใช้แต่ละคนมีคุณภาพสูงสุดที่ต้องการ (ค่าเริ่มต้นหรือกำหนดรายคน)
+    หากกำหนด budget (kbit/s) การบันทึกใหม่จะถูกลดคุณภาพลงทีละขั้น
+    จนกว่า bitrate รวมของทุกการบันทึกจะไม่เกิน budget
+    การบันทึกที่กำลังทำงานอยู่จะไม่ถูกเปลี่ยนคุณภาพ
+    """
+
+    def __init__(
+        self,
+        default: str = "best",
+        per_user: Optional[Dict[str, str]] = None,
+        budget: Optional[float] = None,
+        bitrates: Optional[Dict[str, int]] = None,
+    ):
+        self.default_rank = quality_rank(default)
+        self.per_user: Dict[str, int] = {
+            user.lstrip("@"): quality_rank(quality)
+            for user, quality in (per_user or {}).items()
+        }
+        self.budget = budget
+        self.bitrates = {**DEFAULT_BITRATES, **(bitrates or {})}
+        self._reserved: Dict[str, int] = {}
+
+    def set_user_quality(self, user: str, quality: Optional[str]) -> None:
+        """กำหนด (หรือลบเมื่อเป็น None) คุณภาพของผู้ใช้รายคน"""
+        if quality is None:
+            self.per_user.pop(user, None)
+        else:
+            self.per_user[user] = quality_rank(quality)
+
+    def estimate(self, variant: StreamVariant) -> int:
+        if variant.bitrate:
+            return variant.bitrate
+        return self.bitrates.get(rank_name(variant.rank), max(self.bitrates.values()))
+
+    @property
+    def reserved(self) -> int:
+        """bitrate รวม (kbit/s) ของการบันทึกที่กำลังทำงาน"""
+        return sum(self._reserved.values())
+
+    def choose(
+        self, user: str, variants: List[StreamVariant], max_rank: Optional[int] = None
+    ) -> Optional[StreamVariant]:
+        """
+        เลือกสตรีมให้ผู้ใช้ โดย variants ต้องเรียงจากคุณภาพสูงไปต่ำ
+        max_rank ใช้ตอนเชื่อมต่อใหม่เพื่อให้ได้คุณภาพเดิม (ไม่ตรวจ budget ซ้ำ)
+        """
+        if not variants:
+            return None
+
+        cap = max_rank or self.per_user.get(user, self.default_rank)
+        candidates = [v for v in variants if v.rank <= cap] or [variants[-1]]
+        if max_rank is not None or not self.budget:
+            return candidates[0]
+
+        available = self.budget - (self.reserved - self._reserved.get(user, 0))
+        for variant in candidates:
+            if self.estimate(variant) <= available:
+                if variant is not candidates[0]:
+                    logger.info(
+                        f"ลดคุณภาพของ {user} เป็น {variant.name} "
+                        f"เพื่อไม่ให้เกิน bandwidth budget "
+                        f"({self.reserved}/{self.budget:g} kbit/s)"
+                    )
+                return variant
+
+        lowest = candidates[-1]
+        logger.warning(
+            f"bandwidth budget เต็ม ({self.reserved}/{self.budget:g} kbit/s) "
+            f"บันทึก {user} ด้วยคุณภาพต่ำสุด {lowest.name}"
+        )
+        return lowest
+
+    def reserve(self, user: str, variant: StreamVariant) -> None:
+        self._reserved[user] = self.estimate(variant)
+
+    def release(self, user: str) -> None:
+        self._reserved.pop(user, None)
+
+
+_quality_policy: Optional[QualityPolicy] = None
+
+
+def configure_quality_policy(**kwargs) -> QualityPolicy:
+    """
+    สร้าง policy ที่ใช้ร่วมกันทั้ง process (budget เป็นของทุกการบันทึกรวมกัน)
+    """
+    global _quality_policy
+    _quality_policy = QualityPolicy(**kwargs)
+    return _quality_policy
+
+
+def get_quality_policy() -> QualityPolicy:
+    global _quality_policy
+    if _quality_policy is None:
+        _quality_policy = QualityPolicy()
+    return _quality_policy
@@ -0,0 +1,30 @@
+from typing import Optional
+
+from core.interfaces import IRecorder
+from core.recorders.segments import RotationPolicy
+from utils.enums import RecorderBackend
+
+
+def create_recorder(
+    backend: RecorderBackend = RecorderBackend.FFMPEG,
+    rotation: Optional[RotationPolicy] = None,
+    read_timeout: Optional[float] = None,
+) -> IRecorder:
+    """
+    Build a recorder for the selected backend, optionally writing segments.
+    read_timeout only applies to ffmpeg; native recorders are stopped by
+    the stall watchdog directly.
+    """
+    if backend == RecorderBackend.NATIVE:
+        from core.recorders.flv_recorder import FLVRecorder
+
+        return FLVRecorder(rotation=rotation)
+
+    if backend == RecorderBackend.NATIVE_MP4:
+        from core.recorders.mp4_recorder import MP4Recorder
+
+        return MP4Recorder(rotation=rotation)
+
+    from core.recorders.ffmpeg_recorder import FFmpegRecorder
+
+    return FFmpegRecorder(rotation=rotation, read_timeout=read_timeout)
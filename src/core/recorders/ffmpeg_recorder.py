@@ -1,17 +1,154 @@
 import asyncio
+import dataclasses
 import os
-from typing import Optional
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
 
-from core.interfaces import IRecorder
+from core.interfaces import IRecorder, RecordingStats
+from core.recorders.segments import (
+    RotationPolicy,
+    Segment,
+    SegmentManifest,
+    manifest_path,
+    segment_path,
+    segment_pattern,
+)
 from utils.logger_manager import logger
+from utils.profiling import profiled
 
 
-class FFmpegRecorder(IRecorder):
+def _to_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value: Optional[str], suffix: str = "") -> Optional[float]:
+    if value is None or not value.endswith(suffix):
+        return None
+    try:
+        return float(value[: len(value) - len(suffix)])
+    except ValueError:
+        return None
+
+
+class FFmpegProgress:
+    """
+    Parser for the key=value blocks ffmpeg writes with ``-progress``. Each
+    block ends with a ``progress=continue|end`` line.
+    """
+
     def __init__(self):
+        self.stats = RecordingStats()
+        self.finished = False
+        self._block: Dict[str, str] = {}
+
+    @profiled("FFmpegProgress.feed_line")
+    def feed_line(self, line: str) -> None:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return
+        self._block[key] = value.strip()
+        if key == "progress":
+            self._apply(self._block)
+            self._block = {}
+
+    def _apply(self, block: Dict[str, str]) -> None:
+        stats = self.stats
+        size = _to_int(block.get("total_size"))
+        out_time = _to_int(block.get("out_time_us"))
+
+        # Only count it as new data if the output actually moved on
+        if (size is not None and size > stats.bytes_written) or (
+            out_time is not None and out_time / 1e6 > stats.media_time
+        ):
+            stats.last_packet_at = time.time()
+
+        if size is not None:
+            stats.bytes_written = size
+        if out_time is not None:
+            stats.media_time = out_time / 1e6
+        stats.frames = _to_int(block.get("frame")) or stats.frames
+        stats.dropped_frames = _to_int(block.get("drop_frames")) or 0
+        stats.duplicated_frames = _to_int(block.get("dup_frames")) or 0
+        stats.bitrate = _to_float(block.get("bitrate"), "kbits/s")
+        stats.speed = _to_float(block.get("speed"), "x")
+        self.finished = block.get("progress") == "end"
+
+
+async def _read_lines(stream: asyncio.StreamReader, handle: Callable[[str], None]):
+    """Consume a pipe until EOF so ffmpeg never blocks on a full buffer."""
+    pending = b""
+    while chunk := await stream.read(65536):
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            handle(line.decode("utf-8", errors="replace").rstrip("\r"))
+    if pending:
+        handle(pending.decode("utf-8", errors="replace"))
+
+
+class FFmpegRecorder(IRecorder):
+    # How often the segment list written by ffmpeg is checked for new entries
+    SEGMENT_LIST_POLL_INTERVAL = 2.0
+    # Lines of ffmpeg's stderr kept for the error message on failure
+    STDERR_TAIL_LINES = 20
+
+    def __init__(
+        self,
+        rotation: Optional[RotationPolicy] = None,
+        read_timeout: Optional[float] = None,
+    ):
+        # Seconds without input before ffmpeg gives up by itself. Unlike a
+        # signal sent while it is blocked on a read, this still lets it
+        # write the MP4 trailer.
+        self._read_timeout = read_timeout
         self._process: Optional[asyncio.subprocess.Process] = None
         self._is_recording = False
         self._stop_event = asyncio.Event()
 
+        self._rotation = rotation if rotation and rotation.enabled else None
+        if self._rotation and not self._rotation.max_duration:
+            logger.warning(
+                "FFmpeg recorder rotates segments by duration only; "
+                "use the native recorder for size-based rotation"
+            )
+            self._rotation = None
+
+        self.output_path: Optional[str] = None
+        self.manifest: Optional[SegmentManifest] = None
+        self._segment_list_path: Optional[str] = None
+        self._segment_list_offset = 0
+        self._open_segment: Optional[Segment] = None
+        self._base_path: Optional[str] = None
+
+        self._progress = FFmpegProgress()
+        self._stderr_tail: deque = deque(maxlen=self.STDERR_TAIL_LINES)
+
+    @property
+    def bytes_written(self) -> int:
+        # ffmpeg reports what it handed to the muxer; the files on disk are
+        # the fallback when the muxer reports no size (e.g. segments)
+        return max(self._progress.stats.bytes_written, self._bytes_on_disk())
+
+    def _bytes_on_disk(self) -> int:
+        if self.manifest is None:
+            try:
+                return os.path.getsize(self.output_path) if self.output_path else 0
+            except OSError:
+                return 0
+
+        total = sum(segment.size or 0 for segment in self.manifest.segments)
+        if self._open_segment is not None:
+            total += self._segment_size(self._open_segment) or 0
+        return total
+
+    def stats(self) -> RecordingStats:
+        return dataclasses.replace(
+            self._progress.stats, bytes_written=self.bytes_written
+        )
+
     def is_recording(self) -> bool:
         return self._is_recording
 
@@ -63,31 +200,23 @@ class FFmpegRecorder(IRecorder):
         # Define tasks variables outside try block to ensure visibility in finally
         stop_task = None
         process_task = None
+        segments_task = None
+        pipes_task = None
 
         try:
+            self.output_path = output_path
+
             # Ensure directory exists
             dirname = os.path.dirname(output_path)
             if dirname:
                 os.makedirs(dirname, exist_ok=True)
 
-            cmd = [
-                "ffmpeg",
-                "-y",
-                "-hide_banner",
-                "-loglevel",
-                "error",
-                "-i",
-                stream_url,
-                "-c",
-                "copy",
-                "-f",
-                "mp4",
-                "-bsf:a",
-                "aac_adtstoasc",
-                output_path,
-            ]
-
-            logger.info(f"Starting FFmpeg recording to {output_path}")
+            cmd = self._build_command(stream_url, output_path)
+
+            if self._rotation:
+                logger.info(f"Starting FFmpeg recording in segments of {output_path}")
+            else:
+                logger.info(f"Starting FFmpeg recording to {output_path}")
 
             # Create subprocess
             self._process = await asyncio.create_subprocess_exec(
@@ -100,6 +229,12 @@ class FFmpegRecorder(IRecorder):
             # Create tasks
             stop_task = asyncio.create_task(self._stop_event.wait())
             process_task = asyncio.create_task(self._process.wait())
+            pipes_task = asyncio.gather(
+                _read_lines(self._process.stdout, self._progress.feed_line),
+                _read_lines(self._process.stderr, self._on_stderr_line),
+            )
+            if self._rotation:
+                segments_task = asyncio.create_task(self._watch_segment_list())
 
             # Wait for either stop event or process exit
             done, pending = await asyncio.wait(
@@ -110,8 +245,8 @@ class FFmpegRecorder(IRecorder):
             if process_task in done:
                 return_code = process_task.result()
                 if return_code != 0:
-                    _, stderr = await self._process.communicate()
-                    error_msg = stderr.decode() if stderr else "Unknown error"
+                    await pipes_task
+                    error_msg = "\n".join(self._stderr_tail) or "Unknown error"
                     logger.error(
                         f"FFmpeg exited with error code {return_code}: {error_msg}"
                     )
@@ -140,5 +275,134 @@ class FFmpegRecorder(IRecorder):
                 except asyncio.CancelledError:
                     pass
 
+            if pipes_task and not pipes_task.done():
+                pipes_task.cancel()
+                try:
+                    await pipes_task
+                except asyncio.CancelledError:
+                    pass
+
+            if segments_task:
+                segments_task.cancel()
+                try:
+                    await segments_task
+                except asyncio.CancelledError:
+                    pass
+                self._finish_manifest()
+
             self._is_recording = False
             self._process = None
+
+    def _on_stderr_line(self, line: str) -> None:
+        if line.strip():
+            self._stderr_tail.append(line)
+
+    def _build_command(self, stream_url: str, output_path: str) -> list:
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            # Machine-readable progress on stdout instead of the stats line
+            "-nostats",
+            "-progress",
+            "pipe:1",
+        ]
+        if self._read_timeout:
+            cmd += ["-rw_timeout", str(int(self._read_timeout * 1_000_000))]
+        cmd += ["-i", stream_url, "-c", "copy"]
+
+        if not self._rotation:
+            return cmd + ["-f", "mp4", "-bsf:a", "aac_adtstoasc", output_path]
+
+        # Fragmented MP4 segments stay playable even if ffmpeg is killed
+        # before it can finalise the file
+        self._base_path = output_path
+        self._segment_list_path = f"{os.path.splitext(output_path)[0]}.segments.csv"
+        self._segment_list_offset = 0
+        self.manifest = SegmentManifest(manifest_path(output_path))
+        self._open_segment = self.manifest.open_segment(segment_path(output_path, 1))
+
+        return cmd + [
+            "-bsf:a",
+            "aac_adtstoasc",
+            "-f",
+            "segment",
+            "-segment_time",
+            str(self._rotation.max_duration),
+            "-segment_format",
+            "mp4",
+            "-segment_format_options",
+            "movflags=+frag_keyframe+empty_moov+default_base_moof",
+            "-reset_timestamps",
+            "1",
+            "-segment_start_number",
+            "1",
+            "-segment_list",
+            self._segment_list_path,
+            "-segment_list_type",
+            "csv",
+            segment_pattern(output_path),
+        ]
+
+    async def _watch_segment_list(self) -> None:
+        """Mirror segments ffmpeg reports as finished into the manifest."""
+        while True:
+            await asyncio.sleep(self.SEGMENT_LIST_POLL_INTERVAL)
+            self._read_segment_list()
+
+    def _read_segment_list(self) -> None:
+        try:
+            with open(self._segment_list_path, "r", encoding="utf-8") as file:
+                file.seek(self._segment_list_offset)
+                lines = file.readlines()
+        except FileNotFoundError:
+            return
+
+        for line in lines:
+            if not line.endswith("\n"):
+                break  # ffmpeg is still writing this entry
+            self._segment_list_offset += len(line.encode("utf-8"))
+
+            try:
+                name, start, end = line.strip().rsplit(",", 2)
+                duration = float(end) - float(start)
+            except ValueError:
+                continue
+
+            segment = self._open_segment
+            if segment is None or segment.path != os.path.basename(name):
+                continue
+            self.manifest.close_segment(
+                segment, size=self._segment_size(segment), duration=duration
+            )
+            self._open_segment = self.manifest.open_segment(
+                segment_path(self._base_path, segment.index + 1)
+            )
+
+    def _segment_size(self, segment: Segment) -> Optional[int]:
+        path = os.path.join(os.path.dirname(self._base_path), segment.path)
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    def _finish_manifest(self) -> None:
+        self._read_segment_list()
+
+        # The last entry opened in the manifest may never have been written
+        segment = self._open_segment
+        if segment is not None:
+            size = self._segment_size(segment)
+            if size:
+                self.manifest.close_segment(segment, size=size)
+            else:
+                self.manifest.segments.remove(segment)
+            self._open_segment = None
+
+        self.manifest.finish()
+        try:
+            os.remove(self._segment_list_path)
+        except OSError:
+            pass
@@ -0,0 +1,313 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+from core.interfaces import IRecorder, RecordingStats
+from core.media.flv import FlvParser, FlvTag, TAG_HEADER_SIZE, flv_file_header
+from core.recorders.segments import (
+    RotationPolicy,
+    Segment,
+    SegmentManifest,
+    manifest_path,
+    segment_path,
+)
+from http_utils.async_http_client import AsyncHttpClient, get_shared_client
+from utils.logger_manager import logger
+from utils.profiling import profile_section
+
+# Shared by every FLVRecorder; writes for a single file are always serialised
+_writer_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="flv-writer")
+
+
+class _BufferedFile:
+    """
+    File that collects data in memory and hands large writes to the writer
+    pool, so a slow disk never stalls the event loop shared by every
+    recording. close() is synchronous so it is safe to call on cancellation.
+    """
+
+    def __init__(self, path: str, buffer_size: int):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.size = 0
+
+        self._file = open(path, "wb")
+        self._buffer = bytearray()
+        self._pending: Optional[Future] = None
+        self._pending_data = b""
+
+    @property
+    def written(self) -> int:
+        return self.size + len(self._buffer)
+
+    def append_all(self, buffers) -> None:
+        """Buffer data without writing; it lands on the next write or close."""
+        for data in buffers:
+            self._buffer += data
+
+    async def write(self, data) -> None:
+        self._buffer += data
+        if len(self._buffer) >= self.buffer_size:
+            data, self._buffer = self._buffer, bytearray()
+            self._pending_data = data
+            self._pending = _writer_pool.submit(self._file.write, data)
+            await asyncio.wrap_future(self._pending)
+            self._pending = None
+            self.size += len(data)
+
+    def close(self) -> None:
+        # A write interrupted by cancellation may still be running in the
+        # pool; let it land before appending the tail of the buffer.
+        if self._pending is not None:
+            if self._pending.cancelled():
+                self._file.write(self._pending_data)
+            else:
+                self._pending.result()
+            self.size += len(self._pending_data)
+            self._pending = None
+        if self._buffer:
+            self._file.write(self._buffer)
+            self.size += len(self._buffer)
+            self._buffer = bytearray()
+        self._file.close()
+
+
+class FLVRecorder(IRecorder):
+    """
+    Records an FLV pull URL by streaming the HTTP body straight to disk,
+    without spawning an ffmpeg process per stream.
+
+    With a rotation policy the stream is demuxed into tags and cut on video
+    keyframes into self-contained FLV segments (header, metadata and codec
+    sequence headers are repeated at the start of each one).
+    """
+
+    file_extension = ".flv"
+
+    # Bytes accumulated in memory before a write is handed to a worker thread
+    WRITE_BUFFER_SIZE = 1 << 20
+
+    def __init__(
+        self,
+        http_client: Optional[AsyncHttpClient] = None,
+        write_buffer_size: int = WRITE_BUFFER_SIZE,
+        rotation: Optional[RotationPolicy] = None,
+    ):
+        self._http_client = http_client or get_shared_client()
+        self._write_buffer_size = write_buffer_size
+        self._rotation = rotation if rotation and rotation.enabled else None
+        self._stream_task: Optional[asyncio.Task] = None
+        self._is_recording = False
+        self._stop_event = asyncio.Event()
+
+        self.output_path: Optional[str] = None
+        self.manifest: Optional[SegmentManifest] = None
+
+        self._file: Optional[_BufferedFile] = None
+        self._closed_bytes = 0
+        self._parser: Optional[FlvParser] = None
+
+        # Progress statistics
+        self._started: Optional[float] = None
+        self._first_ts: Optional[int] = None
+        self._last_packet_at: Optional[float] = None
+
+        # Segmenting state
+        self._segment: Optional[Segment] = None
+        self._segment_base_ts = 0
+        self._last_ts = 0
+        self._metadata: Optional[bytes] = None
+        self._sequence_headers: Dict[int, bytes] = {}
+
+    @property
+    def bytes_written(self) -> int:
+        return self._closed_bytes + (self._file.written if self._file else 0)
+
+    def stats(self) -> RecordingStats:
+        size = self.bytes_written
+        elapsed = time.monotonic() - self._started if self._started else 0
+        media_time = 0.0
+        if self._first_ts is not None:
+            media_time = max(0, self._last_ts - self._first_ts) / 1000
+        # Media bitrate once timestamps are known, receive rate before that
+        duration = media_time or elapsed
+        return RecordingStats(
+            bytes_written=size,
+            bitrate=size * 8 / 1000 / duration if duration else None,
+            speed=media_time / elapsed if elapsed and media_time else None,
+            media_time=media_time,
+            last_packet_at=self._last_packet_at,
+        )
+
+    @property
+    def _parses_tags(self) -> bool:
+        """Whether the stream is demuxed into tags instead of copied as is."""
+        return self._rotation is not None
+
+    def is_recording(self) -> bool:
+        return self._is_recording
+
+    async def stop_recording(self) -> None:
+        if not self._is_recording:
+            return
+
+        logger.info("Stopping recording...")
+        self._stop_event.set()
+
+    async def start_recording(self, stream_url: str, output_path: str) -> None:
+        """
+        Start recording by streaming the FLV body from the stream URL.
+        """
+        if self._is_recording:
+            logger.warning("Recording already in progress")
+            return
+
+        self._is_recording = True
+        self._stop_event.clear()
+        self._closed_bytes = 0
+        self._started = time.monotonic()
+        self._first_ts = None
+
+        stop_task = None
+        try:
+            self.output_path = str(Path(output_path).with_suffix(self.file_extension))
+
+            dirname = os.path.dirname(self.output_path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+
+            kind = self.file_extension.lstrip(".").upper()
+            if self._rotation:
+                self.manifest = SegmentManifest(manifest_path(self.output_path))
+                logger.info(
+                    f"Starting native {kind} recording in segments of "
+                    f"{self.output_path}"
+                )
+            else:
+                logger.info(f"Starting native {kind} recording to {self.output_path}")
+
+            self._stream_task = asyncio.create_task(self._stream(stream_url))
+            stop_task = asyncio.create_task(self._stop_event.wait())
+
+            done, _ = await asyncio.wait(
+                [stop_task, self._stream_task], return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if self._stream_task in done:
+                error = self._stream_task.exception()
+                if error:
+                    logger.error(f"FLV stream ended with error: {error}")
+                else:
+                    logger.info("FLV stream finished successfully")
+
+        except Exception as e:
+            logger.error(f"Error in FLVRecorder: {e}")
+        finally:
+            # Cancelling the stream task flushes and closes the file in _stream
+            for task in (stop_task, self._stream_task):
+                if task and not task.done():
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+
+            if self.manifest:
+                self.manifest.finish()
+
+            self._is_recording = False
+            self._stream_task = None
+
+    async def _stream(self, stream_url: str) -> None:
+        self._parser = parser = FlvParser() if self._parses_tags else None
+        if parser is None:
+            self._file = _BufferedFile(self.output_path, self._write_buffer_size)
+
+        try:
+            async with self._http_client.stream(stream_url) as response:
+                if response.status_code != 200:
+                    raise ConnectionError(
+                        f"Stream returned HTTP {response.status_code}"
+                    )
+
+                async for chunk in response.aiter_content():
+                    self._last_packet_at = time.time()
+                    if parser is None:
+                        await self._file.write(chunk)
+                        continue
+
+                    # Only the parse blocks the loop; writes wait on the thread pool
+                    with profile_section(f"{type(self).__name__}.parse"):
+                        tags = parser.feed(chunk)
+                    for tag in tags:
+                        if self._first_ts is None:
+                            self._first_ts = tag.timestamp
+                        await self._write_tag(tag)
+        finally:
+            self._close_file()
+
+    async def _write_tag(self, tag: FlvTag) -> None:
+        if self._file is None:
+            await self._open_output(tag.timestamp)
+        elif self._should_rotate(tag):
+            self._close_file()
+            await self._open_output(tag.timestamp)
+
+        # Remembered for the start of the next segment (copied once per stream)
+        if tag.is_script and self._metadata is None:
+            self._metadata = bytes(tag.raw)
+        elif tag.is_sequence_header:
+            self._sequence_headers[tag.tag_type] = bytes(tag.raw)
+
+        # Rebase timestamps so every segment starts at zero; only the 11-byte
+        # header is rebuilt, the payload is written straight from the chunk
+        self._last_ts = tag.timestamp
+        await self._file.write(
+            tag.with_timestamp(max(0, tag.timestamp - self._segment_base_ts))
+        )
+        await self._file.write(tag.raw[TAG_HEADER_SIZE:])
+
+    def _should_rotate(self, tag: FlvTag) -> bool:
+        return (
+            self._rotation is not None
+            and tag.is_keyframe
+            and self._rotation.should_rotate(
+                (tag.timestamp - self._segment_base_ts) / 1000, self._file.written
+            )
+        )
+
+    async def _open_output(self, base_ts: int) -> None:
+        """Open the next segment, or the single output file without rotation."""
+        if self.manifest is not None:
+            path = segment_path(self.output_path, len(self.manifest.segments) + 1)
+            self._segment = self.manifest.open_segment(path)
+        else:
+            path = self.output_path
+        self._file = _BufferedFile(path, self._write_buffer_size)
+        self._segment_base_ts = base_ts
+        await self._start_output(base_ts)
+
+    async def _start_output(self, base_ts: int) -> None:
+        await self._file.write(flv_file_header())
+        if self._metadata:
+            await self._file.write(self._metadata)
+        for header in self._sequence_headers.values():
+            await self._file.write(header)
+
+    def _close_file(self) -> None:
+        if self._file is None:
+            return
+
+        self._file.close()
+        self._closed_bytes += self._file.size
+        if self._segment is not None:
+            self.manifest.close_segment(
+                self._segment,
+                size=self._file.size,
+                duration=(self._last_ts - self._segment_base_ts) / 1000,
+            )
+        self._file = None
+        self._segment = None
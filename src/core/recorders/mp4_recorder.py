@@ -0,0 +1,62 @@
+from typing import Optional
+
+from core.media.codecs import UnsupportedCodecError
+from core.media.flv import FlvTag
+from core.media.fmp4 import FragmentedMp4Muxer
+from core.recorders.flv_recorder import FLVRecorder
+from utils.profiling import profile_section
+
+
+class MP4Recorder(FLVRecorder):
+    """
+    Native recorder that remuxes the FLV stream to fragmented MP4 in
+    process, replacing ffmpeg's ``-c copy -bsf:a aac_adtstoasc`` remux.
+
+    Every fragment is self-contained, so the file stays playable up to the
+    last complete GOP if the process dies. Only H.264 video and AAC audio
+    are supported; other codecs need the ffmpeg backend.
+    """
+
+    file_extension = ".mp4"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._muxer: Optional[FragmentedMp4Muxer] = None
+
+    @property
+    def _parses_tags(self) -> bool:
+        return True
+
+    async def _write_tag(self, tag: FlvTag) -> None:
+        if self._muxer is None:
+            flags = self._parser.header[4]
+            self._muxer = FragmentedMp4Muxer(
+                has_video=bool(flags & 0x01), has_audio=bool(flags & 0x04)
+            )
+
+        if self._file is None:
+            await self._open_output(tag.timestamp)
+        elif self._should_rotate(tag):
+            # The keyframe starting the next segment ends the last fragment
+            self._file.append_all(self._muxer.flush(tag.timestamp))
+            self._close_file()
+            await self._open_output(tag.timestamp)
+
+        self._last_ts = tag.timestamp
+        try:
+            with profile_section("MP4Recorder.mux"):
+                buffers = self._muxer.feed(tag)
+        except UnsupportedCodecError as e:
+            raise UnsupportedCodecError(
+                f"{e}; use the ffmpeg recorder for this stream"
+            ) from e
+        for buffer in buffers:
+            await self._file.write(buffer)
+
+    async def _start_output(self, base_ts: int) -> None:
+        self._muxer.restart(base_ts)
+
+    def _close_file(self) -> None:
+        if self._file is not None and self._muxer is not None:
+            self._file.append_all(self._muxer.flush())
+        super()._close_file()
@@ -0,0 +1,154 @@
+import os
+import time
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import List, Optional
+
+import orjson
+
+from core.events import Events, event_bus
+from utils.logger_manager import logger
+
+
+def segment_path(base_path: str, index: int, extension: Optional[str] = None) -> str:
+    """
+    Name of the index-th segment of a recording, e.g.
+    TK_user_2024.01.01_12-00-00.mp4 -> TK_user_2024.01.01_12-00-00_part001.mp4
+    """
+    path = Path(base_path)
+    suffix = extension or path.suffix
+    return str(path.with_name(f"{path.stem}_part{index:03d}{suffix}"))
+
+
+def segment_pattern(base_path: str, extension: Optional[str] = None) -> str:
+    """printf-style segment name pattern for ffmpeg's segment muxer."""
+    path = Path(base_path)
+    suffix = extension or path.suffix
+    return str(path.with_name(f"{path.stem}_part%03d{suffix}"))
+
+
+def reconnect_path(base_path: str, attempt: int) -> str:
+    """
+    Output name of a capture restarted after a stall, e.g.
+    TK_user_2024.01.01_12-00-00.mp4 -> TK_user_2024.01.01_12-00-00_r2.mp4
+    """
+    path = Path(base_path)
+    return str(path.with_name(f"{path.stem}_r{attempt}{path.suffix}"))
+
+
+def manifest_path(base_path: str) -> str:
+    path = Path(base_path)
+    return str(path.with_name(f"{path.stem}.manifest.json"))
+
+
+@dataclass
+class RotationPolicy:
+    """When to close the current segment and start a new one."""
+
+    max_duration: Optional[float] = None  # seconds
+    max_size: Optional[int] = None  # bytes
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_duration or self.max_size)
+
+    def should_rotate(self, duration: float, size: int) -> bool:
+        if self.max_duration and duration >= self.max_duration:
+            return True
+        if self.max_size and size >= self.max_size:
+            return True
+        return False
+
+
+@dataclass
+class Segment:
+    index: int
+    path: str
+    started_at: float
+    finished_at: Optional[float] = None
+    duration: Optional[float] = None
+    size: Optional[int] = None
+    closed: bool = False
+
+
+@dataclass
+class SegmentManifest:
+    """
+    Per-session JSON manifest listing every segment of a recording.
+
+    The file is rewritten atomically whenever a segment opens or closes, so
+    downstream tools can pick up closed segments while the live is running.
+    """
+
+    path: str
+    user: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    status: str = "recording"
+    segments: List[Segment] = field(default_factory=list)
+
+    def open_segment(self, path: str) -> Segment:
+        segment = Segment(
+            index=len(self.segments) + 1,
+            path=os.path.basename(path),
+            started_at=time.time(),
+        )
+        self.segments.append(segment)
+        self.save()
+        return segment
+
+    def close_segment(
+        self,
+        segment: Segment,
+        size: Optional[int] = None,
+        duration: Optional[float] = None,
+    ) -> None:
+        if segment.closed:
+            return
+        segment.finished_at = time.time()
+        segment.duration = (
+            duration
+            if duration is not None
+            else segment.finished_at - segment.started_at
+        )
+        segment.size = size
+        segment.closed = True
+        self.save()
+        event_bus.publish(
+            Events.SEGMENT_CLOSED,
+            self.user,
+            path=os.path.join(os.path.dirname(self.path), segment.path),
+            index=segment.index,
+            size=size,
+            duration=segment.duration,
+        )
+
+    def extend(self, other: "SegmentManifest") -> None:
+        """Append the segments of a later capture of the same session."""
+        for segment in other.segments:
+            segment.index = len(self.segments) + 1
+            self.segments.append(segment)
+        self.save()
+
+    def finish(self, status: str = "finished") -> None:
+        self.finished_at = time.time()
+        self.status = status
+        self.save()
+
+    def save(self) -> None:
+        data = asdict(self)
+        data.pop("path")
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                file.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Could not write segment manifest {self.path}: {e}")
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentManifest":
+        with open(path, "rb") as file:
+            data = orjson.loads(file.read())
+        segments = [Segment(**segment) for segment in data.pop("segments", [])]
+        return cls(path=path, segments=segments, **data)
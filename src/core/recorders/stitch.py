@@ -0,0 +1,140 @@
+import asyncio
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+from core.interfaces import IRecorder
+from core.recorders.segments import Segment, SegmentManifest, manifest_path
+from utils.logger_manager import logger
+
+
+@dataclass
+class Capture:
+    """One uninterrupted capture of a live session."""
+
+    recorder: IRecorder
+    started_at: float
+    finished_at: float
+
+
+async def concat_files(paths: List[str], output_path: str) -> bool:
+    """
+    Join files of the same format into output_path with ffmpeg's concat
+    demuxer (stream copy). The inputs are removed on success.
+    """
+    if shutil.which("ffmpeg") is None:
+        return False
+
+    output = Path(output_path)
+    list_path = output.with_name(f"{output.stem}.parts.txt")
+    tmp_path = output.with_name(f"{output.stem}.stitching{output.suffix}")
+
+    with open(list_path, "w", encoding="utf-8") as file:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            file.write(f"file '{escaped}'\n")
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            # A part cut by a stall may end in a truncated packet; the
+            # automatic bitstream filters would abort on it
+            "-auto_convert",
+            "0",
+            "-i",
+            str(list_path),
+            "-c",
+            "copy",
+            str(tmp_path),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+    finally:
+        os.remove(list_path)
+
+    # ffmpeg can exit cleanly after a demuxing error that dropped the rest
+    # of the input, so check the result before deleting anything
+    expected = sum(os.path.getsize(path) for path in paths)
+    stitched = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+    if process.returncode != 0 or stitched < expected * 0.9:
+        logger.warning(f"Could not stitch parts: {stderr.decode().strip()}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+    for path in paths:
+        os.remove(path)
+    os.replace(tmp_path, output_path)
+    return True
+
+
+def _discard(recorder: IRecorder) -> None:
+    """Remove what an attempt that never received data left behind."""
+    leftover = recorder.manifest.path if recorder.manifest else recorder.output_path
+    if leftover and os.path.exists(leftover):
+        os.remove(leftover)
+
+
+async def stitch_session(captures: List[Capture]) -> str:
+    """
+    Merge the captures of one live session, split by reconnects, and
+    return the path that describes the result.
+
+    Segmented captures are merged into the manifest of the first one.
+    Single-file captures are concatenated into the first file; if that is
+    not possible the parts are kept and listed in a manifest instead.
+    """
+    for capture in captures:
+        if not capture.recorder.bytes_written:
+            _discard(capture.recorder)
+    captures = [capture for capture in captures if capture.recorder.bytes_written]
+    if not captures:
+        return ""
+
+    first = captures[0].recorder
+    if len(captures) == 1:
+        return first.manifest.path if first.manifest else first.output_path
+
+    if first.manifest is not None:
+        for capture in captures[1:]:
+            first.manifest.extend(capture.recorder.manifest)
+            os.remove(capture.recorder.manifest.path)
+        first.manifest.finish()
+        return first.manifest.path
+
+    paths = [capture.recorder.output_path for capture in captures]
+    if await concat_files(paths, first.output_path):
+        logger.info(f"Stitched {len(paths)} parts into {first.output_path}")
+        return first.output_path
+
+    manifest = SegmentManifest(
+        manifest_path(first.output_path), started_at=captures[0].started_at
+    )
+    for index, capture in enumerate(captures, start=1):
+        manifest.segments.append(
+            Segment(
+                index=index,
+                path=os.path.basename(capture.recorder.output_path),
+                started_at=capture.started_at,
+                finished_at=capture.finished_at,
+                duration=capture.finished_at - capture.started_at,
+                size=capture.recorder.bytes_written,
+                closed=True,
+            )
+        )
+    manifest.finish()
+    logger.warning(f"Kept {len(paths)} separate parts, listed in {manifest.path}")
+    return manifest.path
@@ -0,0 +1,45 @@
+import asyncio
+
+from core.interfaces import IRecorder
+from utils.logger_manager import logger
+
+
+class StallWatchdog:
+    """
+    Stops a recorder that has made no progress (no new bytes and no new
+    media time in its stats) for ``timeout`` seconds, so the caller can
+    reconnect instead of waiting for the CDN connection or ffmpeg to give
+    up on their own.
+    """
+
+    def __init__(self, recorder: IRecorder, timeout: float, check_interval=1.0):
+        self.recorder = recorder
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.stalled = False
+
+    def _progress(self):
+        stats = self.recorder.stats()
+        return stats.bytes_written, stats.media_time
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_progress = self._progress()
+        last_change = loop.time()
+
+        while True:
+            await asyncio.sleep(self.check_interval)
+
+            progress = self._progress()
+            if progress != last_progress:
+                last_progress = progress
+                last_change = loop.time()
+                continue
+
+            if loop.time() - last_change >= self.timeout:
+                logger.warning(
+                    f"No data received for {self.timeout:.0f}s, restarting capture"
+                )
+                self.stalled = True
+                await self.recorder.stop_recording()
+                return
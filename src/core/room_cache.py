@@ -0,0 +1,184 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import orjson
+
+from utils.logger_manager import logger
+
+
+@dataclass
+class RoomCacheEntry:
+    room_id: Optional[str]  # None = แคชเชิงลบ (ผู้ใช้ไม่มีห้องไลฟ์)
+    expires_at: float  # เวลาแบบ wall-clock เพื่อให้ใช้ต่อได้หลังรีสตาร์ท
+    ended: bool = False  # check_alive รายงานว่าห้อง room_id จบแล้ว
+
+    @property
+    def live_room_id(self) -> Optional[str]:
+        """room_id ที่อาจยังไลฟ์อยู่ หรือ None หากไม่มีห้องหรือห้องจบแล้ว"""
+        return None if self.ended else self.room_id
+
+
+class RoomIdCache:
+    """
+    แคช username -> room_id สองชั้น: LRU ในหน่วยความจำที่มี TTL ต่อรายการ
+    และ snapshot บนดิสก์ที่โหลดกลับมาตอนเริ่มโปรแกรม
+
+    ผลลัพธ์ที่ไม่พบห้องไลฟ์ และห้องที่ check_alive รายงานว่าจบแล้ว (mark_ended)
+    จะถูกแคชด้วย negative_ttl ที่สั้นกว่า เพื่อไม่ต้อง scrape หน้าโปรไฟล์ของผู้ใช้
+    ที่ไม่ได้ไลฟ์ซ้ำทุกรอบ แต่ยังค้นหาห้องใหม่ได้เมื่อรายการหมดอายุ
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: float = 900,
+        negative_ttl: float = 300,
+        path: Optional[str] = None,
+        snapshot_interval: float = 300,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.path = Path(path) if path else None
+        self.snapshot_interval = snapshot_interval
+
+        self._entries: "OrderedDict[str, RoomCacheEntry]" = OrderedDict()
+        self._dirty = False
+        self._last_snapshot = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user: str) -> Optional[RoomCacheEntry]:
+        """
+        คืนค่ารายการที่ยังไม่หมดอายุ หรือ None หากไม่มีในแคช
+        """
+        entry = self._entries.get(user)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.expires_at <= time.time():
+            del self._entries[user]
+            self._dirty = True
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user)
+        self.hits += 1
+        return entry
+
+    def set(self, user: str, room_id: Optional[str]) -> None:
+        ttl = self.ttl if room_id else self.negative_ttl
+        self._store(user, RoomCacheEntry(room_id, time.time() + ttl))
+
+    def mark_ended(self, user: str, room_id: str) -> None:
+        """
+        บันทึกว่าห้อง room_id ของผู้ใช้ไม่ได้ไลฟ์แล้ว ผู้ใช้จะถูกนับว่าไม่มีห้องไลฟ์
+        จนกว่าจะครบ negative_ttl แล้วจึงค้นหาห้องใหม่ (ไลฟ์ครั้งถัดไปได้ room_id ใหม่)
+        """
+        entry = self._entries.get(user)
+        if entry is not None and entry.room_id != room_id:
+            # มีการค้นหาห้องใหม่ไปแล้ว
+            return
+        if entry is not None and entry.ended:
+            return
+        self._store(
+            user, RoomCacheEntry(room_id, time.time() + self.negative_ttl, ended=True)
+        )
+
+    def _store(self, user: str, entry: RoomCacheEntry) -> None:
+        self._entries[user] = entry
+        self._entries.move_to_end(user)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        self._dirty = True
+        self._maybe_snapshot()
+
+    def invalidate(self, user: str) -> None:
+        if self._entries.pop(user, None) is not None:
+            self._dirty = True
+
+    def _maybe_snapshot(self) -> None:
+        if (
+            self.path
+            and time.monotonic() - self._last_snapshot >= self.snapshot_interval
+        ):
+            self.save()
+
+    def load(self) -> None:
+        """
+        โหลด snapshot จากดิสก์ (ข้ามรายการที่หมดอายุแล้ว)
+        """
+        if not self.path or not self.path.exists():
+            return
+
+        try:
+            raw: Dict[str, list] = orjson.loads(self.path.read_bytes())
+        except Exception as e:
+            logger.warning(f"ไม่สามารถโหลดแคช Room ID จาก {self.path}: {e}")
+            return
+
+        now = time.time()
+        # snapshot ถูกเขียนเรียงจากเก่าไปใหม่ตามลำดับ LRU
+        for user, (room_id, expires_at, *ended) in raw.items():
+            if expires_at > now:
+                self._entries[user] = RoomCacheEntry(room_id, expires_at, any(ended))
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        logger.info(f"โหลดแคช Room ID {len(self._entries)} รายการจาก {self.path}")
+
+    def save(self) -> None:
+        """
+        เขียน snapshot ลงดิสก์แบบ atomic (เขียนไฟล์ชั่วคราวแล้ว rename)
+        """
+        self._last_snapshot = time.monotonic()
+        if not self.path or not self._dirty:
+            return
+
+        now = time.time()
+        data = {
+            user: [entry.room_id, entry.expires_at, entry.ended]
+            for user, entry in self._entries.items()
+            if entry.expires_at > now
+        }
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(orjson.dumps(data))
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except Exception as e:
+            logger.warning(f"ไม่สามารถบันทึกแคช Room ID ไปยัง {self.path}: {e}")
+
+
+_room_cache: Optional[RoomIdCache] = None
+
+
+def configure_room_cache(**kwargs) -> RoomIdCache:
+    """
+    สร้างแคชที่ใช้ร่วมกันทั้ง process ด้วยค่าที่กำหนด และโหลด snapshot จากดิสก์
+    """
+    global _room_cache
+    _room_cache = RoomIdCache(**kwargs)
+    _room_cache.load()
+    return _room_cache
+
+
+def get_room_cache() -> RoomIdCache:
+    global _room_cache
+    if _room_cache is None:
+        _room_cache = RoomIdCache()
+    return _room_cache
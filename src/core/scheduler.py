@@ -0,0 +1,373 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from core.events import Events, event_bus
+from core.live_history import AdaptiveIntervalPolicy
+from core.tiktok_api import TikTokAPI
+from utils.custom_exceptions import StorageFullError
+from utils.logger_manager import logger
+from utils.metrics import POLL_CYCLE
+from utils.signals import stop_event
+
+
+@dataclass
+class WatchedUser:
+    """
+    สถานะการตรวจสอบของผู้ใช้หนึ่งคนภายใน PollScheduler
+    """
+
+    user: str
+    interval: float  # วินาที
+    room_id: Optional[str] = None
+    next_check: float = 0.0
+    last_check: float = 0.0
+    token: int = 0  # ใช้ทำ lazy deletion ของรายการเก่าใน heap
+    rate: float = 0.0  # จำนวนการตรวจสอบต่อนาทีที่ต้องการ (ก่อนปรับตาม budget)
+    hot: bool = False  # อยู่ในช่วงเวลาที่ผู้ใช้มักเริ่มไลฟ์
+    skip_room: Optional[str] = None  # ห้องที่ถูกสั่งหยุด ไม่บันทึกซ้ำ
+    failures: int = 0  # จำนวนการบันทึกติดต่อกันที่ไม่ได้ข้อมูลเลย
+
+
+class PollScheduler:
+    """
+    ตัวจัดตารางการตรวจสอบไลฟ์แบบรวมศูนย์สำหรับโหมดอัตโนมัติ
+
+    เก็บเวลาตรวจสอบครั้งถัดไปของผู้ใช้ทุกคนไว้ใน priority heap เดียว
+    เมื่อถึงเวลาจะรวมผู้ใช้ที่ครบกำหนดแล้วส่ง room_ids แบบคั่นด้วย comma
+    ไปยัง /webcast/room/check_alive/ ครั้งละไม่เกิน BATCH_SIZE ห้อง
+    และเริ่มการบันทึกเฉพาะห้องที่กำลังไลฟ์อยู่เท่านั้น
+
+    หากกำหนด policy ช่วงเวลาตรวจสอบของแต่ละคนจะปรับตามประวัติการไลฟ์
+    และหากกำหนด request_budget (ครั้งต่อนาที) ช่วงเวลาทั้งหมดจะถูกยืดออก
+    ตามสัดส่วนเมื่อความถี่รวมที่ต้องการเกิน budget
+    """
+
+    BATCH_SIZE = 50
+    MAX_BACKOFF = 16  # ตัวคูณสูงสุดของ interval เมื่อการบันทึกล้มเหลวซ้ำ
+
+    def __init__(
+        self,
+        tiktok: TikTokAPI,
+        interval: float,
+        on_live: Callable[[str, str], Awaitable[Optional[int]]],
+        resolve_concurrency: int = 10,
+        coalesce_window: float = 5.0,
+        policy: Optional[AdaptiveIntervalPolicy] = None,
+        request_budget: Optional[float] = None,
+    ):
+        self.tiktok = tiktok
+        self.interval = interval
+        self.on_live = on_live
+        self.coalesce_window = coalesce_window
+        self.policy = policy
+        self.request_budget = request_budget
+        self._rate_total = 0.0
+
+        self._heap: List[tuple] = []
+        self._users: Dict[str, WatchedUser] = {}
+        self._active: Dict[str, asyncio.Task] = {}
+        self._tokens = itertools.count()
+        self._resolve_semaphore = asyncio.Semaphore(resolve_concurrency)
+        self._wakeup = asyncio.Event()
+
+        # สถานะจาก checkpoint ใช้กำหนดเวลาตรวจสอบครั้งแรกหลังรีสตาร์ท
+        self._last_checks: Dict[str, float] = {}
+        self._urgent: Set[str] = set()
+        self._spread = False
+
+    @property
+    def users(self) -> List[str]:
+        return list(self._users.keys())
+
+    @property
+    def active_recordings(self) -> Dict[str, asyncio.Task]:
+        return dict(self._active)
+
+    @property
+    def entries(self) -> List[WatchedUser]:
+        return list(self._users.values())
+
+    def restore(
+        self,
+        last_checks: Dict[str, float],
+        urgent: Iterable[str] = (),
+        spread: bool = False,
+    ) -> None:
+        """
+        กำหนดเวลาตรวจสอบครั้งแรกของผู้ใช้ที่จะถูกเพิ่มหลังจากนี้ (warm restart)
+
+        last_checks คือเวลาตรวจสอบล่าสุด (wall-clock) จากการทำงานครั้งก่อน ผู้ใช้ที่
+        ยังไม่ครบกำหนดจะถูกตรวจสอบเมื่อครบ interval นับจากครั้งก่อน ผู้ใช้ใน urgent
+        (เช่นมีการบันทึกค้างอยู่) ถูกตรวจสอบทันที และหาก spread เป็น True ผู้ใช้ที่เหลือ
+        จะถูกกระจายแบบสุ่มตลอดหนึ่ง interval แทนที่จะตรวจสอบพร้อมกันทั้งหมดตอนเริ่ม
+        """
+        self._last_checks = dict(last_checks)
+        self._urgent = set(urgent)
+        self._spread = spread
+
+    def last_checks(self) -> Dict[str, float]:
+        """เวลาตรวจสอบล่าสุด (wall-clock) ของผู้ใช้ที่ตรวจสอบแล้วอย่างน้อยหนึ่งครั้ง"""
+        offset = time.time() - time.monotonic()
+        return {
+            user: entry.last_check + offset
+            for user, entry in self._users.items()
+            if entry.last_check
+        }
+
+    def _initial_delay(self, user: str, interval: float) -> float:
+        if user in self._urgent:
+            return 0.0
+        if self.policy is not None and self.policy.is_hot(user):
+            return 0.0
+        last_check = self._last_checks.pop(user, None)
+        if last_check is not None:
+            remaining = last_check + interval - time.time()
+            if remaining > 0:
+                return min(remaining, interval)
+        return random.uniform(0, interval) if self._spread else 0.0
+
+    def add_user(
+        self,
+        user: str,
+        interval: Optional[float] = None,
+        delay: Optional[float] = None,
+    ) -> None:
+        """
+        เพิ่มผู้ใช้เข้าสู่ตาราง (หากมีอยู่แล้วจะอัปเดตเฉพาะ interval)
+
+        เมื่อ interval ใหม่สั้นกว่าเวลาที่เหลือถึงการตรวจสอบครั้งถัดไป
+        จะเลื่อนการตรวจสอบให้เร็วขึ้นทันที
+        """
+        entry = self._users.get(user)
+        if entry is not None:
+            if interval is not None:
+                entry.interval = interval
+                at = time.monotonic() + interval
+                if entry.next_check > at and user not in self._active:
+                    self._schedule(entry, at)
+            return
+
+        entry = WatchedUser(user=user, interval=interval or self.interval)
+        self._users[user] = entry
+        if delay is None:
+            delay = self._initial_delay(user, entry.interval)
+        self._schedule(entry, time.monotonic() + delay)
+
+    def remove_user(self, user: str) -> None:
+        """
+        นำผู้ใช้ออกจากตาราง (การบันทึกที่กำลังทำงานอยู่จะไม่ถูกหยุด)
+        """
+        # รายการใน heap จะถูกทิ้งเองเมื่อ pop เพราะหา entry ไม่เจอ
+        entry = self._users.pop(user, None)
+        if entry is not None:
+            self._rate_total -= entry.rate
+
+    def skip_current_live(self, user: str) -> None:
+        """
+        ไม่บันทึกไลฟ์ปัจจุบันของผู้ใช้ซ้ำหลังถูกสั่งหยุด แต่ยังตรวจสอบต่อ
+        และจะบันทึกตามปกติเมื่อผู้ใช้เริ่มไลฟ์ห้องใหม่
+        """
+        entry = self._users.get(user)
+        if entry is not None and entry.room_id:
+            entry.skip_room = entry.room_id
+
+    def _next_interval(self, entry: WatchedUser) -> float:
+        """
+        คำนวณช่วงเวลาถึงการตรวจสอบครั้งถัดไปของผู้ใช้ พร้อมอัปเดตความถี่รวม
+        """
+        interval = entry.interval
+        entry.hot = False
+        if self.policy is not None:
+            interval = self.policy.interval_for(entry.user, entry.interval)
+            entry.hot = self.policy.is_hot(entry.user)
+
+        rate = 60.0 / interval
+        self._rate_total += rate - entry.rate
+        entry.rate = rate
+
+        if self.request_budget and self._rate_total > self.request_budget:
+            interval *= self._rate_total / self.request_budget
+        return interval
+
+    def _schedule(self, entry: WatchedUser, at: float) -> None:
+        entry.next_check = at
+        entry.token = next(self._tokens)
+        heapq.heappush(self._heap, (at, entry.token, entry.user))
+        self._wakeup.set()
+
+    def _pop_due(self, now: float) -> List[WatchedUser]:
+        """
+        ดึงผู้ใช้ที่ครบกำหนดตรวจสอบ พร้อมรวมผู้ใช้ที่ใกล้ครบกำหนด
+        (ภายใน coalesce_window) เข้ามาในรอบเดียวกันเพื่อให้ batch เต็มขึ้น
+        """
+        due: List[WatchedUser] = []
+        if not self._heap or self._heap[0][0] > now:
+            return due
+
+        horizon = now + self.coalesce_window
+        while self._heap and self._heap[0][0] <= horizon:
+            _, token, user = heapq.heappop(self._heap)
+            entry = self._users.get(user)
+            if entry is None or entry.token != token or user in self._active:
+                continue
+            due.append(entry)
+        return due
+
+    def _seconds_until_next(self, now: float) -> float:
+        if not self._heap:
+            return 1.0
+        return max(0.0, min(self._heap[0][0] - now, 1.0))
+
+    async def run(self) -> None:
+        """
+        วนลูปหลักของ scheduler จนกว่าจะได้รับสัญญาณหยุด
+        """
+        logger.info(
+            f"เริ่ม scheduler สำหรับ {len(self._users)} ผู้ใช้ "
+            f"(ตรวจสอบทุก {self.interval / 60:g} นาที)\n"
+        )
+
+        try:
+            while not stop_event.is_set():
+                now = time.monotonic()
+                due = self._pop_due(now)
+                if not due:
+                    # stop_event เป็น threading.Event จึงต้องตื่นมาตรวจสอบเป็นระยะ
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(
+                            self._wakeup.wait(), timeout=self._seconds_until_next(now)
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                try:
+                    await self._poll_cycle(due)
+                except Exception as ex:
+                    logger.error(f"เกิดข้อผิดพลาดในรอบการตรวจสอบ: {ex}")
+                    for entry in due:
+                        self._reschedule(entry)
+        finally:
+            if self._active:
+                logger.info(
+                    f"กำลังรอการบันทึก {len(self._active)} รายการให้เสร็จสิ้น..."
+                )
+                await asyncio.gather(*self._active.values(), return_exceptions=True)
+
+    async def _poll_cycle(self, due: List[WatchedUser]) -> None:
+        started = time.monotonic()
+
+        await self._resolve_room_ids(due)
+
+        by_room: Dict[str, List[WatchedUser]] = {}
+        for entry in due:
+            entry.last_check = started
+            if entry.room_id:
+                by_room.setdefault(entry.room_id, []).append(entry)
+            else:
+                logger.debug(f"ไม่พบ Room ID ของ @{entry.user}")
+                self._reschedule(entry)
+
+        room_ids = list(by_room.keys())
+        batches = 0
+        live_count = 0
+        for i in range(0, len(room_ids), self.BATCH_SIZE):
+            chunk = room_ids[i : i + self.BATCH_SIZE]
+            status_map = await self.tiktok.is_room_alive(chunk)
+            batches += 1
+
+            for room_id in chunk:
+                for entry in by_room[room_id]:
+                    if entry.user not in self._users:
+                        continue
+                    is_live = bool(status_map.get(room_id))
+                    event_bus.publish(
+                        Events.POLL_RESULT, entry.user, room_id=room_id, live=is_live
+                    )
+                    if entry.skip_room is not None:
+                        if is_live and entry.skip_room == room_id:
+                            self._reschedule(entry)
+                            continue
+                        entry.skip_room = None
+                    if is_live:
+                        live_count += 1
+                        self._dispatch(entry)
+                    else:
+                        # ไลฟ์ครั้งถัดไปจะได้ room_id ใหม่: นับว่าไม่มีห้องไลฟ์จนกว่า
+                        # รายการในแคชจะหมดอายุ แล้วจึง scrape หาห้องใหม่
+                        self.tiktok.room_cache.mark_ended(entry.user, room_id)
+                        self._reschedule(entry)
+
+        elapsed = time.monotonic() - started
+        POLL_CYCLE.observe(elapsed, mode="automatic")
+        logger.info(
+            f"ตรวจสอบ {len(due)} ผู้ใช้ด้วย {batches} คำขอ check_alive "
+            f"พบไลฟ์ {live_count} คน ({elapsed:.2f} วินาที)"
+        )
+
+    async def _resolve_room_ids(self, due: List[WatchedUser]) -> None:
+        """
+        ดึง room_id ล่าสุดของผู้ใช้ที่ครบกำหนด โดยจำกัดจำนวนคำขอพร้อมกัน
+        """
+
+        async def resolve(entry: WatchedUser):
+            async with self._resolve_semaphore:
+                # ในช่วงที่ผู้ใช้มักเริ่มไลฟ์ให้ดึง room_id ใหม่เสมอ เพื่อไม่พลาดห้องใหม่เพราะแคช
+                room_id = await self.tiktok.get_room_id_from_user(
+                    entry.user, use_cache=not entry.hot
+                )
+            entry.room_id = str(room_id) if room_id else None
+
+        await asyncio.gather(*(resolve(e) for e in due), return_exceptions=True)
+
+    def _reschedule(self, entry: WatchedUser, delay: Optional[float] = None) -> None:
+        if entry.user not in self._users:
+            return
+        if delay is None:
+            delay = self._next_interval(entry)
+        self._schedule(entry, time.monotonic() + delay)
+
+    def _dispatch(self, entry: WatchedUser) -> None:
+        logger.info(f"@{entry.user} กำลังไลฟ์! เริ่มต้นการบันทึก...")
+        if self.policy is not None:
+            self.policy.history.record_live(entry.user)
+        task = asyncio.create_task(self.on_live(entry.user, entry.room_id))
+        self._active[entry.user] = task
+        task.add_done_callback(lambda t, e=entry: self._on_recording_done(e, t))
+
+    def _on_recording_done(self, entry: WatchedUser, task: asyncio.Task) -> None:
+        self._active.pop(entry.user, None)
+        # ไลฟ์ครั้งถัดไปจะได้ room_id ใหม่ จึงต้องล้างค่าเดิมออกจากแคช
+        entry.room_id = None
+        self.tiktok.room_cache.invalidate(entry.user)
+        if task.cancelled():
+            return
+        if isinstance(task.exception(), StorageFullError):
+            # พื้นที่ดิสก์ไม่พอ: ตรวจสอบอีกครั้งตามรอบปกติแทนที่จะตรวจสอบทันที
+            logger.warning(str(task.exception()))
+            self._reschedule(entry)
+            return
+        written = None
+        if task.exception():
+            logger.error(f"การบันทึกของ @{entry.user} ล้มเหลว: {task.exception()}")
+        else:
+            written = task.result()
+
+        if stop_event.is_set():
+            return
+        if written:
+            # ตรวจสอบทันทีหลังไลฟ์จบ เผื่อผู้ใช้เริ่มไลฟ์ใหม่หรือการเชื่อมต่อหลุด
+            entry.failures = 0
+            self._reschedule(entry, delay=0.0)
+            return
+        # บันทึกไม่ได้ข้อมูลเลย (เช่น URL สตรีมใช้ไม่ได้): รออย่างน้อยหนึ่ง interval
+        # และเพิ่มเป็นสองเท่าทุกครั้งที่ล้มเหลวซ้ำ เพื่อไม่ให้วนเรียก API ไม่หยุด
+        entry.failures += 1
+        factor = min(2 ** (entry.failures - 1), self.MAX_BACKOFF)
+        self._reschedule(entry, delay=self._next_interval(entry) * factor)
@@ -0,0 +1,468 @@
+"""
+Disk space management for the output directory.
+
+Admission: before a recording starts, the free space of the output volume
+is compared with what the recordings would write over the next `headroom`
+seconds at the measured write rate, plus one more recording:
+
+- Below `min_free`, no new recording starts.
+- When the headroom is low, only users with a positive priority start.
+  Everyone else is deferred to their next check.
+- Below half of `min_free`, running recordings are stopped one at a time,
+  lowest priority and newest first, so the others can finish cleanly.
+
+Retention: finished recordings are listed in an index file. Recordings
+are deleted oldest first when they are older than `retention_days`, when
+a user is over `retention_user_quota`, or when the index is over
+`retention_max_size`. The index is filled from RECORDING_FINISHED events.
+The output tree is only walked once, when there is no index file yet.
+"""
+
+import asyncio
+import itertools
+import os
+import shutil
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+from core.events import Event, Events, event_bus
+from core.recorders.segments import SegmentManifest
+from utils.custom_exceptions import StorageFullError
+from utils.logger_manager import logger
+from utils.metrics import REGISTRY, recordings
+
+FREE_BYTES = REGISTRY.gauge("storage_free_bytes", "Free space on the output volume")
+WRITE_RATE = REGISTRY.gauge(
+    "storage_write_bytes_per_second", "Recent write throughput of all recordings"
+)
+DEFERRED = REGISTRY.counter(
+    "recordings_deferred_total",
+    "Recordings not started for lack of disk space",
+    ["reason"],
+)
+STOPPED = REGISTRY.counter(
+    "recordings_stopped_disk_full_total",
+    "Running recordings stopped because the disk was nearly full",
+)
+RETENTION_DELETED = REGISTRY.counter(
+    "retention_deleted_total", "Recordings deleted by retention", ["policy"]
+)
+
+MB = 1024 * 1024
+
+MEDIA_SUFFIXES = (".flv", ".mp4")
+MANIFEST_SUFFIX = ".manifest.json"
+# Files that post-processing leaves next to a recording
+SIDECAR_SUFFIXES = (".jpg", ".flv.sha256", ".mp4.sha256")
+# Temporary files of steps that are still running
+TEMP_MARKERS = (".processing.", ".stitching.", ".parts.txt")
+
+
+@dataclass
+class IndexEntry:
+    path: str  # media file or segment manifest
+    user: str
+    size: int
+    finished_at: float
+
+
+def recording_base(path: str) -> str:
+    if path.endswith(MANIFEST_SUFFIX):
+        return path[: -len(MANIFEST_SUFFIX)]
+    return os.path.splitext(path)[0]
+
+
+def recording_files(path: str) -> List[str]:
+    """
+    Every file of a finished recording that still exists. Only the known
+    names are checked, the directory is never listed.
+    """
+    base = recording_base(path)
+    candidates = [base + suffix for suffix in MEDIA_SUFFIXES + SIDECAR_SUFFIXES]
+    if path.endswith(MANIFEST_SUFFIX) and os.path.exists(path):
+        try:
+            manifest = SegmentManifest.load(path)
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Could not read {path}: {e}")
+        else:
+            directory = os.path.dirname(path)
+            candidates += [os.path.join(directory, s.path) for s in manifest.segments]
+        candidates.append(path)
+    return [p for p in dict.fromkeys(candidates) if os.path.isfile(p)]
+
+
+def _size(paths: List[str]) -> int:
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+class RetentionIndex:
+    """Finished recordings under the output directory, saved as JSON."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self.entries: Dict[str, IndexEntry] = {}
+
+    def load(self) -> bool:
+        """Load the index file; False when there is none yet."""
+        if self.path is None or not self.path.exists():
+            return False
+        try:
+            raw = orjson.loads(self.path.read_bytes())
+            entries = [IndexEntry(**item) for item in raw]
+        except Exception as e:
+            logger.warning(f"Could not load the recording index: {e}")
+            return False
+        self.entries = {entry.path: entry for entry in entries}
+        return True
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        data = [asdict(entry) for entry in self.entries.values()]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(orjson.dumps(data))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Could not save the recording index: {e}")
+
+    def add(self, entry: IndexEntry) -> None:
+        self.entries[entry.path] = entry
+
+    def remove(self, path: str) -> None:
+        self.entries.pop(path, None)
+
+    @staticmethod
+    def scan(root: Path, users: Optional[List[str]] = None) -> Dict[str, IndexEntry]:
+        """Walk the output tree once to index the recordings already on disk."""
+        entries: Dict[str, IndexEntry] = {}
+        if users is None:
+            tree = os.walk(root)
+        else:
+            tree = itertools.chain.from_iterable(os.walk(root / user) for user in users)
+        for directory, _, names in tree:
+            user = Path(directory).name
+            names = [n for n in names if not any(m in n for m in TEMP_MARKERS)]
+            claimed = set()
+            for name in names:
+                if name.endswith(MANIFEST_SUFFIX):
+                    path = os.path.join(directory, name)
+                    files = recording_files(path)
+                    claimed.update(os.path.basename(f) for f in files)
+                    entries[path] = IndexEntry(
+                        path, user, _size(files), os.path.getmtime(path)
+                    )
+            for name in names:
+                if name in claimed or not name.endswith(MEDIA_SUFFIXES):
+                    continue
+                path = os.path.join(directory, name)
+                files = recording_files(path)
+                claimed.update(os.path.basename(f) for f in files)
+                entries[path] = IndexEntry(
+                    path, user, _size(files), os.path.getmtime(path)
+                )
+        return entries
+
+
+class StorageManager:
+    """
+    Watches the free space and write rate of the output volume, decides
+    whether new recordings may start, and enforces retention.
+
+    Sizes are in bytes. Recorders attach themselves so that recordings can
+    be stopped when the disk is about to run full.
+    """
+
+    RETENTION_INTERVAL = 600.0
+
+    def __init__(
+        self,
+        root: str,
+        min_free: int = 2048 * MB,
+        headroom: float = 1800.0,
+        recording_rate: float = 0.5 * MB,
+        priorities: Optional[Dict[str, int]] = None,
+        check_interval: float = 10.0,
+        retention_days: Optional[float] = None,
+        retention_max_size: Optional[int] = None,
+        retention_user_quota: Optional[int] = None,
+        index_path: Optional[str] = None,
+        users: Optional[List[str]] = None,
+    ):
+        self.root = Path(root)
+        self.min_free = min_free
+        self.headroom = headroom
+        self.recording_rate = recording_rate
+        self.priorities = {
+            user.lstrip("@"): priority for user, priority in (priorities or {}).items()
+        }
+        self.check_interval = check_interval
+        self.retention_days = retention_days
+        self.retention_max_size = retention_max_size
+        self.retention_user_quota = retention_user_quota
+        self.index = RetentionIndex(Path(index_path) if index_path else None)
+        # Only these users' directories are indexed (None = the whole tree)
+        self.users = users
+
+        self.rate = 0.0  # bytes per second, smoothed
+        self._sample: Optional[Tuple[float, int]] = None
+        self._low = False
+        self._recorders: List = []
+        self._stopping: Dict[str, object] = {}
+
+    @property
+    def retention_enabled(self) -> bool:
+        return bool(
+            self.retention_days or self.retention_max_size or self.retention_user_quota
+        )
+
+    def attach_recorder(self, recorder) -> None:
+        self._recorders.append(recorder)
+
+    def detach_recorder(self, recorder) -> None:
+        if recorder in self._recorders:
+            self._recorders.remove(recorder)
+
+    def priority(self, user: str) -> int:
+        return self.priorities.get(user, 0)
+
+    # -- space -------------------------------------------------------------
+
+    def free_space(self) -> int:
+        # The output directory is only created by the first recording
+        path = self.root.absolute()
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        free = shutil.disk_usage(path).free
+        FREE_BYTES.set(free)
+        return free
+
+    def sample(self) -> None:
+        """Update the write rate from the bytes written by all recordings."""
+        now = time.monotonic()
+        total = sum(size for _, size in recordings.snapshot().values())
+        if self._sample is not None:
+            last_time, last_total = self._sample
+            if now > last_time:
+                rate = max(0, total - last_total) / (now - last_time)
+                self.rate = rate if not self.rate else 0.7 * self.rate + 0.3 * rate
+        self._sample = (now, total)
+        WRITE_RATE.set(self.rate)
+
+    def required_space(self) -> int:
+        """Free space needed for `headroom` seconds with one more recording."""
+        active = sum(active for active, _ in recordings.snapshot().values())
+        per_recording = self.rate / active if active and self.rate else 0
+        per_recording = max(per_recording, self.recording_rate)
+        return int(self.min_free + (self.rate + per_recording) * self.headroom)
+
+    def check_admission(self, user: str) -> None:
+        """Raise StorageFullError when @user may not start recording now."""
+        free = self.free_space()
+        if free < self.min_free:
+            DEFERRED.inc(reason="full")
+            raise StorageFullError(
+                f"only {free / MB:.0f} MB free in {self.root}, "
+                f"not recording @{user}"
+            )
+        required = self.required_space()
+        if free < required and self.priority(user) <= 0:
+            DEFERRED.inc(reason="low")
+            raise StorageFullError(
+                f"low disk space in {self.root} ({free / MB:.0f} MB free, "
+                f"{required / MB:.0f} MB wanted), deferring @{user}"
+            )
+
+    def _stop_one(self) -> None:
+        """Stop the lowest priority, newest recording that is not stopping yet."""
+        active = {
+            session.user: (session, recorder)
+            for recorder in self._recorders
+            for session in recorder.recordings
+        }
+        self._stopping = {u: r for u, r in self._stopping.items() if u in active}
+        candidates = [
+            item for user, item in active.items() if user not in self._stopping
+        ]
+        if not candidates:
+            return
+        session, recorder = min(
+            candidates,
+            key=lambda item: (self.priority(item[0].user), -item[0].started_at),
+        )
+        logger.warning(
+            f"Disk almost full, stopping the recording of @{session.user} "
+            "so the others can continue"
+        )
+        STOPPED.inc()
+        self._stopping[session.user] = recorder
+        recorder.stop_user(session.user)
+
+    def check(self) -> None:
+        self.sample()
+        free = self.free_space()
+        low = free < self.required_space()
+        if low != self._low:
+            self._low = low
+            if low:
+                logger.warning(
+                    f"Low disk space in {self.root}: {free / MB:.0f} MB free, "
+                    f"writing {self.rate / MB:.1f} MB/s"
+                )
+            else:
+                logger.info(f"Disk space in {self.root} is sufficient again")
+        if free < self.min_free / 2:
+            self._stop_one()
+
+    # -- retention ---------------------------------------------------------
+
+    def on_finished(self, event: Event) -> None:
+        path = event.data.get("path")
+        if not path or not event.user:
+            return
+        self.index.add(
+            IndexEntry(path, event.user, event.data.get("size") or 0, event.timestamp)
+        )
+
+    def retention_plan(self, now: float) -> List[Tuple[IndexEntry, str]]:
+        """Recordings to delete, oldest first, with the policy that hit them."""
+        # Files of running recordings may be indexed by the first scan
+        active = {
+            recording_base(path)
+            for recorder in self._recorders
+            for session in recorder.recordings
+            for path in session.files
+        }
+        entries = sorted(
+            (
+                e
+                for e in self.index.entries.values()
+                if recording_base(e.path) not in active
+            ),
+            key=lambda e: e.finished_at,
+        )
+        plan: List[Tuple[IndexEntry, str]] = []
+        kept: List[IndexEntry] = []
+
+        for entry in entries:
+            if (
+                self.retention_days
+                and now - entry.finished_at > self.retention_days * 86400
+            ):
+                plan.append((entry, "age"))
+            else:
+                kept.append(entry)
+
+        if self.retention_user_quota:
+            usage: Dict[str, int] = {}
+            for entry in kept:
+                usage[entry.user] = usage.get(entry.user, 0) + entry.size
+            remaining = []
+            for entry in kept:
+                if usage[entry.user] > self.retention_user_quota:
+                    usage[entry.user] -= entry.size
+                    plan.append((entry, "user_quota"))
+                else:
+                    remaining.append(entry)
+            kept = remaining
+
+        if self.retention_max_size:
+            total = sum(entry.size for entry in kept)
+            for entry in kept:
+                if total <= self.retention_max_size:
+                    break
+                total -= entry.size
+                plan.append((entry, "max_size"))
+        return plan
+
+    @staticmethod
+    def _delete(entries: List[IndexEntry]) -> int:
+        freed = 0
+        for entry in entries:
+            for path in recording_files(entry.path):
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    freed += size
+                except OSError as e:
+                    logger.warning(f"Retention could not delete {path}: {e}")
+        return freed
+
+    async def enforce_retention(self) -> None:
+        plan = self.retention_plan(time.time())
+        if not plan:
+            return
+        freed = await asyncio.to_thread(self._delete, [entry for entry, _ in plan])
+        for entry, policy in plan:
+            self.index.remove(entry.path)
+            RETENTION_DELETED.inc(policy=policy)
+            event_bus.publish(
+                Events.RECORDING_DELETED, entry.user, path=entry.path, policy=policy
+            )
+        await asyncio.to_thread(self.index.save)
+        logger.info(f"Retention removed {len(plan)} recordings ({freed / MB:.0f} MB)")
+
+    async def _load_index(self) -> None:
+        if self.index.load():
+            return
+        if not self.root.exists():
+            return
+        logger.info(f"Indexing the recordings in {self.root}...")
+        entries = await asyncio.to_thread(RetentionIndex.scan, self.root, self.users)
+        # Recordings finished while scanning are already in the index
+        for path, entry in entries.items():
+            self.index.entries.setdefault(path, entry)
+        await asyncio.to_thread(self.index.save)
+        logger.info(f"Indexed {len(entries)} recordings")
+
+    def save(self) -> None:
+        if self.retention_enabled:
+            self.index.save()
+
+    async def run(self) -> None:
+        """Check the disk every check_interval seconds until cancelled."""
+        subscription = None
+        if self.retention_enabled:
+            subscription = event_bus.subscribe(
+                Events.RECORDING_FINISHED, self.on_finished, name="retention"
+            )
+            await self._load_index()
+        next_retention = 0.0
+        try:
+            while True:
+                try:
+                    self.check()
+                    if self.retention_enabled and time.monotonic() >= next_retention:
+                        next_retention = time.monotonic() + self.RETENTION_INTERVAL
+                        await self.enforce_retention()
+                except Exception as e:
+                    logger.error(f"Storage check failed: {e}")
+                await asyncio.sleep(self.check_interval)
+        finally:
+            if subscription is not None:
+                await event_bus.unsubscribe(subscription)
+
+
+_storage_manager: Optional[StorageManager] = None
+
+
+def configure_storage_manager(**kwargs) -> StorageManager:
+    """Create the storage manager for the output directory."""
+    global _storage_manager
+    _storage_manager = StorageManager(**kwargs)
+    return _storage_manager
+
+
+def get_storage_manager() -> Optional[StorageManager]:
+    return _storage_manager
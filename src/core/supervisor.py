@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import config
+from utils.logger_manager import logger
+from utils.metrics import ACTIVE_RECORDINGS, RECORDED_BYTES, REGISTRY
+from utils.signals import stop_event
+
+# worker ที่ทำงานได้นานกว่านี้ถือว่าเสถียร และรีเซ็ตการหน่วงเวลาก่อน restart
+STABLE_UPTIME = 60.0
+MAX_RESTART_DELAY = 60.0
+STATUS_INTERVAL = 5.0
+
+
+class HashRing:
+    """
+    Consistent hashing ของชื่อผู้ใช้ไปยัง shard
+
+    เมื่อจำนวน worker เปลี่ยน ผู้ใช้ย้าย shard เพียงประมาณ 1/N
+    แคช Room ID และประวัติไลฟ์ของแต่ละ worker จึงยังใช้ต่อได้เกือบทั้งหมด
+    """
+
+    def __init__(self, shards: int, replicas: int = 160):
+        points = []
+        for shard in range(shards):
+            for replica in range(replicas):
+                points.append((self._hash(f"worker-{shard}#{replica}"), shard))
+        points.sort()
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(
+            hashlib.blake2b(value.encode(), digest_size=8).digest(), "big"
+        )
+
+    def shard_for(self, user: str) -> int:
+        index = bisect.bisect(self._keys, self._hash(user.lower()))
+        return self._shards[index % len(self._shards)]
+
+    def split(self, users: List[str]) -> Dict[int, List[str]]:
+        shards: Dict[int, List[str]] = {}
+        for user in users:
+            shards.setdefault(self.shard_for(user), []).append(user)
+        return shards
+
+
+def worker_state_file(filename: Optional[str], index: int) -> Optional[str]:
+    """ไฟล์ state แยกของแต่ละ worker เช่น room_cache.json -> room_cache.w0.json"""
+    if not filename:
+        return filename
+    root, ext = os.path.splitext(filename)
+    return f"{root}.w{index}{ext}"
+
+
+def _report_status(index: int, users: int, conn, parent: int) -> None:
+    from utils.metrics import recordings
+
+    while not stop_event.wait(STATUS_INTERVAL):
+        if os.getppid() != parent:
+            # supervisor หายไป (เช่นถูก kill) จึงหยุดเองอย่างปลอดภัย
+            logger.warning("ไม่พบ supervisor กำลังหยุด worker")
+            stop_event.set()
+            return
+        try:
+            conn.send(
+                {
+                    "worker": index,
+                    "pid": os.getpid(),
+                    "users": users,
+                    "recordings": recordings.snapshot(),
+                }
+            )
+        except OSError:
+            return
+
+
+def _worker_main(
+    target: Callable, index: int, args: argparse.Namespace, mode, cookies, conn
+) -> None:
+    """
+    จุดเริ่มต้นของ worker process: รัน target (run_recordings) กับผู้ใช้ใน shard
+
+    Ctrl+C ถูกส่งถึงทุก process ใน group จึงให้ supervisor เป็นผู้ตัดสินใจ
+    และหยุด worker ด้วย SIGTERM ซึ่งหยุดแบบเดียวกับ Ctrl+C ครั้งแรก
+    """
+    from config import config
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter(f"[w{index}] %(message)s"))
+
+    # แต่ละ worker มีไฟล์ state ของตัวเอง และ supervisor เป็นผู้ให้บริการ metrics
+    config.room_cache_file = worker_state_file(config.room_cache_file, index)
+    config.live_history_file = worker_state_file(config.live_history_file, index)
+    config.checkpoint_file = worker_state_file(config.checkpoint_file, index)
+    config.retention_index_file = worker_state_file(config.retention_index_file, index)
+    config.post_process_queue_file = worker_state_file(
+        config.post_process_queue_file, index
+    )
+    # retention ของ worker ดูแลเฉพาะไดเรกทอรีของผู้ใช้ใน shard ของตัวเอง
+    args.retention_users = list(args.user)
+    config.metrics_port = None
+    args.metrics_port = None
+    config.control_port = None
+
+    threading.Thread(
+        target=_report_status,
+        args=(index, len(args.user), conn, os.getppid()),
+        daemon=True,
+    ).start()
+
+    target(args, mode, cookies)
+
+
+@dataclass
+class WorkerSlot:
+    index: int
+    users: List[str]
+    process: Optional[multiprocessing.Process] = None
+    started_at: float = 0.0
+    restarts: int = 0
+    failures: int = 0  # restart ติดต่อกันโดยไม่เสถียร
+    restart_at: float = 0.0
+    conn: Optional[Connection] = None  # ปลายรับสถานะจาก worker
+    status: Dict = field(default_factory=dict)
+
+
+WORKER_UP = REGISTRY.gauge(
+    "supervisor_worker_up", "Whether a worker process is running", ["worker"]
+)
+WORKER_RESTARTS = REGISTRY.counter(
+    "supervisor_worker_restarts_total", "Worker processes restarted", ["worker"]
+)
+
+
+class WorkerSupervisor:
+    """
+    กระจายผู้ใช้ในโหมดอัตโนมัติไปยัง worker process หลายตัวเพื่อใช้ทุก core
+
+    ผู้ใช้ถูกแบ่งด้วย HashRing แต่ละ worker รัน run_recordings ตามปกติ
+    (scheduler, HTTP pool และ recorder ของตัวเอง) supervisor คอย restart
+    worker ที่ตาย (หน่วงเวลาแบบ exponential) และรวมสถานะจากทุก worker
+    """
+
+    def __init__(
+        self,
+        target: Callable,
+        args: argparse.Namespace,
+        mode,
+        cookies,
+        workers: int,
+        status_interval: float = 60.0,
+    ):
+        self.target = target
+        self.args = args
+        self.mode = mode
+        self.cookies = cookies
+        self.status_interval = status_interval
+
+        users = args.user if isinstance(args.user, list) else [args.user]
+        shards = HashRing(workers).split(users)
+        self.slots = [
+            WorkerSlot(index, shard_users)
+            for index, shard_users in sorted(shards.items())
+        ]
+
+        # bandwidth budget เป็นของทั้งเครื่อง จึงแบ่งให้แต่ละ worker เท่า ๆ กัน
+        budget = args.bandwidth_budget or config.bandwidth_budget
+        self.worker_budget = budget / len(self.slots) if budget else None
+
+        self._ctx = multiprocessing.get_context("spawn")
+        REGISTRY.add_collector(self._collect)
+
+    def _start(self, slot: WorkerSlot) -> None:
+        args = argparse.Namespace(**vars(self.args))
+        args.user = list(slot.users)
+        args.bandwidth_budget = self.worker_budget
+        # pipe แยกต่อ worker: worker ที่ตายกลางคันไม่ทิ้ง lock ค้างไว้ให้ตัวอื่น
+        slot.conn, child_conn = self._ctx.Pipe(duplex=False)
+        slot.process = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                self.target,
+                slot.index,
+                args,
+                self.mode,
+                self.cookies,
+                child_conn,
+            ),
+            name=f"worker-{slot.index}",
+        )
+        slot.process.start()
+        child_conn.close()
+        slot.started_at = time.monotonic()
+        logger.info(
+            f"เริ่ม worker {slot.index} (pid {slot.process.pid}) "
+            f"สำหรับ {len(slot.users)} ผู้ใช้"
+        )
+
+    def _check(self, slot: WorkerSlot, now: float) -> None:
+        process = slot.process
+        if process is not None and process.is_alive():
+            return
+
+        if process is not None:
+            # เพิ่งพบว่าตาย: คำนวณเวลาที่จะ restart
+            uptime = now - slot.started_at
+            slot.failures = 0 if uptime >= STABLE_UPTIME else slot.failures + 1
+            delay = min(MAX_RESTART_DELAY, 2**slot.failures) if slot.failures else 0
+            logger.warning(
+                f"worker {slot.index} หยุดทำงาน (exit code {process.exitcode}) "
+                f"จะเริ่มใหม่ใน {delay:g} วินาที"
+            )
+            self._release(slot)
+            slot.status = {}
+            slot.restart_at = now + delay
+            return
+
+        if now >= slot.restart_at:
+            slot.restarts += 1
+            WORKER_RESTARTS.inc(worker=str(slot.index))
+            self._start(slot)
+
+    def _drain_status(self) -> None:
+        for slot in self.slots:
+            try:
+                while slot.conn is not None and slot.conn.poll():
+                    slot.status = slot.conn.recv()
+            except (EOFError, OSError):
+                pass
+
+    def _release(self, slot: WorkerSlot) -> None:
+        slot.process.close()
+        slot.process = None
+        slot.conn.close()
+        slot.conn = None
+
+    def summary(self) -> Tuple[int, int, int]:
+        """(worker ที่ทำงานอยู่, ผู้ใช้ทั้งหมด, การบันทึกที่กำลังทำงาน)"""
+        alive = sum(1 for s in self.slots if s.process and s.process.is_alive())
+        users = sum(len(s.users) for s in self.slots)
+        active = sum(
+            1
+            for s in self.slots
+            for is_active, _ in s.status.get("recordings", {}).values()
+            if is_active
+        )
+        return alive, users, active
+
+    def _collect(self) -> None:
+        active = 0
+        for slot in self.slots:
+            alive = slot.process is not None and slot.process.is_alive()
+            WORKER_UP.set(1 if alive else 0, worker=str(slot.index))
+            for user, (is_active, size) in slot.status.get("recordings", {}).items():
+                active += is_active
+                RECORDED_BYTES.set_total(size, user=user)
+        ACTIVE_RECORDINGS.set(active)
+
+    def _log_summary(self) -> None:
+        alive, users, active = self.summary()
+        logger.info(
+            f"worker ทำงาน {alive}/{len(self.slots)} ตรวจสอบ {users} ผู้ใช้ "
+            f"กำลังบันทึก {active} รายการ"
+        )
+
+    async def run(self) -> None:
+        for slot in self.slots:
+            self._start(slot)
+
+        next_summary = time.monotonic() + self.status_interval
+        try:
+            while not stop_event.is_set():
+                await asyncio.sleep(1)
+                now = time.monotonic()
+                self._drain_status()
+                for slot in self.slots:
+                    self._check(slot, now)
+                if now >= next_summary:
+                    self._log_summary()
+                    next_summary = now + self.status_interval
+        finally:
+            await self._shutdown()
+
+    async def _shutdown(self) -> None:
+        logger.info("กำลังหยุด worker ทั้งหมดและรอให้การบันทึกเสร็จสิ้น...")
+        for slot in self.slots:
+            if slot.process is not None and slot.process.is_alive():
+                slot.process.terminate()
+        while any(s.process and s.process.is_alive() for s in self.slots):
+            await asyncio.sleep(0.5)
+            self._drain_status()
+        for slot in self.slots:
+            if slot.process is not None:
+                self._release(slot)
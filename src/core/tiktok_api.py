@@ -1,10 +1,12 @@
 import re
 import orjson  # ใช้ orjson เพื่อประสิทธิภาพในการ parse JSON
-from typing import Union, List, Dict
+from typing import AsyncIterator, Union, List, Dict
 
-from http_utils.async_http_client import AsyncHttpClient
+from http_utils.async_http_client import AsyncHttpClient, get_shared_client
 from utils.enums import StatusCode, TikTokError
 from utils.logger_manager import logger
+from utils.metrics import instrument_api
+from utils.profiling import profile_section
 from utils.custom_exceptions import (
     UserLiveError,
     TikTokRecorderError,
@@ -12,21 +14,39 @@ from utils.custom_exceptions import (
 )
 
 from core.common import TikTokUrlParser
+from core.quality import (
+    FLV_PULL_RANKS,
+    QUALITY_RANKS,
+    SDK_KEY_RANKS,
+    StreamVariant,
+)
+from core.room_cache import RoomIdCache, get_room_cache
 
 
 class TikTokAPI:
-    def __init__(self, proxy, cookies):
+    def __init__(
+        self,
+        proxy,
+        cookies,
+        http_client: AsyncHttpClient = None,
+        room_cache: RoomIdCache = None,
+    ):
         self.BASE_URL = "https://www.tiktok.com"
         self.WEBCAST_URL = "https://webcast.tiktok.com"
         self.API_URL = "https://www.tiktok.com/api-live/user/room/"
         self.EULER_API = "https://tiktok.eulerstream.com"
         self.TIKREC_API = "https://tikrec.com"
 
-        self.http_client = AsyncHttpClient(proxy, cookies)
+        # ใช้ HTTP client ที่แชร์ร่วมกันทั้ง process เพื่อให้ทุก recorder ใช้ connection pool เดียวกัน
+        self.http_client = http_client or get_shared_client(proxy, cookies)
+        self.room_cache = room_cache if room_cache is not None else get_room_cache()
 
     async def close(self):
-        await self.http_client.close()
+        # ไม่ปิด http_client: client ที่แชร์ร่วมกันจะถูกปิดครั้งเดียวตอนจบโปรแกรม
+        # (close_shared_clients) ส่วน client ที่ส่งเข้ามาเป็นของผู้เรียก
+        pass
 
+    @instrument_api
     async def is_country_blacklisted(self) -> bool:
         """
         ตรวจสอบว่าผู้ใช้อยู่ในประเทศที่ถูกบล็อกซึ่งต้องเข้าสู่ระบบหรือไม่
@@ -40,6 +60,7 @@ class TikTokAPI:
             logger.error(f"เกิดข้อผิดพลาดในการตรวจสอบ country blacklist: {e}")
             return False
 
+    @instrument_api
     async def is_room_alive(
         self, room_id: Union[str, List[str]]
     ) -> Union[bool, Dict[str, bool]]:
@@ -62,7 +83,8 @@ class TikTokAPI:
                 f"?aid=1988&region=CH&room_ids={room_ids_str}&user_is_login=true"
             )
 
-            data = orjson.loads(response.content)
+            with profile_section("TikTokAPI.check_alive_json"):
+                data = orjson.loads(response.content)
 
             if "data" not in data:
                 return {} if is_batch else False
@@ -85,6 +107,7 @@ class TikTokAPI:
             logger.error(f"เกิดข้อผิดพลาดในการตรวจสอบสถานะห้อง (is_room_alive): {e}")
             return {} if is_batch else False
 
+    @instrument_api
     async def get_sec_uid(self):
         """
         คืนค่า sec_uid ของผู้ใช้ที่ยืนยันตัวตนแล้ว
@@ -101,6 +124,7 @@ class TikTokAPI:
             logger.error(f"เกิดข้อผิดพลาดในการดึง sec_uid: {e}")
             return None
 
+    @instrument_api
     async def get_user_from_room_id(self, room_id) -> str:
         """
         รับ room_id แล้วคืนค่า username
@@ -109,8 +133,10 @@ class TikTokAPI:
             response = await self.http_client.get(
                 f"{self.WEBCAST_URL}/webcast/room/info/?aid=1988&room_id={room_id}"
             )
-            data = orjson.loads(response.content)
-            data_str = str(data)
+            with profile_section("TikTokAPI.room_info_json"):
+                data = orjson.loads(response.content)
+            with profile_section("TikTokAPI.private_check"):
+                data_str = str(data)
 
             if "Follow the creator to watch their LIVE" in data_str:
                 raise UserLiveError(TikTokError.ACCOUNT_PRIVATE_FOLLOW)
@@ -127,6 +153,7 @@ class TikTokAPI:
             logger.error(f"เกิดข้อผิดพลาดในการดึง user จาก room_id: {e}")
             raise TikTokRecorderError(TikTokError.USERNAME_ERROR)
 
+    @instrument_api
     async def get_room_and_user_from_url(self, live_url: str):
         """
         รับ url แล้วคืนค่า user และ room_id
@@ -149,7 +176,7 @@ class TikTokAPI:
                 if not user:
                     raise LiveNotFound(TikTokError.INVALID_TIKTOK_LIVE_URL)
 
-            room_id = await self.get_room_id_from_user(user)
+            room_id = await self.get_room_id_from_user(user, use_cache=False)
 
             return user, room_id
         except Exception as e:
@@ -165,49 +192,65 @@ class TikTokAPI:
         signed_path = data.get("signed_path")
         return f"{self.BASE_URL}{signed_path}"
 
-    async def get_room_id_from_user(self, user: str) -> str | None:
-        """รับ username แล้วคืนค่า room_id"""
-        try:
-            try:
-                response = await self.http_client.get(
-                    f"{self.BASE_URL}/@{user}/live", allow_redirects=False
-                )
-                if response.status_code == 200:
-                    room_id = TikTokUrlParser.parse_room_id_from_html(response.text)
-                    if room_id:
-                        return room_id
-            except Exception as e:
-                logger.warning(f"วิธีการ Scrape ล้มเหล้ว (Fallback ไปใช้ API): {e}")
-
-            signed_url = await self._tikrec_get_room_id_signed_url(user)
-            response = await self.http_client.get(signed_url)
-            content = response.text
+    @instrument_api
+    async def get_room_id_from_user(
+        self, user: str, use_cache: bool = True
+    ) -> str | None:
+        """รับ username แล้วคืนค่า room_id (ผ่านแคชก่อน หากเปิดใช้งาน)"""
+        if use_cache:
+            entry = self.room_cache.get(user)
+            if entry is not None:
+                return entry.live_room_id
 
-            if not content or "Please wait" in content:
-                raise UserLiveError(TikTokError.WAF_BLOCKED)
-
-            data = orjson.loads(response.content)
-            return (data.get("data") or {}).get("user", {}).get("roomId")
+        try:
+            room_id = await self._fetch_room_id_from_user(user)
         except Exception as e:
             logger.error(f"เกิดข้อผิดพลาดในการดึง room_id จาก user: {e}")
             return None
 
-    async def get_followers_list(self, sec_uid) -> list:
-        """
-        คืนค่ารายชื่อผู้ติดตามทั้งหมดสำหรับผู้ใช้ที่ยืนยันตัวตนแล้วโดยการแบ่งหน้า
-        """
-        followers = []
-        cursor = 0
-        has_more = True
+        # แคชเฉพาะผลลัพธ์ที่ได้จาก TikTok จริง (รวมถึงกรณีไม่พบห้อง) ไม่แคชข้อผิดพลาด
+        self.room_cache.set(user, str(room_id) if room_id else None)
+        return room_id
 
+    async def _fetch_room_id_from_user(self, user: str) -> str | None:
+        live_url = f"{self.BASE_URL}/@{user}/live"
+        html = None
         try:
-            response = await self.http_client.get(
+            response = await self.http_client.get(live_url, allow_redirects=False)
+            if response.status_code == 200:
+                html = response.text
+                room_id = TikTokUrlParser.parse_room_id_from_html(html)
+                if room_id:
+                    return room_id
+        except Exception as e:
+            logger.warning(f"วิธีการ Scrape ล้มเหล้ว (Fallback ไปใช้ API): {e}")
+
+        # หน้า WAF/captcha ตอบกลับด้วยสถานะ 200 จึงต้องแจ้ง rate limiter เอง
+        # และไม่ fallback ไปยัง API ซึ่งอยู่บนโดเมนเดียวกันและจะถูกบล็อกเช่นกัน
+        if html is not None and TikTokUrlParser.is_challenge_page(html):
+            self.http_client.report_blocked(live_url)
+            raise UserLiveError(TikTokError.WAF_BLOCKED)
+
+        signed_url = await self._tikrec_get_room_id_signed_url(user)
+        response = await self.http_client.get(signed_url)
+        content = response.text
+
+        if not content or "Please wait" in content:
+            self.http_client.report_blocked(signed_url)
+            raise UserLiveError(TikTokError.WAF_BLOCKED)
+
+        data = orjson.loads(response.content)
+        return (data.get("data") or {}).get("user", {}).get("roomId")
+
+    def _followers_page_url(self, sec_uid, cursor: int, count: int) -> str:
+        if cursor == 0:
+            return (
                 f"{self.BASE_URL}/api/user/list/?"
                 "WebIdLastTime=1747672102&aid=1988&app_language=it-IT&app_name=tiktok_web&"
                 "browser_language=it-IT&browser_name=Mozilla&browser_online=true&"
                 "browser_platform=Linux%20x86_64&"
                 "browser_version=5.0%20%28X11%3B%20Linux%20x86_64%29%20AppleWebKit%2F537.36%20%28KHTML%2C%20like%20Gecko%29%20Chrome%2F140.0.0.0%20Safari%2F537.36&"
-                "channel=tiktok_web&cookie_enabled=true&count=5&data_collection_enabled=true&"
+                f"channel=tiktok_web&cookie_enabled=true&count={count}&data_collection_enabled=true&"
                 "device_id=7506194516308166166&device_platform=web_pc&focus_state=true&"
                 "from_page=user&history_len=3&is_fullscreen=false&is_page_visible=true&"
                 "maxCursor=0&minCursor=0&odinId=7246312836442604570&os=linux&priority_region=IT&"
@@ -217,43 +260,71 @@ class TikTokAPI:
                 "msToken=GphHoLvRR4QxA5AWVwDkrs3AbumoK5H8toE8LVHtj6cce3ToGdXhMfvDWzOXG-0GXUWoaGVHrwGNA4k_NnjuFFnHgv2S5eMjsvtkAhwMPa13xLmvP7tumx0KreFjPwTNnOj-BvAkPdO5Zrev3hoFBD9lHVo=&X-Bogus=&X-Gnarly="
             )
 
-            while has_more:
-                url = (
-                    "https://www.tiktok.com/api/user/list/?"
-                    "WebIdLastTime=1747672102&aid=1988&app_language=it-IT&app_name=tiktok_web"
-                    "&browser_language=it-IT&browser_name=Mozilla&browser_online=true"
-                    "&browser_platform=Linux%20x86_64&browser_version=5.0%20%28X11%3B%20Linux%20x86_64%29%20AppleWebKit%2F537.36%20%28KHTML%2C%20like%20Gecko%29%20Chrome%2F140.0.0.0%20Safari%2F537.36&channel=tiktok_web&"
-                    "cookie_enabled=true&count=5&data_collection_enabled=true&device_id=7506194516308166166"
-                    "&device_platform=web_pc&focus_state=true&from_page=user&history_len=3&"
-                    f"is_fullscreen=false&is_page_visible=true&maxCursor={cursor}&minCursor={cursor}&"
-                    "odinId=7246312836442604570&os=linux&priority_region=IT&referer=&"
-                    "region=IT&scene=21&screen_height=1080&screen_width=1920"
-                    "&tz_name=Europe%2FRome&user_is_login=true&"
-                    f"secUid={sec_uid}&verifyFp=verify_mh4yf0uq_rdjp1Xwt_OoTk_4Jrf_AS8H_sp31opbnJFre&"
-                    f"webcast_language=it-IT&X-Bogus=&X-Gnarly="
-                )
+        return (
+            f"{self.BASE_URL}/api/user/list/?"
+            "WebIdLastTime=1747672102&aid=1988&app_language=it-IT&app_name=tiktok_web"
+            "&browser_language=it-IT&browser_name=Mozilla&browser_online=true"
+            "&browser_platform=Linux%20x86_64&browser_version=5.0%20%28X11%3B%20Linux%20x86_64%29%20AppleWebKit%2F537.36%20%28KHTML%2C%20like%20Gecko%29%20Chrome%2F140.0.0.0%20Safari%2F537.36&channel=tiktok_web&"
+            f"cookie_enabled=true&count={count}&data_collection_enabled=true&device_id=7506194516308166166"
+            "&device_platform=web_pc&focus_state=true&from_page=user&history_len=3&"
+            f"is_fullscreen=false&is_page_visible=true&maxCursor={cursor}&minCursor={cursor}&"
+            "odinId=7246312836442604570&os=linux&priority_region=IT&referer=&"
+            "region=IT&scene=21&screen_height=1080&screen_width=1920"
+            "&tz_name=Europe%2FRome&user_is_login=true&"
+            f"secUid={sec_uid}&verifyFp=verify_mh4yf0uq_rdjp1Xwt_OoTk_4Jrf_AS8H_sp31opbnJFre&"
+            f"webcast_language=it-IT&X-Bogus=&X-Gnarly="
+        )
+
+    async def iter_followers_pages(
+        self, sec_uid, count: int = 5
+    ) -> AsyncIterator[List[str]]:
+        """
+        ดึงรายชื่อผู้ที่ติดตามทีละหน้า (เรียงจากที่ติดตามล่าสุด) เพื่อให้ผู้เรียกหยุดกลางทางได้
 
-                if cursor != 0:
-                    response = await self.http_client.get(url)
+        room_id ที่มากับรายชื่อจะถูกเก็บลงแคช ผู้ใช้เหล่านี้จึงไม่ต้อง scrape หน้าโปรไฟล์
+        """
+        cursor = 0
+        has_more = True
+
+        while has_more:
+            response = await self.http_client.get(
+                self._followers_page_url(sec_uid, cursor, count)
+            )
 
-                if response.status_code != StatusCode.OK:
-                    raise TikTokRecorderError("ไม่สามารถดึงรายชื่อผู้ติดตามได้")
+            if response.status_code != StatusCode.OK:
+                raise TikTokRecorderError("ไม่สามารถดึงรายชื่อผู้ติดตามได้")
 
-                data = orjson.loads(response.content)
-                user_list = data.get("userList", [])
+            data = orjson.loads(response.content)
 
-                for user in user_list:
-                    username = user.get("user", {}).get("uniqueId")
-                    if username:
-                        followers.append(username)
+            page = []
+            for user in data.get("userList", []):
+                info = user.get("user", {})
+                username = info.get("uniqueId")
+                if username:
+                    page.append(username)
+                    # "" = ไม่ได้ไลฟ์อยู่ ส่วนหากไม่มี field นี้ต้องค้นหาเองภายหลัง
+                    if "roomId" in info:
+                        self.room_cache.set(username, str(info["roomId"]) or None)
+            yield page
 
-                has_more = data.get("hasMore", False)
-                new_cursor = data.get("minCursor", 0)
+            has_more = data.get("hasMore", False)
+            new_cursor = data.get("minCursor", 0)
 
-                if new_cursor == cursor:
-                    break
+            if new_cursor == cursor:
+                break
 
-                cursor = new_cursor
+            cursor = new_cursor
+
+    @instrument_api
+    async def get_followers_list(self, sec_uid, count: int = 5) -> list:
+        """
+        คืนค่ารายชื่อผู้ติดตามทั้งหมดสำหรับผู้ใช้ที่ยืนยันตัวตนแล้วโดยการแบ่งหน้า
+        """
+        followers = []
+
+        try:
+            async for page in self.iter_followers_pages(sec_uid, count):
+                followers.extend(page)
 
             if not followers:
                 raise TikTokRecorderError("รายชื่อผู้ติดตามว่างเปล่า")
@@ -263,30 +334,43 @@ class TikTokAPI:
             logger.error(f"เกิดข้อผิดพลาดในการดึงรายชื่อผู้ติดตาม: {e}")
             return []
 
-    async def get_live_url(self, room_id: str) -> str | None:
+    @instrument_api
+    async def get_stream_variants(self, room_id: str) -> List[StreamVariant]:
         """
-        คืนค่า cdn (flv หรือ m3u8) ของการสตรีม
+        คืนค่าสตรีมทุกคุณภาพของห้อง (flv หรือ m3u8) เรียงจากคุณภาพสูงไปต่ำ
         """
         response = await self.http_client.get(
             f"{self.WEBCAST_URL}/webcast/room/info/?aid=1988&room_id={room_id}"
         )
-        data = orjson.loads(response.content)
+        with profile_section("TikTokAPI.room_info_json"):
+            data = orjson.loads(response.content)
 
-        if "This account is private" in str(data):
+        with profile_section("TikTokAPI.private_check"):
+            is_private = "This account is private" in str(data)
+        if is_private:
             raise UserLiveError(TikTokError.ACCOUNT_PRIVATE)
 
         stream_url = data.get("data", {}).get("stream_url", {})
 
-        flv_url = (
-            stream_url.get("flv_pull_url", {}).get("FULL_HD1")
-            or stream_url.get("flv_pull_url", {}).get("HD1")
-            or stream_url.get("flv_pull_url", {}).get("SD2")
-            or stream_url.get("flv_pull_url", {}).get("SD1")
-            or stream_url.get("rtmp_pull_url", "")
-        )
-
-        if flv_url:
-            return flv_url
+        flv_pull_url = stream_url.get("flv_pull_url", {})
+        flv_params = stream_url.get("flv_pull_url_params", {})
+        variants = [
+            StreamVariant(
+                name, flv_pull_url[name], rank, _bitrate(flv_params.get(name))
+            )
+            for name, rank in FLV_PULL_RANKS.items()
+            if flv_pull_url.get(name)
+        ]
+        if variants:
+            return variants
+
+        rtmp_url = stream_url.get("rtmp_pull_url", "")
+        if rtmp_url:
+            # ไม่ทราบคุณภาพ: ใช้ระดับต่ำสุดเพื่อให้ผ่านทุกเพดานคุณภาพ
+            # และไม่จอง bandwidth budget เกินจริง
+            return [
+                StreamVariant("rtmp_pull_url", rtmp_url, min(QUALITY_RANKS.values()))
+            ]
 
         sdk_data_str = (
             stream_url.get("live_core_sdk_data", {})
@@ -294,7 +378,7 @@ class TikTokAPI:
             .get("stream_data")
         )
         if not sdk_data_str:
-            return None
+            return []
 
         try:
             sdk_data = orjson.loads(sdk_data_str).get("data", {})
@@ -305,20 +389,48 @@ class TikTokAPI:
                 .get("qualities", [])
             )
             if not qualities:
-                return None
+                return []
 
             level_map = {q["sdk_key"]: q["level"] for q in qualities}
 
-            best_level = -1
-            best_flv = None
+            levels = {}
             for sdk_key, entry in sdk_data.items():
-                level = level_map.get(sdk_key, -1)
                 stream_main = entry.get("main", {})
-                if level > best_level:
-                    best_level = level
-                    best_flv = stream_main.get("flv")
+                if not stream_main.get("flv"):
+                    continue
+                variants.append(
+                    StreamVariant(
+                        sdk_key,
+                        stream_main["flv"],
+                        SDK_KEY_RANKS.get(sdk_key, 0),
+                        _bitrate(stream_main.get("sdk_params")),
+                    )
+                )
+                levels[sdk_key] = level_map.get(sdk_key, -1)
 
-            return best_flv
+            # sdk_key ที่ไม่รู้จักเรียงตาม level ของ TikTok ต่อจากระดับที่รู้จัก
+            variants.sort(key=lambda v: (v.rank, levels[v.name]), reverse=True)
+            return variants
         except Exception as e:
             logger.error(f"เกิดข้อผิดพลาดในการ parse SDK data: {e}")
-            return None
+            return []
+
+    async def get_live_url(self, room_id: str) -> str | None:
+        """
+        คืนค่า cdn (flv หรือ m3u8) ของการสตรีมคุณภาพสูงสุด
+        """
+        variants = await self.get_stream_variants(room_id)
+        return variants[0].url if variants else None
+
+
+def _bitrate(params) -> int | None:
+    """อ่าน vbitrate (bit/s) จาก JSON params ของสตรีม แล้วคืนค่าเป็น kbit/s"""
+    if not params:
+        return None
+    try:
+        if isinstance(params, str):
+            params = orjson.loads(params)
+        vbitrate = int(params.get("vbitrate") or 0)
+    except Exception:
+        return None
+    return vbitrate // 1000 or None
@@ -1,47 +1,42 @@
-import aiohttp
-
 from typing import Optional
-from src.utils.logger_manager import logger
-from src.config import config
+
+import orjson
+
+from utils.logger_manager import logger
+from config import config
+from http_utils.async_http_client import get_shared_client
 
 
 class AsyncTikTokAPI:
     def __init__(self):
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.tiktok.com/",
-        }
         self.proxy = config.proxy
+        # Reuse the process-wide pooled client instead of a session per call
+        self.http_client = get_shared_client(proxy=self.proxy)
 
     async def get_room_id_from_user(self, user: str) -> Optional[str]:
         """
-        Get room_id from username using aiohttp.
+        Get room_id from username using the shared HTTP client.
         """
         url = f"https://www.tiktok.com/@{user}/live"
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    url, headers=self.headers, proxy=self.proxy
-                ) as response:
-                    if response.status == 200:
-                        html = await response.text()
-
-                        # Use shared parser
-                        from src.core.common import TikTokUrlParser
+            response = await self.http_client.get(url)
+            if response.status_code == 200:
+                # Use shared parser
+                from core.common import TikTokUrlParser
 
-                        room_id = TikTokUrlParser.parse_room_id_from_html(html)
-                        if room_id:
-                            return room_id
+                room_id = TikTokUrlParser.parse_room_id_from_html(response.text)
+                if room_id:
+                    return room_id
 
-                    elif response.status == 404:
-                        logger.error(f"User {user} not found (404)")
-                        return None
-                    else:
-                        logger.warning(
-                            f"Failed to get room id for {user}. Status: {response.status}"
-                        )
-                        return None
+            elif response.status_code == 404:
+                logger.error(f"User {user} not found (404)")
+                return None
+            else:
+                logger.warning(
+                    f"Failed to get room id for {user}. Status: {response.status_code}"
+                )
+                return None
         except Exception as e:
             logger.error(f"Error getting room ID for {user}: {e}")
             return None
@@ -58,15 +53,12 @@ class AsyncTikTokAPI:
         url = f"https://webcast.tiktok.com/webcast/room/check_alive/?aid=1988&room_ids={room_id}"
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    url, headers=self.headers, proxy=self.proxy
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        data_list = data.get("data", [])
-                        if data_list:
-                            return data_list[0].get("alive", False)
+            response = await self.http_client.get(url)
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                data_list = data.get("data", [])
+                if data_list:
+                    return data_list[0].get("alive", False)
         except Exception as e:
             logger.error(f"Error checking live status for {room_id}: {e}")
 
@@ -1,14 +1,65 @@
 import asyncio
 import time
-from typing import Dict
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, List, Optional
 
 from core.tiktok_api import TikTokAPI
-from core.recorders.ffmpeg_recorder import FFmpegRecorder
+from core.scheduler import PollScheduler
+from core.checkpoint import get_checkpoint, recover_captures
+from core.storage import get_storage_manager
+from core.cluster import ClusterCoordinator, get_lease_store
+from core.control import get_control_server
+from core.events import Events, event_bus
+from core.followers import FollowersEngine
+from core.live_history import AdaptiveIntervalPolicy, get_live_history
+from core.watchlist import get_watch_list
+from core.quality import get_quality_policy
+from core.postprocess import get_post_processor
+from core.recorders import create_recorder
+from core.recorders.segments import RotationPolicy, manifest_path, reconnect_path
+from core.recorders.stitch import Capture, stitch_session
+from core.recorders.watchdog import StallWatchdog
 from utils.logger_manager import logger
+from utils.metrics import recordings
 from utils.custom_exceptions import LiveNotFound, UserLiveError, TikTokRecorderError
-from utils.enums import Mode, Error, TimeOut, TikTokError
+from utils.enums import Mode, TimeOut, TikTokError, RecorderBackend
 from utils.signals import stop_event
+from config import config
+
+
+@dataclass
+class RecordingSession:
+    """
+    สถานะของการบันทึกที่กำลังทำงานหนึ่งรายการ (ใช้แสดงผ่าน control API)
+    """
+
+    user: str
+    room_id: str
+    started_at: float = field(default_factory=time.time)
+    quality: Optional[str] = None
+    path: Optional[str] = None  # ไฟล์ของ part ปัจจุบัน
+    files: List[str] = field(default_factory=list)  # ไฟล์หรือ manifest ของทุก part
+    parts: int = 0
+    bytes_done: int = 0  # ขนาดของ part ที่จบแล้ว
+    recorder: Optional[object] = None  # recorder ของ part ปัจจุบัน
+
+    @property
+    def bytes_written(self) -> int:
+        current = self.recorder.bytes_written if self.recorder is not None else 0
+        return self.bytes_done + current
+
+    def to_dict(self) -> dict:
+        return {
+            "user": self.user,
+            "room_id": self.room_id,
+            "started_at": self.started_at,
+            "duration": time.time() - self.started_at,
+            "quality": self.quality,
+            "path": self.path,
+            "parts": self.parts,
+            "bytes_written": self.bytes_written,
+        }
 
 
 class TikTokRecorder:
@@ -23,13 +74,19 @@ class TikTokRecorder:
         proxy,
         output,
         duration,
+        recorder_backend=RecorderBackend.FFMPEG,
+        segment_time=None,
+        segment_size=None,
     ):
         # ตั้งค่า client API ของ TikTok
-        self.tiktok = TikTokAPI(proxy=proxy, cookies=cookies)
+        # หากมีการระบุ proxy จะใช้ HTTP client ที่ไม่ใช้ proxy (สร้างเพียงครั้งเดียวจาก pool ที่แชร์ร่วมกัน)
+        self.tiktok = TikTokAPI(proxy=None, cookies=cookies)
 
         # ข้อมูล TikTok
+        # ในโหมดอัตโนมัติสามารถส่งรายชื่อผู้ใช้หลายคนเพื่อให้ scheduler ตรวจสอบพร้อมกัน
         self.url = url
-        self.user = user
+        self.users = user if isinstance(user, list) else None
+        self.user = None if self.users else user
         self.room_id = room_id
 
         # การตั้งค่าเครื่องมือ
@@ -37,17 +94,28 @@ class TikTokRecorder:
         self.automatic_interval = automatic_interval
         self.duration = duration
         self.output = output
-
-        # หากมีการระบุ proxy ให้ตั้งค่า HTTP client โดยไม่ใช้ proxy
-        if proxy:
-            self.tiktok = TikTokAPI(proxy=None, cookies=cookies)
+        self.recorder_backend = recorder_backend
+        self.rotation = RotationPolicy(
+            max_duration=segment_time,
+            max_size=segment_size * 1024 * 1024 if segment_size else None,
+        )
+        # การบันทึกที่กำลังทำงานของแต่ละผู้ใช้ และผู้ใช้ที่ถูกสั่งให้หยุดก่อนจบไลฟ์
+        # (เช่นเสีย lease ในโหมด cluster หรือสั่งผ่าน control API)
+        self._recording: Dict[str, RecordingSession] = {}
+        self._stop_requested = set()
 
     async def _initialize(self):
         """
         ดำเนินการ initialization tasks แบบ async
         """
-        logger.info("กำลังตรวจสอบสถานะการบล็อกประเทศ...")
-        is_blacklisted = await self.tiktok.is_country_blacklisted()
+        checkpoint = get_checkpoint()
+        if checkpoint is not None and checkpoint.blacklist_cached():
+            is_blacklisted = False
+        else:
+            logger.info("กำลังตรวจสอบสถานะการบล็อกประเทศ...")
+            is_blacklisted = await self.tiktok.is_country_blacklisted()
+            if checkpoint is not None:
+                checkpoint.remember_blacklist(is_blacklisted)
         if is_blacklisted:
             if self.room_id is None:
                 raise TikTokRecorderError(TikTokError.COUNTRY_BLACKLISTED)
@@ -64,6 +132,8 @@ class TikTokRecorder:
                 raise TikTokRecorderError("ไม่สามารถดึงค่า sec_uid ได้")
 
             logger.info("โหมดผู้ติดตามเปิดใช้งาน\n")
+        elif self.users is not None:
+            logger.info(f"โหมดอัตโนมัติสำหรับ {len(self.users)} ผู้ใช้\n")
         else:
             if self.url:
                 logger.info(f"กำลังดึงข้อมูลผู้ใช้จาก URL: {self.url}")
@@ -77,7 +147,9 @@ class TikTokRecorder:
 
             if not self.room_id:
                 logger.info(f"กำลังดึง Room ID สำหรับผู้ใช้: {self.user}")
-                self.room_id = await self.tiktok.get_room_id_from_user(self.user)
+                self.room_id = await self.tiktok.get_room_id_from_user(
+                    self.user, use_cache=False
+                )
 
             logger.info(f"ชื่อผู้ใช้: {self.user}" + ("\n" if not self.room_id else ""))
             if self.room_id:
@@ -91,6 +163,16 @@ class TikTokRecorder:
         """
         รันโปรแกรมในโหมดที่เลือก
         """
+        # โหมด manual อาจมีหลาย recorder พร้อมกัน จึงควบคุมผ่าน API ได้เฉพาะโหมดอื่น
+        control = get_control_server() if self.mode != Mode.MANUAL else None
+        if control is not None:
+            control.attach(self)
+        checkpoint = get_checkpoint()
+        if checkpoint is not None:
+            checkpoint.attach_recorder(self)
+        storage = get_storage_manager()
+        if storage is not None:
+            storage.attach_recorder(self)
         try:
             await self._initialize()
 
@@ -103,127 +185,146 @@ class TikTokRecorder:
             elif self.mode == Mode.FOLLOWERS:
                 await self.followers_mode()
         finally:
+            if control is not None and control.recorder is self:
+                control.detach()
+            if checkpoint is not None:
+                checkpoint.detach_recorder(self)
+            if storage is not None:
+                storage.detach_recorder(self)
             await self.tiktok.close()
 
     async def manual_mode(self):
         is_alive = await self.tiktok.is_room_alive(self.room_id)
+        event_bus.publish(
+            Events.POLL_RESULT, self.user, room_id=self.room_id, live=is_alive
+        )
         if not is_alive:
             raise UserLiveError(f"@{self.user}: {TikTokError.USER_NOT_CURRENTLY_LIVE}")
 
         await self.start_recording(self.user, self.room_id)
 
     async def automatic_mode(self):
-        while not stop_event.is_set():
-            try:
-                self.room_id = await self.tiktok.get_room_id_from_user(self.user)
-
-                is_alive = await self.tiktok.is_room_alive(self.room_id)
-                if not is_alive:
-                    raise UserLiveError(
-                        f"@{self.user}: {TikTokError.USER_NOT_CURRENTLY_LIVE}"
-                    )
-
-                await self.start_recording(self.user, self.room_id)
-
-            except UserLiveError as ex:
-                logger.info(ex)
-                logger.info(f"รอ {self.automatic_interval} นาทีก่อนตรวจสอบใหม่\n")
-                await asyncio.sleep(self.automatic_interval * TimeOut.ONE_MINUTE)
-
-            except LiveNotFound as ex:
-                logger.error(f"ไม่พบไลฟ์: {ex}")
-                logger.info(f"รอ {self.automatic_interval} นาทีก่อนตรวจสอบใหม่\n")
-                await asyncio.sleep(self.automatic_interval * TimeOut.ONE_MINUTE)
-
-            except ConnectionError:
-                logger.error(Error.CONNECTION_CLOSED_AUTOMATIC)
-                await asyncio.sleep(TimeOut.CONNECTION_CLOSED * TimeOut.ONE_MINUTE)
-
-            except Exception as ex:
-                logger.error(f"ข้อผิดพลาดที่ไม่คาดคิด: {ex}\n")
-                await asyncio.sleep(5)
+        policy = None
+        if config.adaptive_polling:
+            policy = AdaptiveIntervalPolicy(
+                get_live_history(),
+                min_interval=config.poll_min_interval,
+                max_interval=config.poll_max_interval,
+            )
+
+        scheduler = PollScheduler(
+            self.tiktok,
+            interval=self.automatic_interval * TimeOut.ONE_MINUTE,
+            on_live=self.start_recording,
+            policy=policy,
+            request_budget=config.poll_request_budget,
+        )
+        users = self.users if self.users is not None else [self.user]
+        store = get_lease_store()
+        control = get_control_server()
+        watch_list = get_watch_list()
+        tasks = []
+
+        checkpoint = get_checkpoint()
+        if checkpoint is not None:
+            # warm restart: ไม่ตรวจสอบทุกผู้ใช้พร้อมกันตอนเริ่ม ยกเว้นผู้ที่มีการบันทึกค้างอยู่
+            scheduler.restore(
+                checkpoint.last_checks,
+                urgent=checkpoint.orphans.keys(),
+                spread=len(users) > scheduler.BATCH_SIZE or watch_list is not None,
+            )
+            checkpoint.attach_scheduler(scheduler)
+
+        coordinator = None
+        if store is None:
+            for user in users:
+                scheduler.add_user(user)
+        else:
+            # โหมด cluster: ตรวจสอบเฉพาะผู้ใช้ที่ node นี้ได้ lease
+            coordinator = ClusterCoordinator(store, scheduler, users, self.stop_user)
+            logger.info(f"โหมด cluster: node {store.node} ใช้ lease จาก {store.path}")
+        if control is not None:
+            control.attach(self, scheduler, coordinator)
+
+        if watch_list is not None:
+            watch_list.attach(
+                scheduler, coordinator, pinned=users, base_quality=config.user_quality
+            )
+            await watch_list.reload(force=True)
+            tasks.append(asyncio.create_task(watch_list.run()))
+
+        if coordinator is not None:
+            await coordinator.sync()
+            tasks.append(asyncio.create_task(coordinator.run()))
+        try:
+            # scheduler จะคืนค่าหลังการบันทึกทั้งหมดจบ lease จึงยังถูกต่ออายุระหว่างรอ
+            await scheduler.run()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if coordinator is not None:
+                await coordinator.leave()
 
     async def followers_mode(self):
-        active_recordings: Dict[str, asyncio.Task] = {}
-        user_room_cache: Dict[str, str] = {}
-
-        while not stop_event.is_set():
-            try:
-                followers = await self.tiktok.get_followers_list(self.sec_uid)
-                if not followers:
-                    logger.info("ไม่พบผู้ติดตาม หรือดึงข้อมูลล้มเหลว รอสักครู่...")
-                    await asyncio.sleep(self.automatic_interval * TimeOut.ONE_MINUTE)
-                    continue
-
-                for user in list(active_recordings.keys()):
-                    if active_recordings[user].done():
-                        logger.info(f"การบันทึกของ @{user} เสร็จสิ้น")
-                        del active_recordings[user]
-
-                users_to_check = [u for u in followers if u not in active_recordings]
-
-                if not users_to_check:
-                    await asyncio.sleep(self.automatic_interval * TimeOut.ONE_MINUTE)
-                    continue
-
-                users_needing_resolution = [
-                    u for u in users_to_check if u not in user_room_cache
-                ]
-
-                if users_needing_resolution:
-                    logger.info(
-                        f"กำลังค้นหา Room ID สำหรับ {len(users_needing_resolution)} ผู้ใช้ใหม่..."
-                    )
-                    tasks = [
-                        self.tiktok.get_room_id_from_user(u)
-                        for u in users_needing_resolution
-                    ]
-                    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                    for user, result in zip(users_needing_resolution, results):
-                        if isinstance(result, str) and result:
-                            user_room_cache[user] = result
-                        else:
-                            if isinstance(result, Exception):
-                                logger.debug(f"ไม่สามารถหา Room ID ของ {user}: {result}")
-
-                batch_check_map = {}
-                for user in users_to_check:
-                    if user in user_room_cache:
-                        batch_check_map[user] = user_room_cache[user]
-
-                if batch_check_map:
-                    room_ids_list = list(batch_check_map.values())
-                    chunk_size = 50
-                    for i in range(0, len(room_ids_list), chunk_size):
-                        chunk = room_ids_list[i : i + chunk_size]
-                        status_map = await self.tiktok.is_room_alive(chunk)
-
-                        for user, room_id in batch_check_map.items():
-                            if room_id in chunk and status_map.get(room_id):
-                                logger.info(f"@{user} กำลังไลฟ์! เริ่มต้นการบันทึก...")
-                                task = asyncio.create_task(
-                                    self.start_recording(user, room_id)
-                                )
-                                active_recordings[user] = task
+        engine = FollowersEngine(
+            self.tiktok,
+            self.sec_uid,
+            interval=self.automatic_interval * TimeOut.ONE_MINUTE,
+            on_live=self.start_recording,
+            page_size=config.followers_page_size,
+            full_sync_every=config.followers_full_sync_every,
+            check_concurrency=config.followers_check_concurrency,
+        )
+        checkpoint = get_checkpoint()
+        if checkpoint is not None:
+            engine.restore(checkpoint.follows)
+            checkpoint.attach_followers(engine)
+        await engine.run()
+
+    def stop_user(self, user):
+        """
+        สั่งหยุดการบันทึกของผู้ใช้ (ถ้ามี) โดยไฟล์ที่บันทึกแล้วยังถูกรวมตามปกติ
+        """
+        if user in self._recording:
+            self._stop_requested.add(user)
 
-                logger.info(
-                    f"ตรวจสอบผู้ติดตาม {len(users_to_check)} คนเรียบร้อยแล้ว รอ {self.automatic_interval} นาทีก่อนตรวจสอบรอบถัดไป..."
-                )
-                await asyncio.sleep(self.automatic_interval * TimeOut.ONE_MINUTE)
+    @property
+    def recordings(self) -> List[RecordingSession]:
+        return list(self._recording.values())
 
-            except Exception as ex:
-                logger.error(f"เกิดข้อผิดพลาดในลูป followers: {ex}")
-                await asyncio.sleep(60)
+    def _should_stop(self, user):
+        return stop_event.is_set() or user in self._stop_requested
 
     async def start_recording(self, user, room_id):
         """
         เริ่มบันทึกการไลฟ์
+
+        หากสตรีมหยุดส่งข้อมูลหรือหลุดระหว่างที่ห้องยังไลฟ์อยู่ จะขอ URL ใหม่และ
+        บันทึกต่อเป็น part ถัดไปภายในไม่กี่วินาที แล้วรวมทุก part เป็น session เดียว
+
+        คุณภาพสตรีมเลือกตาม QualityPolicy และคงเดิมตลอดทั้ง session
+
+        หากพื้นที่ดิสก์เหลือไม่พอจะ raise StorageFullError โดยไม่เริ่มบันทึก
+        คืนค่าจำนวนไบต์ที่บันทึกได้ทั้งหมดใน session (0 หากไม่ได้ข้อมูลเลย)
         """
+        storage = get_storage_manager()
+        if storage is not None:
+            storage.check_admission(user)
+
+        quality = get_quality_policy()
+        session = RecordingSession(user, room_id)
+        self._recording[user] = session
+        event_bus.publish(Events.LIVE_DETECTED, user, room_id=room_id)
         try:
-            live_url = await self.tiktok.get_live_url(room_id)
-            if not live_url:
+            variants = await self.tiktok.get_stream_variants(room_id)
+            variant = quality.choose(user, variants)
+            if variant is None:
                 raise LiveNotFound(TikTokError.RETRIEVE_LIVE_URL)
+            quality.reserve(user, variant)
+            live_url = variant.url
+            session.quality = variant.name
+            logger.info(f"คุณภาพสตรีมของ {user}: {variant.name}")
 
             current_date = time.strftime("%Y.%m.%d_%H-%M-%S", time.localtime())
 
@@ -234,38 +335,155 @@ class TikTokRecorder:
                 base_output = Path("downloads")
 
             user_dir = base_output / user
-            filename = f"TK_{user}_{current_date}.mp4"
-            full_path = user_dir / filename
             # --------------------------------
 
-            recorder = FFmpegRecorder()
-            stop_task = None  # Handle for duration task
-
             if self.duration:
                 logger.info(f"เริ่มบันทึกเป็นเวลา {self.duration} วินาที ")
-
-                async def stop_after_duration():
-                    await asyncio.sleep(self.duration)
-                    await recorder.stop_recording()
-
-                stop_task = asyncio.create_task(stop_after_duration())
             else:
                 logger.info("เริ่มบันทึก...")
+            event_bus.publish(
+                Events.RECORDING_STARTED,
+                user,
+                room_id=room_id,
+                quality=variant.name,
+                directory=str(user_dir),
+            )
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.duration if self.duration else None
+            captures = []
+            failures = 0
+
+            # บันทึกต่อจากการบันทึกที่ค้างก่อนรีสตาร์ท หากยังเป็นไลฟ์ห้องเดิม
+            checkpoint = get_checkpoint()
+            orphan = checkpoint.take_orphan(user, room_id) if checkpoint else None
+            if orphan is not None:
+                captures = recover_captures(orphan, time.time())
+                session.started_at = orphan.started_at
+                session.files = list(orphan.files)
+                session.bytes_done = sum(c.recorder.bytes_written for c in captures)
+
+            while True:
+                # ffmpeg ได้ครึ่งหนึ่งของ stall timeout เพื่อหยุดเองและเขียนไฟล์ MP4
+                # ให้สมบูรณ์ ก่อนที่ watchdog จะต้องสั่งหยุด
+                recorder = create_recorder(
+                    self.recorder_backend,
+                    self.rotation,
+                    read_timeout=config.stall_timeout / 2,
+                )
+                filename = f"TK_{user}_{current_date}{recorder.file_extension}"
+                full_path = user_dir / filename
+                if captures:
+                    full_path = Path(reconnect_path(str(full_path), len(captures) + 1))
+
+                started_at = time.time()
+                session.recorder, session.path = recorder, str(full_path)
+                session.files.append(
+                    manifest_path(str(full_path))
+                    if self.rotation.enabled
+                    else str(full_path)
+                )
+                try:
+                    stalled = await self._record_part(
+                        user, recorder, live_url, full_path, deadline
+                    )
+                finally:
+                    session.recorder = None
+                    session.bytes_done += recorder.bytes_written
+                    session.parts += 1
+                captures.append(Capture(recorder, started_at, time.time()))
+
+                if self._should_stop(user) or (
+                    deadline is not None and loop.time() >= deadline
+                ):
+                    break
+
+                # สตรีมหลุดหรือค้าง: ถ้าห้องยังไลฟ์อยู่ให้เชื่อมต่อใหม่ทันที
+                # แทนที่จะรอรอบตรวจสอบถัดไปซึ่งอาจนานหลายนาที
+                failures = 0 if recorder.bytes_written else failures + 1
+                if failures >= config.reconnect_attempts:
+                    logger.warning(
+                        f"เชื่อมต่อใหม่ไม่สำเร็จ {failures} ครั้งติดต่อกัน หยุดบันทึก {user}"
+                    )
+                    break
+
+                await asyncio.sleep(config.reconnect_delay)
+                if self._should_stop(user) or not await self.tiktok.is_room_alive(
+                    room_id
+                ):
+                    break
+                variants = await self.tiktok.get_stream_variants(room_id)
+                variant = quality.choose(user, variants, max_rank=variant.rank)
+                if variant is None:
+                    break
+                live_url = variant.url
+
+                reason = "ค้าง" if stalled else "หลุด"
+                logger.info(f"สตรีมของ {user} {reason} กำลังเชื่อมต่อใหม่...")
+
+            result = await stitch_session(captures)
+            event_bus.publish(
+                Events.RECORDING_FINISHED,
+                user,
+                room_id=room_id,
+                path=result,
+                parts=len(captures),
+                size=sum(capture.recorder.bytes_written for capture in captures),
+            )
+            if result:
+                logger.info(f"การบันทึกเสร็จสิ้น: {result}\n")
+                post_processor = get_post_processor()
+                if post_processor is not None:
+                    post_processor.submit(user, result)
 
-            try:
-                # FFmpegRecorder handles directory creation now, but logic above creates user_dir path
-                # start_recording now accepts string path
-                await recorder.start_recording(live_url, str(full_path))
-            finally:
-                # Cleanup duration task if recording ends early
-                if stop_task and not stop_task.done():
-                    stop_task.cancel()
+        except Exception as e:
+            logger.error(f"เกิดข้อผิดพลาดในการบันทึก {user}: {e}")
+            event_bus.publish(
+                Events.RECORDING_ERROR, user, room_id=room_id, error=str(e)
+            )
+        finally:
+            quality.release(user)
+            self._recording.pop(user, None)
+            self._stop_requested.discard(user)
+        return session.bytes_done
+
+    async def _record_part(self, user, recorder, live_url, full_path, deadline):
+        """
+        บันทึกสตรีมหนึ่งช่วงจนกว่าสตรีมจะจบ ค้าง หรือถูกสั่งหยุด
+        คืนค่า True หาก watchdog หยุดการบันทึกเพราะไม่มีข้อมูลเข้ามา
+        """
+
+        async def stop_when_requested():
+            # หยุดเมื่อครบเวลาที่กำหนด หรือเมื่อได้รับสัญญาณหยุดโปรแกรม
+            # (ffmpeg ได้รับ SIGINT เอง แต่ recorder แบบ native ต้องถูกสั่งหยุด)
+            loop = asyncio.get_running_loop()
+            while not self._should_stop(user):
+                if deadline is not None and loop.time() >= deadline:
+                    break
+                await asyncio.sleep(1)
+            await recorder.stop_recording()
+
+        watchdog = StallWatchdog(recorder, config.stall_timeout)
+        tasks = [
+            asyncio.create_task(stop_when_requested()),
+            asyncio.create_task(watchdog.run()),
+        ]
+
+        recordings.started(user, recorder)
+        try:
+            # FFmpegRecorder handles directory creation now, but logic above creates user_dir path
+            # start_recording now accepts string path
+            await recorder.start_recording(live_url, str(full_path))
+        finally:
+            recordings.finished(user, recorder)
+
+            # Cleanup helper tasks if recording ends early
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
                     try:
-                        await stop_task
+                        await task
                     except asyncio.CancelledError:
                         pass
 
-            logger.info(f"การบันทึกเสร็จสิ้น: {full_path}\n")
-
-        except Exception as e:
-            logger.error(f"เกิดข้อผิดพลาดในการบันทึก {user}: {e}")
+        return watchdog.stalled
@@ -0,0 +1,228 @@
+import asyncio
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from core.quality import get_quality_policy, quality_rank
+from utils.logger_manager import logger
+from utils.signals import stop_event
+
+# จำนวนบรรทัดที่ผิดรูปแบบที่แสดงใน log ต่อการโหลดหนึ่งครั้ง
+MAX_REPORTED_ERRORS = 10
+
+
+@dataclass(frozen=True)
+class WatchEntry:
+    """
+    ผู้ใช้หนึ่งคนในไฟล์รายชื่อ พร้อมค่าที่กำหนดเฉพาะคน (None = ใช้ค่าเริ่มต้น)
+    """
+
+    user: str
+    interval: Optional[float] = None  # วินาที
+    quality: Optional[str] = None
+
+
+def parse_line(line: str) -> Optional[WatchEntry]:
+    """
+    แปลงหนึ่งบรรทัดในรูปแบบ `username [interval=<นาที>] [quality=<คุณภาพ>]`
+    บรรทัดว่างและข้อความหลัง # ถูกข้าม หากรูปแบบไม่ถูกต้องจะ raise ValueError
+    """
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return None
+
+    user, *options = line.split()
+    user = user.lstrip("@")
+    if not user:
+        raise ValueError("ไม่มีชื่อผู้ใช้")
+
+    interval = quality = None
+    for option in options:
+        key, sep, value = option.partition("=")
+        if not sep:
+            raise ValueError(f"ตัวเลือก '{option}' ต้องอยู่ในรูป key=value")
+        if key == "interval":
+            interval = float(value) * 60
+            if not math.isfinite(interval) or interval <= 0:
+                raise ValueError("interval ต้องเป็นตัวเลขที่มากกว่า 0")
+        elif key == "quality":
+            quality_rank(value)
+            quality = value.lower()
+        else:
+            raise ValueError(f"ไม่รู้จักตัวเลือก '{key}'")
+    return WatchEntry(user, interval, quality)
+
+
+def load_watch_list(path: Path) -> Dict[str, WatchEntry]:
+    """
+    อ่านไฟล์รายชื่อทีละบรรทัด (ไม่โหลดทั้งไฟล์เข้าหน่วยความจำ)
+    ผู้ใช้ที่ซ้ำกันจะใช้บรรทัดหลังสุด ส่วนบรรทัดที่ผิดรูปแบบจะถูกข้าม
+    """
+    entries: Dict[str, WatchEntry] = {}
+    duplicates = errors = 0
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            try:
+                entry = parse_line(line)
+            except ValueError as ex:
+                errors += 1
+                if errors <= MAX_REPORTED_ERRORS:
+                    logger.warning(f"{path.name} บรรทัด {number}: {ex}")
+                continue
+            if entry is None:
+                continue
+            if entry.user in entries:
+                duplicates += 1
+            entries[entry.user] = entry
+
+    if duplicates or errors:
+        logger.warning(
+            f"{path.name}: ผู้ใช้ซ้ำ {duplicates} รายการ, บรรทัดผิดรูปแบบ {errors} บรรทัด"
+        )
+    return entries
+
+
+def diff_watch_lists(
+    old: Dict[str, WatchEntry], new: Dict[str, WatchEntry]
+) -> Tuple[Set[str], Set[str], Set[str]]:
+    """(ผู้ใช้ที่เพิ่ม, ผู้ใช้ที่ถูกลบ, ผู้ใช้ที่ค่าเปลี่ยน)"""
+    added = new.keys() - old.keys()
+    removed = old.keys() - new.keys()
+    changed = {user for user in new.keys() & old.keys() if new[user] != old[user]}
+    return added, removed, changed
+
+
+class WatchList:
+    """
+    รายชื่อผู้ใช้ของโหมดอัตโนมัติจากไฟล์ ที่แก้ไขได้ขณะโปรแกรมทำงาน
+
+    ตรวจสอบ mtime และขนาดของไฟล์ทุก poll_interval วินาที เมื่อไฟล์เปลี่ยนจะโหลดใหม่
+    (ใน thread) แล้วนำเฉพาะส่วนต่างไปใช้กับ scheduler ที่กำลังทำงาน ผู้ใช้ที่บรรทัด
+    ไม่เปลี่ยนจะไม่ถูกแตะต้อง ผู้ใช้ที่ถูกลบออกจะหยุดถูกตรวจสอบ แต่การบันทึกที่
+    กำลังทำงานอยู่จะบันทึกต่อจนไลฟ์จบ
+
+    หากโหลดไฟล์ไม่สำเร็จ (เช่นไฟล์หายไปชั่วคราว) จะใช้รายชื่อเดิมต่อไป
+    """
+
+    def __init__(self, path: str, poll_interval: float = 5.0):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.entries: Dict[str, WatchEntry] = {}
+        self.scheduler = None
+        self.coordinator = None
+        # ผู้ใช้ที่ระบุทาง command line จะไม่ถูกลบเมื่อไม่อยู่ในไฟล์
+        self.pinned: Set[str] = set()
+        # ค่าคุณภาพรายคนจาก config ใช้คืนค่าเมื่อบรรทัดในไฟล์ไม่ได้กำหนด
+        self.base_quality: Dict[str, str] = {}
+        self._signature: Optional[Tuple[int, int, int]] = None
+
+    def attach(
+        self,
+        scheduler,
+        coordinator=None,
+        pinned: Iterable[str] = (),
+        base_quality: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.scheduler = scheduler
+        self.coordinator = coordinator
+        self.pinned = set(pinned)
+        self.base_quality = {
+            user.lstrip("@"): quality for user, quality in (base_quality or {}).items()
+        }
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    async def reload(self, force: bool = False) -> bool:
+        """โหลดไฟล์ใหม่หากมีการเปลี่ยนแปลง คืนค่า True เมื่อมีการนำส่วนต่างไปใช้"""
+        signature = self._stat()
+        if signature is None:
+            if self._signature is not None or force:
+                logger.warning(f"ไม่พบไฟล์รายชื่อ {self.path} ใช้รายชื่อเดิมต่อไป")
+                self._signature = None
+            return False
+        if signature == self._signature and not force:
+            return False
+
+        try:
+            entries = await asyncio.to_thread(load_watch_list, self.path)
+        except (OSError, UnicodeDecodeError) as ex:
+            logger.error(f"โหลดไฟล์รายชื่อ {self.path} ไม่สำเร็จ: {ex}")
+            return False
+        self._signature = signature
+        self.apply(entries)
+        return True
+
+    def apply(self, entries: Dict[str, WatchEntry]) -> None:
+        added, removed, changed = diff_watch_lists(self.entries, entries)
+        old = self.entries
+        self.entries = entries
+
+        for user in added:
+            self._add(entries[user], old.get(user))
+        for user in changed:
+            self._add(entries[user], old[user])
+        for user in removed:
+            self._remove(old[user])
+
+        if added or removed or changed:
+            logger.info(
+                f"รายชื่อ {self.path.name}: {len(entries)} ผู้ใช้ "
+                f"(+{len(added)} -{len(removed)} ~{len(changed)})"
+            )
+
+    def _add(self, entry: WatchEntry, previous: Optional[WatchEntry]) -> None:
+        user = entry.user
+        if previous is None or previous.quality != entry.quality:
+            quality = entry.quality or self.base_quality.get(user)
+            if previous is not None or quality is not None:
+                get_quality_policy().set_user_quality(user, quality)
+
+        # interval ที่ถูกลบออกจากไฟล์ให้กลับไปใช้ค่าเริ่มต้นของ scheduler
+        interval = entry.interval or self.scheduler.interval
+        if self.coordinator is not None:
+            self.coordinator.add_user(user, interval=entry.interval)
+            if user in self.scheduler.users:
+                self.scheduler.add_user(user, interval=interval)
+        else:
+            self.scheduler.add_user(user, interval=interval)
+
+    def _remove(self, entry: WatchEntry) -> None:
+        user = entry.user
+        if entry.quality is not None:
+            get_quality_policy().set_user_quality(user, self.base_quality.get(user))
+        if user in self.pinned:
+            return
+        if self.coordinator is not None:
+            self.coordinator.remove_user(user)
+        self.scheduler.remove_user(user)
+
+    async def run(self) -> None:
+        """ตรวจสอบไฟล์เป็นระยะจนกว่าจะได้รับสัญญาณหยุดหรือถูก cancel"""
+        while not stop_event.is_set():
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload()
+            except Exception as ex:
+                logger.error(f"เกิดข้อผิดพลาดในการโหลดไฟล์รายชื่อ: {ex}")
+
+
+_watch_list: Optional[WatchList] = None
+
+
+def configure_watch_list(**kwargs) -> WatchList:
+    """
+    ใช้ไฟล์รายชื่อในโหมดอัตโนมัติ (เพิ่มเติมจากผู้ใช้ที่ระบุทาง command line)
+    """
+    global _watch_list
+    _watch_list = WatchList(**kwargs)
+    return _watch_list
+
+
+def get_watch_list() -> Optional[WatchList]:
+    return _watch_list
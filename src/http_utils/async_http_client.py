@@ -1,10 +1,50 @@
-from typing import Optional, Dict, Any
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, Tuple
+from urllib.parse import urlsplit
+
 from curl_cffi.requests import AsyncSession
 
+from http_utils.rate_limiter import RateLimiter
+from utils.metrics import record_http_failure
+
+# Per-host caps on concurrent requests. Hosts not listed fall back to
+# DEFAULT_HOST_LIMIT. All of them share the session-wide MAX_CONNECTIONS pool.
+DEFAULT_HOST_LIMITS: Dict[str, int] = {
+    "www.tiktok.com": 8,
+    "webcast.tiktok.com": 16,
+    "tikrec.com": 4,
+}
+DEFAULT_HOST_LIMIT = 8
+MAX_CONNECTIONS = 32
+# Long-lived media downloads get their own curl session so that live
+# streams never occupy the API connection pool.
+MAX_STREAMS = 256
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    waiting: int = 0
+    wait_time: float = 0.0
+    request_time: float = 0.0
+
 
 class AsyncHttpClient:
     def __init__(
-        self, proxy: Optional[str] = None, cookies: Optional[Dict[str, str]] = None
+        self,
+        proxy: Optional[str] = None,
+        cookies: Optional[Dict[str, str]] = None,
+        max_connections: int = MAX_CONNECTIONS,
+        host_limits: Optional[Dict[str, int]] = None,
+        default_host_limit: int = DEFAULT_HOST_LIMIT,
+        rate_limits: Optional[Dict[str, float]] = None,
+        max_streams: int = MAX_STREAMS,
     ):
         self.proxy = proxy
         self.cookies = cookies
@@ -13,29 +53,187 @@ class AsyncHttpClient:
             "Referer": "https://www.tiktok.com/",
         }
         self.session: Optional[AsyncSession] = None
+        self.stream_session: Optional[AsyncSession] = None
+
+        self.max_connections = max_connections
+        self.host_limits = dict(
+            DEFAULT_HOST_LIMITS if host_limits is None else host_limits
+        )
+        self.default_host_limit = default_host_limit
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_stats: Dict[str, HostStats] = {}
+        self.rate_limiter = RateLimiter(rate_limits)
+        self.max_streams = max_streams
+
+    def _new_session(self, max_clients: int) -> AsyncSession:
+        return AsyncSession(
+            headers=self.headers,
+            cookies=self.cookies,
+            impersonate="chrome120",
+            max_clients=max_clients,
+            proxies={"http": self.proxy, "https": self.proxy} if self.proxy else None,
+        )
 
     async def _ensure_session(self):
         if self.session is None:
-            self.session = AsyncSession(
-                headers=self.headers,
-                cookies=self.cookies,
-                impersonate="chrome120",
-                proxies={"http": self.proxy, "https": self.proxy}
-                if self.proxy
-                else None,
-            )
+            # curl keeps finished connections in the multi handle's cache, so
+            # a single long-lived session reuses TLS connections per host.
+            self.session = self._new_session(self.max_connections)
 
-    async def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs):
+    def _host_slot(self, url: str) -> Tuple[asyncio.Semaphore, HostStats]:
+        host = urlsplit(url).hostname or ""
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            limit = self.host_limits.get(host, self.default_host_limit)
+            semaphore = asyncio.Semaphore(limit)
+            self._host_semaphores[host] = semaphore
+            self._host_stats[host] = HostStats()
+        return semaphore, self._host_stats[host]
+
+    async def request(self, method: str, url: str, **kwargs):
         await self._ensure_session()
         kwargs.setdefault("timeout", 10)
-        return await self.session.get(url, params=params, **kwargs)
+
+        # Queue for a rate-limit token first so throttled callers do not
+        # hold a connection slot while they wait.
+        await self.rate_limiter.acquire(url)
+
+        semaphore, stats = self._host_slot(url)
+        queued_at = time.monotonic()
+        stats.waiting += 1
+        async with semaphore:
+            started = time.monotonic()
+            stats.waiting -= 1
+            stats.wait_time += started - queued_at
+            stats.requests += 1
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+            try:
+                response = await self.session.request(method, url, **kwargs)
+                if response.status_code == 429:
+                    self.rate_limiter.on_blocked(url)
+                    record_http_failure(blocked=True)
+                else:
+                    self.rate_limiter.on_success(url)
+                    if response.status_code >= 400:
+                        record_http_failure()
+                return response
+            except Exception:
+                stats.errors += 1
+                record_http_failure()
+                raise
+            finally:
+                stats.in_flight -= 1
+                stats.request_time += time.monotonic() - started
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs):
+        return await self.request("GET", url, params=params, **kwargs)
 
     async def post(self, url: str, data: Any = None, json: Any = None, **kwargs):
-        await self._ensure_session()
-        kwargs.setdefault("timeout", 10)
-        return await self.session.post(url, data=data, json=json, **kwargs)
+        return await self.request("POST", url, data=data, json=json, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, url: str, **kwargs):
+        """
+        Open a streaming GET (e.g. a live FLV pull URL). A numeric timeout
+        applies to connecting and to stalls, not to the whole transfer.
+        """
+        if self.stream_session is None:
+            self.stream_session = self._new_session(self.max_streams)
+        kwargs.setdefault("timeout", 30)
+
+        response = await self.stream_session.request("GET", url, stream=True, **kwargs)
+        try:
+            yield response
+        finally:
+            # aclose() waits for the transfer to end, which on a stalled
+            # connection only happens at the timeout; abort it instead
+            task = response.astream_task
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.wait([task])
+            else:
+                await response.aclose()
+
+    def report_blocked(self, url: str):
+        """Signal a block the status code did not show (e.g. a WAF page)."""
+        self.rate_limiter.on_blocked(url)
+        record_http_failure(blocked=True)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host pool statistics (counts and cumulative seconds)."""
+        return {
+            host: {
+                **asdict(stats),
+                "limit": self.host_limits.get(host, self.default_host_limit),
+            }
+            for host, stats in self._host_stats.items()
+        }
 
     async def close(self):
         if self.session:
             await self.session.close()
             self.session = None
+        if self.stream_session:
+            await self.stream_session.close()
+            self.stream_session = None
+
+
+_pool_settings: Dict[str, Any] = {}
+_shared_clients: Dict[Tuple, AsyncHttpClient] = {}
+
+
+def configure_pool(
+    max_connections: Optional[int] = None,
+    host_limits: Optional[Dict[str, int]] = None,
+    default_host_limit: Optional[int] = None,
+    rate_limits: Optional[Dict[str, float]] = None,
+):
+    """Set the limits used by clients created through get_shared_client."""
+    if max_connections is not None:
+        _pool_settings["max_connections"] = max_connections
+    if host_limits is not None:
+        _pool_settings["host_limits"] = {**DEFAULT_HOST_LIMITS, **host_limits}
+    if default_host_limit is not None:
+        _pool_settings["default_host_limit"] = default_host_limit
+    if rate_limits is not None:
+        _pool_settings["rate_limits"] = rate_limits
+
+
+def get_shared_client(
+    proxy: Optional[str] = None, cookies: Optional[Dict[str, str]] = None
+) -> AsyncHttpClient:
+    """
+    Return the process-wide client for this proxy/cookie combination,
+    creating it on first use.
+    """
+    key = (proxy, tuple(sorted((cookies or {}).items())))
+    client = _shared_clients.get(key)
+    if client is None:
+        client = AsyncHttpClient(proxy, cookies, **_pool_settings)
+        _shared_clients[key] = client
+    return client
+
+
+def shared_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Aggregate per-host statistics over every shared client."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for client in _shared_clients.values():
+        for host, stats in client.stats().items():
+            if host not in merged:
+                merged[host] = dict(stats)
+                continue
+            for name, value in stats.items():
+                if name == "limit":
+                    continue
+                if name == "peak_in_flight":
+                    merged[host][name] = max(merged[host][name], value)
+                else:
+                    merged[host][name] += value
+    return merged
+
+
+async def close_shared_clients():
+    for client in list(_shared_clients.values()):
+        await client.close()
+    _shared_clients.clear()
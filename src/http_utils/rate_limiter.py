@@ -0,0 +1,188 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from utils.logger_manager import logger
+
+# Requests per second per endpoint key. A key is either a host or a
+# "host/path-prefix"; the longest matching key wins.
+DEFAULT_RATE_LIMITS: Dict[str, float] = {
+    "www.tiktok.com": 5.0,
+    "webcast.tiktok.com": 10.0,
+    "tikrec.com": 2.0,
+}
+
+
+class TokenBucket:
+    """
+    Token bucket with AIMD rate control.
+
+    Callers queue in FIFO order until a token is available instead of
+    failing. A block (HTTP 429 or a WAF page) halves the rate and pauses the
+    bucket for a cooldown that doubles on consecutive blocks; every
+    successful response nudges the rate back up towards max_rate.
+
+    The rate at the last block is remembered: recovery is quick up to
+    safe_fraction of it, then slows to probe_fraction of the usual step, so
+    the bucket does not climb straight back into the next block. The memory
+    is cleared once max_rate is reached again without a block.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[float] = None,
+        min_rate: Optional[float] = None,
+        recovery: float = 0.02,
+        cooldown: float = 5.0,
+        max_cooldown: float = 300.0,
+        safe_fraction: float = 0.8,
+        probe_fraction: float = 0.05,
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 20
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.recovery = recovery
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.safe_fraction = safe_fraction
+        self.probe_fraction = probe_fraction
+        self.block_rate: Optional[float] = None
+
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._cooldown = cooldown
+        self._lock = asyncio.Lock()
+
+        self.acquired = 0
+        self.throttled = 0
+        self.blocks = 0
+        self.wait_time = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self) -> None:
+        queued_at = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                else:
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+
+        waited = time.monotonic() - queued_at
+        self.acquired += 1
+        if waited > 0.001:
+            self.throttled += 1
+            self.wait_time += waited
+
+    def on_success(self) -> None:
+        self._cooldown = self.base_cooldown
+        if self.rate >= self.max_rate:
+            return
+        step = self.max_rate * self.recovery
+        ceiling = self.max_rate
+        if self.block_rate is not None:
+            safe = self.block_rate * self.safe_fraction
+            if self.rate < safe:
+                ceiling = safe
+            else:
+                step *= self.probe_fraction
+        self.rate = min(ceiling, self.rate + step)
+        if self.rate >= self.max_rate:
+            self.block_rate = None
+
+    def on_blocked(self) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.blocks += 1
+        self.block_rate = self.rate
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        self._blocked_until = max(self._blocked_until, now + self._cooldown)
+        self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+
+
+@dataclass
+class _Route:
+    host: str
+    path: str
+
+
+class RateLimiter:
+    """Per-endpoint token buckets with adaptive backoff on 429/WAF responses."""
+
+    def __init__(self, limits: Optional[Dict[str, float]] = None):
+        self.limits = dict(DEFAULT_RATE_LIMITS if limits is None else limits)
+        self._routes: Dict[str, _Route] = {}
+        for key in self.limits:
+            host, _, path = key.partition("/")
+            self._routes[key] = _Route(host, "/" + path if path else "")
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _key_for(self, url: str) -> Optional[str]:
+        parts = urlsplit(url)
+        best = None
+        for key, route in self._routes.items():
+            if route.host != parts.hostname or not parts.path.startswith(route.path):
+                continue
+            if best is None or len(route.path) > len(self._routes[best].path):
+                best = key
+        return best
+
+    def bucket_for(self, url: str) -> Optional[TokenBucket]:
+        key = self._key_for(url)
+        if key is None:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.limits[key])
+        return bucket
+
+    async def acquire(self, url: str) -> None:
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            await bucket.acquire()
+
+    def on_success(self, url: str) -> None:
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            bucket.on_success()
+
+    def on_blocked(self, url: str) -> None:
+        bucket = self.bucket_for(url)
+        if bucket is None:
+            return
+        bucket.on_blocked()
+        logger.warning(
+            f"Rate limited by {urlsplit(url).hostname}, slowing down to "
+            f"{bucket.rate:.2f} req/s"
+        )
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            key: {
+                "rate": bucket.rate,
+                "max_rate": bucket.max_rate,
+                "block_rate": bucket.block_rate,
+                "acquired": bucket.acquired,
+                "throttled": bucket.throttled,
+                "blocks": bucket.blocks,
+                "wait_time": bucket.wait_time,
+            }
+            for key, bucket in self._buckets.items()
+        }
@@ -9,7 +9,111 @@ import asyncio
 
 def run_recordings(args, mode, cookies):
     async def _run():
-        if isinstance(args.user, list):
+        from http_utils.async_http_client import close_shared_clients
+
+        from core.events import event_bus
+        from core.checkpoint import get_checkpoint
+        from core.storage import get_storage_manager
+        from core.catalog import get_catalog
+        from core.room_cache import get_room_cache
+        from core.live_history import get_live_history
+        from core.postprocess import get_post_processor
+        from core.control import get_control_server
+        from utils.metrics import start_metrics_server, monitor_event_loop_lag
+        from utils.profiling import (
+            enable_profiling,
+            install_profiler_signals,
+            profiling_enabled,
+            section_report,
+        )
+        from utils.logger_manager import logger
+
+        enable_profiling(args.profile or config.profiling)
+        profile_dir = config.resolve_state_path(config.profile_dir)
+        if profile_dir is not None:
+            install_profiler_signals(profile_dir, config.profile_sample_seconds)
+
+        metrics_port = args.metrics_port or config.metrics_port
+        server = lag_task = None
+        if metrics_port:
+            server = await start_metrics_server(config.metrics_host, metrics_port)
+            lag_task = asyncio.create_task(monitor_event_loop_lag())
+
+        post_processor = get_post_processor()
+        if post_processor is not None:
+            post_processor.start()
+
+        control = get_control_server()
+        if control is not None:
+            await control.start()
+
+        checkpoint = get_checkpoint()
+        checkpoint_task = None
+        if checkpoint is not None:
+            checkpoint_task = asyncio.create_task(checkpoint.run())
+
+        catalog = get_catalog()
+        if catalog is not None:
+            catalog.subscribe()
+
+        storage = get_storage_manager()
+        storage_task = asyncio.create_task(storage.run())
+
+        try:
+            await _dispatch()
+        finally:
+            if post_processor is not None:
+                # Unfinished jobs stay in the queue file for the next run
+                await post_processor.stop()
+                if post_processor.pending:
+                    logger.info(
+                        f"{len(post_processor.pending)} post-processing jobs "
+                        "will resume on the next start"
+                    )
+            if control is not None:
+                control.close()
+            storage_task.cancel()
+            await asyncio.gather(storage_task, return_exceptions=True)
+            storage.save()
+            if checkpoint_task is not None:
+                checkpoint_task.cancel()
+                await asyncio.gather(checkpoint_task, return_exceptions=True)
+                # Recordings have finished by now, so only unresumed ones remain
+                checkpoint.save()
+            # Give subscribers a moment to handle the last lifecycle events
+            await event_bus.close()
+            if catalog is not None:
+                catalog.close()
+            if lag_task is not None:
+                lag_task.cancel()
+            if server is not None:
+                server.close()
+            if profiling_enabled():
+                logger.info(f"Slowest profiled sections:\n{section_report(limit=15)}")
+            await close_shared_clients()
+            get_room_cache().save()
+            get_live_history().save()
+
+    async def _dispatch():
+        from utils.enums import Mode
+
+        if mode == Mode.AUTOMATIC:
+            # A single recorder drives every user through the shared poll scheduler
+            await record_user(
+                args.user,
+                args.url,
+                args.room_id,
+                mode,
+                args.automatic_interval,
+                args.proxy,
+                args.output,
+                args.duration,
+                cookies,
+                args.recorder,
+                args.segment_time,
+                args.segment_size,
+            )
+        elif isinstance(args.user, list):
             tasks = []
             for user in args.user:
                 # Create a recorder for each user
@@ -31,6 +135,9 @@ def run_recordings(args, mode, cookies):
                         args.output,
                         args.duration,
                         cookies,
+                        args.recorder,
+                        args.segment_time,
+                        args.segment_size,
                     )
                 )
 
@@ -46,8 +153,169 @@ def run_recordings(args, mode, cookies):
                 args.output,
                 args.duration,
                 cookies,
+                args.recorder,
+                args.segment_time,
+                args.segment_size,
             )
 
+    from config import config
+    from http_utils.async_http_client import configure_pool
+    from core.room_cache import configure_room_cache
+    from core.live_history import configure_live_history
+    from core.quality import configure_quality_policy
+    from core.cluster import configure_lease_store
+    from core.postprocess import configure_post_processor
+    from core.control import configure_control_server
+    from core.watchlist import configure_watch_list
+    from core.checkpoint import configure_checkpoint
+    from core.storage import MB, configure_storage_manager
+    from core.catalog import configure_catalog
+
+    configure_pool(
+        max_connections=config.http_max_connections,
+        host_limits=config.http_host_limits,
+        rate_limits=config.http_rate_limits,
+    )
+    # A "not live" result is reused by the next poll and expires before the
+    # one after, so offline users are scraped at most every other poll
+    negative_ttl = config.room_cache_negative_ttl
+    if negative_ttl is None:
+        negative_ttl = 1.5 * args.automatic_interval * 60
+    configure_room_cache(
+        max_entries=config.room_cache_size,
+        ttl=config.room_cache_ttl,
+        negative_ttl=negative_ttl,
+        path=config.resolve_state_path(config.room_cache_file),
+    )
+    configure_live_history(path=config.resolve_state_path(config.live_history_file))
+    checkpoint_file = config.resolve_state_path(config.checkpoint_file)
+    if checkpoint_file is not None:
+        configure_checkpoint(
+            path=str(checkpoint_file),
+            interval=config.checkpoint_interval,
+            orphan_grace=config.checkpoint_orphan_grace,
+        )
+    catalog_file = config.resolve_state_path(config.catalog_file)
+    if catalog_file is not None:
+        configure_catalog(path=str(catalog_file))
+    index_file = config.resolve_state_path(config.retention_index_file)
+    configure_storage_manager(
+        root=args.output or "downloads",
+        min_free=int(config.storage_min_free * MB),
+        headroom=config.storage_headroom,
+        recording_rate=config.storage_recording_rate * MB,
+        priorities=config.user_priority,
+        check_interval=config.storage_check_interval,
+        retention_days=config.retention_days,
+        retention_max_size=_gigabytes(config.retention_max_size),
+        retention_user_quota=_gigabytes(config.retention_user_quota),
+        index_path=str(index_file) if index_file else None,
+        users=getattr(args, "retention_users", None),
+    )
+    budget = args.bandwidth_budget or config.bandwidth_budget
+    configure_quality_policy(
+        default=args.quality or config.stream_quality,
+        per_user=config.user_quality,
+        budget=budget * 1000 if budget else None,
+        bitrates=config.quality_bitrates,
+    )
+    post_process = args.post_process or config.post_process
+    if post_process:
+        queue_file = config.resolve_state_path(config.post_process_queue_file)
+        configure_post_processor(
+            steps=post_process,
+            workers=config.post_process_workers,
+            max_load=config.post_process_max_load,
+            nice=config.post_process_nice,
+            queue_path=str(queue_file) if queue_file else None,
+            transcode_args=config.post_process_transcode_args,
+        )
+    if args.watch_list:
+        configure_watch_list(path=args.watch_list, poll_interval=config.watch_list_poll)
+        if not args.user:
+            args.user = []
+    control_port = args.control_port or config.control_port
+    if control_port:
+        configure_control_server(
+            host=config.control_host, port=control_port, token=config.control_token
+        )
+    cluster_db = args.cluster or config.cluster_db
+    if cluster_db:
+        configure_lease_store(
+            path=str(config.resolve_state_path(cluster_db)),
+            node=config.cluster_node,
+            ttl=config.cluster_lease_ttl,
+        )
+
+    try:
+        asyncio.run(_run())
+    except KeyboardInterrupt:
+        pass
+
+
+def run_catalog(args):
+    from config import config
+    from core.catalog import RecordingCatalog, format_row
+    from utils.custom_exceptions import TikTokRecorderError
+    from utils.logger_manager import logger
+
+    path = config.resolve_state_path(config.catalog_file)
+    if path is None:
+        raise TikTokRecorderError("The recording catalog is disabled (CATALOG_FILE)")
+
+    catalog = RecordingCatalog(str(path))
+    try:
+        if args.catalog == "rebuild":
+            root = args.output or "downloads"
+            logger.info(f"Rebuilding the recording catalog from {root}...")
+            result = catalog.rebuild(root)
+            logger.info(
+                f"{result['found']} recordings on disk, {result['added']} new, "
+                f"{result['missing']} missing"
+            )
+            return
+
+        rows = catalog.query(
+            users=args.user, since=args.since, until=args.until, limit=args.limit
+        )
+        for row in rows:
+            print(format_row(row))
+        logger.info(f"{len(rows)} recordings")
+    finally:
+        catalog.close()
+
+
+def _gigabytes(value):
+    return int(value * 1024**3) if value else None
+
+
+def run_supervisor(args, mode, cookies, workers):
+    async def _run():
+        from config import config
+        from core.supervisor import WorkerSupervisor
+        from utils.metrics import start_metrics_server, monitor_event_loop_lag
+
+        from utils.logger_manager import logger
+
+        supervisor = WorkerSupervisor(run_recordings, args, mode, cookies, workers)
+        if config.control_port:
+            logger.warning("The control API is not available with multiple workers")
+
+        # Workers do not serve metrics; the supervisor exports their totals
+        metrics_port = args.metrics_port or config.metrics_port
+        server = lag_task = None
+        if metrics_port:
+            server = await start_metrics_server(config.metrics_host, metrics_port)
+            lag_task = asyncio.create_task(monitor_event_loop_lag())
+
+        try:
+            await supervisor.run()
+        finally:
+            if lag_task is not None:
+                lag_task.cancel()
+            if server is not None:
+                server.close()
+
     try:
         asyncio.run(_run())
     except KeyboardInterrupt:
@@ -55,13 +323,24 @@ def run_recordings(args, mode, cookies):
 
 
 async def record_user(
-    user, url, room_id, mode, interval, proxy, output, duration, cookies
+    user,
+    url,
+    room_id,
+    mode,
+    interval,
+    proxy,
+    output,
+    duration,
+    cookies,
+    recorder,
+    segment_time,
+    segment_size,
 ):
     from core.tiktok_recorder import TikTokRecorder
     from utils.logger_manager import logger
 
     try:
-        recorder = TikTokRecorder(
+        tiktok_recorder = TikTokRecorder(
             url=url,
             user=user,
             room_id=room_id,
@@ -71,8 +350,11 @@ async def record_user(
             proxy=proxy,
             output=output,
             duration=duration,
+            recorder_backend=recorder,
+            segment_time=segment_time,
+            segment_size=segment_size,
         )
-        await recorder.run()
+        await tiktok_recorder.run()
     except Exception as e:
         logger.error(f"{e}")
 
@@ -87,11 +369,29 @@ def main():
         # validate and parse command line arguments
         args, mode = validate_and_parse_args()
 
+        if args.catalog:
+            run_catalog(args)
+            return
+
         # read cookies from the config file
         cookies = read_cookies()
 
         # run the recordings based on the parsed arguments
-        run_recordings(args, mode, cookies)
+        from config import config
+        from utils.enums import Mode
+
+        workers = args.workers or config.workers
+        cluster = args.cluster or config.cluster_db
+        if (
+            workers > 1
+            and not cluster
+            and not args.watch_list
+            and mode == Mode.AUTOMATIC
+            and isinstance(args.user, list)
+        ):
+            run_supervisor(args, mode, cookies, workers)
+        else:
+            run_recordings(args, mode, cookies)
 
     except TikTokRecorderError as ex:
         logger.error(f"Application Error: {ex}")
@@ -2,7 +2,10 @@ import argparse
 import re
 
 from utils.custom_exceptions import ArgsParseError
-from utils.enums import Mode, Regex
+from utils.enums import Mode, Regex, RecorderBackend
+from core.quality import QUALITY_RANKS
+from core.postprocess import STEPS, is_valid_step
+from core.catalog import parse_date
 
 
 def parse_args():
@@ -31,6 +34,17 @@ def parse_args():
         action="store",
     )
 
+    parser.add_argument(
+        "-watch_list",
+        dest="watch_list",
+        help=(
+            "[automatic] File with one username per line, optionally followed by\n"
+            "interval=<minutes> and quality=<quality>. Changes to the file are\n"
+            "applied while running [Default: None]."
+        ),
+        action="store",
+    )
+
     parser.add_argument(
         "-room_id",
         dest="room_id",
@@ -86,14 +100,192 @@ def parse_args():
         action="store",
     )
 
+    parser.add_argument(
+        "-recorder",
+        dest="recorder",
+        help=(
+            "Recorder backend: (ffmpeg, native, native_mp4) [Default: ffmpeg]\n"
+            "[ffmpeg] => Remux the stream to MP4 with an ffmpeg process.\n"
+            "[native] => Stream the FLV directly to disk without ffmpeg.\n"
+            "[native_mp4] => Remux to fragmented MP4 in process (H.264/AAC only)."
+        ),
+        default="ffmpeg",
+        action="store",
+    )
+
+    parser.add_argument(
+        "-segment_time",
+        dest="segment_time",
+        help=(
+            "Split the recording into crash-safe segments of this many seconds.\n"
+            "A manifest listing the segments is written next to them [Default: None]."
+        ),
+        type=int,
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-segment_size",
+        dest="segment_size",
+        help="Split the recording into segments of this many MB (native recorders only) [Default: None].",
+        type=int,
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-quality",
+        dest="quality",
+        help="Highest stream quality: best, fullhd, hd, sd or ld [Default: best].",
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-bandwidth_budget",
+        dest="bandwidth_budget",
+        help=(
+            "Total Mbit/s for all recordings. New recordings are downgraded\n"
+            "to a lower quality when the budget would be exceeded [Default: None]."
+        ),
+        type=float,
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-post_process",
+        dest="post_process",
+        help=(
+            "Comma separated steps run on every finished recording:\n"
+            f"{', '.join(STEPS)} or exec:<command with {{path}}> [Default: None]."
+        ),
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-workers",
+        dest="workers",
+        help=(
+            "Split the users of automatic mode across N worker processes\n"
+            "[Default: 1]."
+        ),
+        type=int,
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-cluster",
+        dest="cluster",
+        help=(
+            "Shared SQLite lease file. Nodes pointed at the same file split\n"
+            "the users of automatic mode between them [Default: None]."
+        ),
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-metrics_port",
+        dest="metrics_port",
+        help="Serve Prometheus metrics on this port [Default: disabled].",
+        type=int,
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-control_port",
+        dest="control_port",
+        help=(
+            "Serve a local HTTP API to add/remove users, change their interval\n"
+            "or quality and stop single recordings at runtime [Default: disabled]."
+        ),
+        type=int,
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-catalog",
+        dest="catalog",
+        help=(
+            "Print recordings from the catalog and exit: (list, rebuild)\n"
+            "[list] => Newest recordings, filtered by -user, -since and -until.\n"
+            "[rebuild] => Catalog the files under -output and mark missing ones."
+        ),
+        nargs="?",
+        const="list",
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-since",
+        dest="since",
+        help="[catalog] Recordings started on or after YYYY-MM-DD [HH:MM].",
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-until",
+        dest="until",
+        help="[catalog] Recordings started before YYYY-MM-DD [HH:MM].",
+        default=None,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-limit",
+        dest="limit",
+        help="[catalog] Maximum number of recordings printed [Default: 100].",
+        type=int,
+        default=100,
+        action="store",
+    )
+
+    parser.add_argument(
+        "-profile",
+        dest="profile",
+        help=(
+            "Time hot code paths and log the slowest ones on exit.\n"
+            "SIGUSR1 dumps asyncio tasks, SIGUSR2 samples the event loop."
+        ),
+        action="store_true",
+    )
+
     args = parser.parse_args()
 
     return args
 
 
+def validate_catalog_args(args):
+    if args.catalog not in ["list", "rebuild"]:
+        raise ArgsParseError(
+            "Incorrect catalog value. Choose between 'list' or 'rebuild'."
+        )
+    try:
+        args.since = parse_date(args.since) if args.since else None
+        args.until = parse_date(args.until) if args.until else None
+    except ValueError as e:
+        raise ArgsParseError(f"Incorrect date: {e}.")
+    if args.limit < 1:
+        raise ArgsParseError("Incorrect limit value. Must be 1 or more.")
+    if args.user:
+        args.user = [u.lstrip("@").strip() for u in args.user.split(",") if u.strip()]
+    return args, None
+
+
 def validate_and_parse_args():
     args = parse_args()
 
+    if args.catalog:
+        return validate_catalog_args(args)
+
     if not args.mode:
         raise ArgsParseError(
             "Missing mode value. Please specify the mode (manual, automatic or followers)."
@@ -103,8 +295,25 @@ def validate_and_parse_args():
             "Incorrect mode value. Choose between 'manual', 'automatic' or 'followers'."
         )
 
+    if args.mode == "automatic" and not args.watch_list:
+        from config import config
+
+        args.watch_list = config.watch_list_file
+
+    if args.watch_list:
+        if args.mode != "automatic":
+            raise ArgsParseError("A watch list is only supported in automatic mode.")
+        if args.room_id or args.url:
+            raise ArgsParseError("Do not provide room_id or url with a watch list.")
+
     if args.mode in ["manual", "automatic"]:
         if not args.user and not args.room_id and not args.url:
+            from config import config
+
+            # USERS stands in for -user (and is pinned like it with a watch list)
+            args.user = ",".join(config.users) or None
+
+        if not args.user and not args.room_id and not args.url and not args.watch_list:
             raise ArgsParseError(
                 "Missing URL, username, or room ID. Please provide one of these parameters."
             )
@@ -145,6 +354,65 @@ def validate_and_parse_args():
             "Incorrect automatic_interval value. Must be one minute or more."
         )
 
+    try:
+        args.recorder = RecorderBackend(args.recorder)
+    except ValueError:
+        raise ArgsParseError(
+            "Incorrect recorder value. "
+            "Choose between 'ffmpeg', 'native' or 'native_mp4'."
+        )
+
+    if (args.segment_time is not None and args.segment_time < 1) or (
+        args.segment_size is not None and args.segment_size < 1
+    ):
+        raise ArgsParseError("Segment time and size must be positive values.")
+
+    if args.quality is not None:
+        args.quality = args.quality.lower()
+        if args.quality != "best" and args.quality not in QUALITY_RANKS:
+            raise ArgsParseError(
+                "Incorrect quality value. Choose between 'best', 'fullhd', 'hd', 'sd' or 'ld'."
+            )
+
+    if args.bandwidth_budget is not None and args.bandwidth_budget <= 0:
+        raise ArgsParseError("Bandwidth budget must be a positive value.")
+
+    if args.post_process:
+        args.post_process = [
+            step.strip() for step in args.post_process.split(",") if step.strip()
+        ]
+        for step in args.post_process:
+            if not is_valid_step(step):
+                raise ArgsParseError(
+                    f"Incorrect post_process step '{step}'. "
+                    f"Choose from {', '.join(STEPS)} or exec:<command>."
+                )
+
+    if args.workers is not None:
+        if args.workers < 1:
+            raise ArgsParseError("Incorrect workers value. Must be 1 or more.")
+        if args.workers > 1 and args.mode != "automatic":
+            raise ArgsParseError(
+                "Multiple workers are only supported in automatic mode."
+            )
+        if args.workers > 1 and args.watch_list:
+            raise ArgsParseError("Use either -watch_list or -workers, not both.")
+
+    if args.cluster:
+        if args.mode != "automatic":
+            raise ArgsParseError("Cluster mode is only supported in automatic mode.")
+        if args.workers is not None and args.workers > 1:
+            raise ArgsParseError("Use either -cluster or -workers, not both.")
+
+    if args.metrics_port is not None and not 0 < args.metrics_port < 65536:
+        raise ArgsParseError("Incorrect metrics_port value. Must be a valid port.")
+
+    if args.control_port is not None:
+        if not 0 < args.control_port < 65536:
+            raise ArgsParseError("Incorrect control_port value. Must be a valid port.")
+        if args.workers is not None and args.workers > 1:
+            raise ArgsParseError("The control API is not available with -workers.")
+
     if args.mode == "manual":
         mode = Mode.MANUAL
     elif args.mode == "automatic":
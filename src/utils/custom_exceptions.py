@@ -35,3 +35,23 @@ class NetworkError(TikTokRecorderError):
     """Raised for network-related errors."""
 
     pass
+
+
+class PostProcessError(TikTokRecorderError):
+    """Raised when a post-processing step fails."""
+
+    pass
+
+
+class ControlAPIError(TikTokRecorderError):
+    """Raised when a control API request cannot be carried out."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class StorageFullError(TikTokRecorderError):
+    """Raised when a recording may not start for lack of disk space."""
+
+    pass
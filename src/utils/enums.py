@@ -37,6 +37,19 @@ class Mode(IntEnum):
     FOLLOWERS = 2
 
 
+class RecorderBackend(Enum):
+    """
+    Enumeration that represents the available recorder implementations.
+    """
+
+    def __str__(self):
+        return str(self.value)
+
+    FFMPEG = "ffmpeg"
+    NATIVE = "native"
+    NATIVE_MP4 = "native_mp4"
+
+
 class Error(Enum):
     """
     Enumeration that contains possible errors while using TikTok-Live-Recorder.
@@ -0,0 +1,376 @@
+import asyncio
+import bisect
+import functools
+import math
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils.logger_manager import logger
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues, extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for every label set of this metric."""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels: str) -> None:
+        """Set a total that is tracked elsewhere (must never decrease)."""
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{self._labels(key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def clear(self) -> None:
+        self._values.clear()
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{self._labels(key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: per-bucket counts (not cumulative), sum, count
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = entry
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return int(entry[1][1]) if entry else 0
+
+    def total(self, **labels: str) -> float:
+        entry = self._values.get(self._key(labels))
+        return entry[1][0] if entry else 0.0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, (total, count)) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {int(count)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(
+            Histogram(name, documentation, labelnames, buckets=buckets)
+        )
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Register a callback that refreshes metrics right before a scrape."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+API_LATENCY = REGISTRY.histogram(
+    "tiktok_api_request_seconds", "Duration of TikTokAPI calls", ["method"]
+)
+API_ERRORS = REGISTRY.counter(
+    "tiktok_api_errors_total",
+    "TikTokAPI calls that raised or whose HTTP requests failed",
+    ["method"],
+)
+API_WAF_BLOCKS = REGISTRY.counter(
+    "tiktok_api_waf_blocks_total",
+    "Responses blocked by TikTok (HTTP 429 or WAF page)",
+    ["method"],
+)
+POLL_CYCLE = REGISTRY.histogram(
+    "poll_cycle_seconds", "Duration of a live status polling cycle", ["mode"]
+)
+ACTIVE_RECORDINGS = REGISTRY.gauge(
+    "active_recordings", "Recordings currently in progress"
+)
+RECORDED_BYTES = REGISTRY.counter(
+    "recorded_bytes_total", "Bytes of media written per user", ["user"]
+)
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds",
+    "Delay of event loop callbacks beyond their scheduled time",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+
+class _ApiCall:
+    __slots__ = ("method", "failed")
+
+    def __init__(self, method: str):
+        self.method = method
+        self.failed = False
+
+
+# The TikTokAPI call the current task is executing, so lower layers (the
+# HTTP client) can attribute failures and blocks to it
+_current_call: ContextVar[Optional[_ApiCall]] = ContextVar(
+    "current_api_call", default=None
+)
+
+
+def instrument_api(func):
+    """
+    Decorator recording latency and errors of an async TikTokAPI method.
+    A call counts as one error if it raised or any of its HTTP requests
+    failed, even when the method swallowed the failure.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        call = _ApiCall(name)
+        token = _current_call.set(call)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            call.failed = True
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, method=name)
+            if call.failed:
+                API_ERRORS.inc(method=name)
+            _current_call.reset(token)
+
+    return wrapper
+
+
+def record_http_failure(blocked: bool = False) -> None:
+    """Attribute a failed or blocked HTTP request to the running API call."""
+    call = _current_call.get()
+    if call is None:
+        return
+    call.failed = True
+    if blocked:
+        API_WAF_BLOCKS.inc(method=call.method)
+
+
+class RecordingTracker:
+    """Feeds active_recordings and recorded_bytes_total from live recorders."""
+
+    def __init__(self):
+        self._active: Dict[int, Tuple[str, object]] = {}
+        self._finished_bytes: Dict[str, int] = {}
+
+    def started(self, user: str, recorder) -> None:
+        self._active[id(recorder)] = (user, recorder)
+
+    def finished(self, user: str, recorder) -> None:
+        if self._active.pop(id(recorder), None) is None:
+            return
+        self._finished_bytes[user] = (
+            self._finished_bytes.get(user, 0) + recorder.bytes_written
+        )
+
+    def snapshot(self) -> Dict[str, Tuple[bool, int]]:
+        """Per user: whether a recording is active, and total bytes written."""
+        # list() copies in one step, so other threads may call this too
+        totals = {
+            user: (False, size) for user, size in list(self._finished_bytes.items())
+        }
+        for user, recorder in list(self._active.values()):
+            _, size = totals.get(user, (False, 0))
+            totals[user] = (True, size + recorder.bytes_written)
+        return totals
+
+    def collect(self) -> None:
+        totals = dict(self._finished_bytes)
+        for user, recorder in self._active.values():
+            totals[user] = totals.get(user, 0) + recorder.bytes_written
+        for user, total in totals.items():
+            RECORDED_BYTES.set_total(total, user=user)
+        ACTIVE_RECORDINGS.set(len(self._active))
+
+
+recordings = RecordingTracker()
+REGISTRY.add_collector(recordings.collect)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Measure how late the loop wakes up from a sleep of known length."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+
+async def _handle_scrape(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Headers are not needed; read them so the client sees a clean close
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (
+            b"\r\n",
+            b"\n",
+            b"",
+        ):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if (
+            len(parts) >= 2
+            and parts[0] == "GET"
+            and parts[1].split("?")[0]
+            in (
+                "/metrics",
+                "/",
+            )
+        ):
+            status = "200 OK"
+            body = REGISTRY.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            status = "404 Not Found"
+            body = b"Not Found\n"
+            content_type = "text/plain"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode(
+                "latin-1"
+            )
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.AbstractServer:
+    server = await asyncio.start_server(_handle_scrape, host, port)
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,267 @@
+"""
+Opt-in timing of hot code paths and on-demand profiling of a running process.
+
+Sections are timed with ``profiled`` (a decorator) or ``profile_section`` (a
+context manager). Both cost a single flag check until ``enable_profiling``
+is called. Only synchronous sections show how long the event loop is
+blocked; for coroutines the time includes everything they awaited.
+
+On Unix, ``install_profiler_signals`` adds two triggers that work whether
+or not timing is enabled:
+
+- SIGUSR1 writes a snapshot of every asyncio task and the section table.
+- SIGUSR2 samples the event loop thread and writes collapsed stacks
+  (flamegraph.pl / speedscope input). Long C calls that hold the GIL
+  (regex searches, JSON parsing) are under-sampled; time them with a
+  section instead.
+"""
+
+import asyncio
+import functools
+import signal
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.logger_manager import logger
+from utils.metrics import REGISTRY
+
+_enabled = False
+_NULL_SECTION = nullcontext()
+
+
+class SectionStats:
+    __slots__ = ("calls", "total", "max")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float) -> None:
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+
+_sections: Dict[str, SectionStats] = {}
+
+
+def enable_profiling(enabled: bool = True) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def profiling_enabled() -> bool:
+    return _enabled
+
+
+def _record(name: str, elapsed: float) -> None:
+    stats = _sections.get(name)
+    if stats is None:
+        stats = _sections[name] = SectionStats()
+    stats.add(elapsed)
+
+
+class _Section:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def profile_section(name: str):
+    """Time the body of a ``with`` block under ``name`` (when enabled)."""
+    if not _enabled:
+        return _NULL_SECTION
+    return _Section(name)
+
+
+def profiled(name: Optional[str] = None):
+    """Decorator timing every call of a function or coroutine function."""
+
+    def decorator(func):
+        section = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _record(section, time.perf_counter() - started)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(section, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def section_report(limit: Optional[int] = None) -> str:
+    """The timed sections as a table, most total time first."""
+    rows = sorted(_sections.items(), key=lambda item: item[1].total, reverse=True)
+    lines = [
+        f"{'section':<48} {'calls':>9} {'total s':>10} {'avg ms':>9} {'max ms':>9}"
+    ]
+    for name, stats in rows[:limit]:
+        lines.append(
+            f"{name:<48} {stats.calls:>9} {stats.total:>10.3f} "
+            f"{stats.total / stats.calls * 1000:>9.3f} {stats.max * 1000:>9.3f}"
+        )
+    return "\n".join(lines)
+
+
+PROFILE_CALLS = REGISTRY.counter(
+    "profile_section_calls_total", "Calls of profiled code sections", ["section"]
+)
+PROFILE_SECONDS = REGISTRY.counter(
+    "profile_section_seconds_total",
+    "Time spent in profiled code sections",
+    ["section"],
+)
+
+
+def _collect() -> None:
+    for name, stats in _sections.items():
+        PROFILE_CALLS.set_total(stats.calls, section=name)
+        PROFILE_SECONDS.set_total(stats.total, section=name)
+
+
+REGISTRY.add_collector(_collect)
+
+
+def task_snapshot(loop: Optional[asyncio.AbstractEventLoop] = None) -> str:
+    """Every pending asyncio task with the stack it is suspended in."""
+    tasks = sorted(asyncio.all_tasks(loop), key=lambda task: task.get_name())
+    lines = [f"{len(tasks)} tasks"]
+    for task in tasks:
+        coro = task.get_coro()
+        lines.append("")
+        lines.append(f"{task.get_name()}: {getattr(coro, '__qualname__', coro)}")
+        for frame in task.get_stack(limit=20):
+            code = frame.f_code
+            lines.append(f"  {code.co_filename}:{frame.f_lineno} in {code.co_name}")
+    return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread from a background thread, so the
+    profiled code runs unmodified. Stacks are kept in collapsed form
+    (``outer;inner count``).
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.interval = interval
+        self.samples: StackCounter = StackCounter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write_collapsed(self, path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+def _timestamp() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def dump_snapshot(directory: Path) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"tasks-{_timestamp()}.txt"
+    sections = section_report() if _enabled else "section timing is disabled"
+    path.write_text(f"{task_snapshot()}\n\n{sections}\n", encoding="utf-8")
+    logger.info(f"Wrote task snapshot to {path}")
+    return path
+
+
+async def sample_for(directory: Path, duration: float) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"profile-{_timestamp()}.collapsed"
+    profiler = SamplingProfiler(threading.get_ident())
+    logger.info(f"Sampling the event loop for {duration:.0f}s")
+    profiler.start()
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        profiler.stop()
+    profiler.write_collapsed(path)
+    logger.info(f"Wrote {sum(profiler.samples.values())} samples to {path}")
+    return path
+
+
+def install_profiler_signals(directory: Path, sample_duration: float = 30) -> None:
+    """Bind SIGUSR1/SIGUSR2 on the running loop (no-op where unsupported)."""
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    loop = asyncio.get_running_loop()
+    sampling: List[asyncio.Task] = []
+
+    def on_snapshot():
+        try:
+            dump_snapshot(directory)
+        except Exception as e:
+            logger.error(f"Could not write task snapshot: {e}")
+
+    def on_sample():
+        if sampling and not sampling[0].done():
+            logger.info("Sampling profiler is already running")
+            return
+        sampling[:] = [loop.create_task(sample_for(directory, sample_duration))]
+
+    loop.add_signal_handler(signal.SIGUSR1, on_snapshot)
+    loop.add_signal_handler(signal.SIGUSR2, on_sample)